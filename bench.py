@@ -0,0 +1,190 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from lib.packets import *
+from lib.align import *
+from lib.processors import *
+from lib.render import *
+from lib.synth import *
+
+parser = argparse.ArgumentParser(
+        description='time and memory-profile the analysis on synthetic traces')
+parser.add_argument('--sizes', type=float, nargs='+', default=[1e4, 1e5, 1e6],
+        help='numbers of data packets; up to 1e7 is reasonable')
+parser.add_argument('--stage', nargs='+',
+        help='run only these stages (see the output for their names)')
+parser.add_argument('--reference', action='store_true',
+        help='also time the packet by packet plotters and --follow')
+parser.add_argument('--record-limit', type=float, default=1e6,
+        help='skip read_records and the reference plotters above this size')
+parser.add_argument('--no-memory', action='store_true',
+        help='skip the second, tracemalloc instrumented run of each stage')
+parser.add_argument('--output', '-o', default='bench_output.txt',
+        help='file to append JSON lines with the results to')
+parser.add_argument('--baseline',
+        help='earlier output to compare against')
+parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(),
+        'trace_analyzer_bench'), help='where generated traces are kept')
+parser.add_argument('--generate',
+        help='only write the trace for the first size to PREFIXc.csv and '
+             'PREFIXs.csv')
+parser.add_argument('--rtt', type=float, default=0.04)
+parser.add_argument('--loss', type=float, default=0.01)
+parser.add_argument('--reorder', type=float, default=0.0)
+parser.add_argument('--tsval-granularity', type=float, default=0.001)
+parser.add_argument('--isn', type=int, default=0,
+        help='initial sequence number, e.g. 4294000000 to wrap around')
+parser.add_argument('--clock-offset', type=float, default=3.5)
+parser.add_argument('--seed', type=int, default=1)
+args = parser.parse_args()
+
+def synthetic_trace(packets):
+    return SyntheticTrace(packets, rtt=args.rtt, loss=args.loss,
+            reorder=args.reorder, tsval_granularity=args.tsval_granularity,
+            isn=args.isn, clock_offset=args.clock_offset, seed=args.seed)
+
+if args.generate:
+    rows = synthetic_trace(int(args.sizes[0])).write(f'{args.generate}c.csv',
+            f'{args.generate}s.csv')
+    print(f'INFO: Wrote {rows[0]} client and {rows[1]} server rows')
+    sys.exit(0)
+
+def trace_path(packets):
+    # Generated traces are reused between runs with the same parameters.
+    trace = synthetic_trace(packets)
+    name = '-'.join(f'{value}' for value in vars(trace).values())
+    prefix = os.path.join(args.data_dir, name)
+    if not os.path.exists(f'{prefix}s.csv'):
+        os.makedirs(args.data_dir, exist_ok=True)
+        print(f'INFO: Generating {packets} packets in {prefix}[cs].csv')
+        trace.write(f'{prefix}c.csv.tmp', f'{prefix}s.csv.tmp')
+        os.replace(f'{prefix}c.csv.tmp', f'{prefix}c.csv')
+        os.replace(f'{prefix}s.csv.tmp', f'{prefix}s.csv')
+    return f'{prefix}c.csv', f'{prefix}s.csv'
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(func):
+    gc.collect()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    peak = None
+    if not args.no_memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * \
+            (1 if sys.platform == 'darwin' else 1024)
+    return result, dict(wall=wall, cpu=cpu, peak_bytes=peak, max_rss=max_rss)
+
+def stages(packets):
+    # (name, function, size limited) in the order plot.py runs them; later
+    # stages use what earlier ones returned.
+    client_csv, server_csv = trace_path(packets)
+    state = {}
+    yield 'read_records', lambda: sum(1 for filename in (client_csv,
+            server_csv) for _ in read_records(filename)), True
+    def read_tables():
+        state['client'] = read_table(client_csv)
+        state['server'] = read_table(server_csv)
+    yield 'read_table', read_tables, False
+    yield 'read_table_parallel', lambda: (read_table(client_csv, None),
+            read_table(server_csv, None)), False
+    def align():
+        interval = estimate_timestamp_align(state['client'], state['server'])
+        state['align'] = (interval[0] + interval[1]) / 2
+    yield 'align', align, False
+    def merge():
+        state['packets'] = get_packets(state['client'], state['server'],
+                state['align'])
+    yield 'get_packets', merge, False
+    yield 'matcher', lambda: ClientServerMatcher().process(state['packets']), \
+            False
+    def follow():
+        # The Packet object path of --follow: merge, match and run every
+        # packet by packet plotter.
+        merger = PacketMerger()
+        merger.add(0, state['client'])
+        merger.add(1, state['server'])
+        packets = merger.merge(state['align'], flush=True)
+        ClientServerMatcher().process(packets)
+        group = MultiProcessor()
+        make_plotters(list(PLOTTERS), [], engine='reference', group=group)
+        group.process(packets)
+    if args.reference:
+        yield 'follow', follow, True
+    for name, (client_plotter, server_plotter) in PLOTTERS.items():
+        def process_table(client_plotter=client_plotter,
+                server_plotter=server_plotter):
+            client_plotter().process_table(state['packets'])
+            server_plotter().process_table(state['packets'])
+        yield f'plot:{name}', process_table, False
+        if args.reference:
+            def process(client_plotter=client_plotter,
+                    server_plotter=server_plotter):
+                client_plotter().process(state['packets'])
+                server_plotter().process(state['packets'])
+            yield f'plot-reference:{name}', process, True
+
+def load_baseline(filename):
+    baseline = {}
+    with open(filename, 'r') as baseline_file:
+        for line in baseline_file:
+            entry = json.loads(line)
+            baseline[entry['packets'], entry['stage']] = entry
+    return baseline
+
+baseline = load_baseline(args.baseline) if args.baseline else {}
+run = dict(commit=commit(), time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        python=platform.python_version(), numpy=np.__version__,
+        machine=platform.machine(),
+        trace={name: value for name, value in vars(synthetic_trace(0)).items()
+            if name != 'packets'})
+
+print(f"{'packets':>9} {'stage':<22} {'wall s':>9} {'cpu s':>9} "
+        f"{'peak MiB':>9} {'vs base':>8}")
+with open(args.output, 'a') as output:
+    for packets in [int(size) for size in args.sizes]:
+        for stage, func, limited in stages(packets):
+            # Later stages depend on earlier ones, so those always run.
+            selected = not args.stage or stage in args.stage
+            if limited and packets > args.record_limit:
+                continue
+            if not selected:
+                if not limited and not stage.startswith('plot'):
+                    func()
+                continue
+            _, result = measure(func)
+            entry = dict(run, packets=packets, stage=stage, **result)
+            output.write(json.dumps(entry) + '\n')
+            output.flush()
+
+            peak = '-' if result['peak_bytes'] is None else \
+                    f"{result['peak_bytes'] / (1 << 20):.1f}"
+            base = baseline.get((packets, stage))
+            ratio = f"{result['wall'] / base['wall']:.2f}x" \
+                    if base and base['wall'] else '-'
+            print(f"{packets:>9} {stage:<22} {result['wall']:>9.3f} "
+                    f"{result['cpu']:>9.3f} {peak:>9} {ratio:>8}")
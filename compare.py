@@ -0,0 +1,97 @@
+import argparse
+import sys
+from matplotlib import pyplot as plt
+from lib.cache import *
+from lib.trace import *
+from lib.export import *
+from lib.compare import *
+from lib.lod import *
+
+parser = argparse.ArgumentParser(
+        description='overlay one curve of several traces on a shared time '
+                    'axis, with percentile bands across them')
+parser.add_argument('client_csv', nargs='+',
+        help='capture or trace ID; several IDs, ID ranges (100-120) or '
+             'captures')
+parser.add_argument('--plotter', '-p', choices=METRICS, default='rtt')
+parser.add_argument('--curve', '-c', choices=CURVES, default='client')
+parser.add_argument('--server-csv', '-s',
+        help='server capture for client captures given as paths')
+parser.add_argument('--timestamp-align', '-t', type=float)
+parser.add_argument('--trace-dir', default=TRACE_DIR)
+parser.add_argument('--cache-dir')
+parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE >> 20,
+        help='cache size limit in MiB')
+parser.add_argument('--no-cache', action='store_true')
+parser.add_argument('--window', '-w', type=float, default=0.25,
+        help='window in seconds for win-bw')
+parser.add_argument('--normalize', action='store_true',
+        help="time every trace from its first packet instead of by the "
+             "clock of its client capture")
+parser.add_argument('--step', type=float, default=COMPARE_STEP,
+        help='seconds per bin of the percentile bands')
+parser.add_argument('--percentiles', type=float, nargs=3,
+        default=list(COMPARE_PERCENTILES), metavar=('LOW', 'MID', 'HIGH'))
+parser.add_argument('--no-bands', action='store_true')
+parser.add_argument('--no-lines', action='store_true',
+        help='only draw the percentile bands')
+parser.add_argument('--no-lod', action='store_true',
+        help='draw every point instead of a per-pixel min/max subset')
+parser.add_argument('--jobs', '-j', type=int,
+        help='worker processes loading the traces; one per CPU by default')
+parser.add_argument('--output', '-o',
+        help='save the figure to this file (png, svg or pdf) instead of '
+             'showing a window')
+args = parser.parse_args()
+
+if args.step <= 0:
+    parser.error('--step must be positive')
+if args.window <= 0:
+    parser.error('--window must be positive')
+if not all(0 <= p <= 100 for p in args.percentiles):
+    parser.error('--percentiles must be between 0 and 100')
+if sorted(args.percentiles) != args.percentiles:
+    parser.error('--percentiles must be given as LOW <= MID <= HIGH')
+
+runs = load_runs(parse_traces(args.client_csv), args.plotter, args.curve,
+        args.jobs, trace_dir=args.trace_dir, server_csv=args.server_csv,
+        timestamp_align=args.timestamp_align, window=args.window,
+        normalize=args.normalize, cache_dir=args.cache_dir,
+        cache_size=args.cache_size << 20, no_cache=args.no_cache)
+failed = [run for run in runs if run.error is not None]
+for run in failed:
+    print(f'ERROR: {run.trace}: {run.error.splitlines()[-1]}')
+runs = [run for run in runs if run.error is None]
+if not runs:
+    sys.exit(1)
+for run in runs:
+    print(f'INFO: {run.trace}: {len(run.x)} points, timestamp_align '
+            f'{run.timestamp_align}')
+
+if args.output:
+    plt.switch_backend('agg')
+fig, ax = plt.subplots(figsize=(12, 6))
+if not args.no_lines:
+    min_points = float('inf') if args.no_lod else LOD_MIN_POINTS
+    for run in runs:
+        curve = LodCurve(ax, run.x, run.y, min_points)
+        curve.line, = ax.plot(*curve.visible(), linewidth=0.8, alpha=0.7,
+                label=run.trace)
+if not args.no_bands and len(runs) > 1:
+    x, means = bin_runs(runs, args.step)
+    low, mid, high = percentile_bands(means, args.percentiles)
+    p_low, p_mid, p_high = args.percentiles
+    ax.fill_between(x, low, high, color='k', alpha=0.2, linewidth=0,
+            label=f'p{p_low:g}-p{p_high:g} of {args.step:g}s means')
+    ax.plot(x, mid, color='k', linewidth=1.5, label=f'p{p_mid:g}')
+ax.set_xlabel('seconds since the first packet' if args.normalize
+        else 'client capture clock (s)')
+ax.set_ylabel(f'{args.plotter} {args.curve}')
+ax.legend(fontsize='small')
+
+if args.output:
+    fig.savefig(args.output)
+    print(f'INFO: Wrote {args.output}')
+else:
+    plt.show()
+sys.exit(1 if failed else 0)
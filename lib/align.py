@@ -0,0 +1,82 @@
+import numpy as np
+from lib.packets import *
+from lib.instrument import *
+
+def _record_masks(table):
+    # The same split as classify_records: empty segments sent by the first
+    # source are ACKs, non-empty ones sent by the first destination are data.
+    if not len(table):
+        empty = np.zeros(0, dtype=bool)
+        return empty, empty
+    ack = (table.src == table.src[0]) & (table.sport == table.sport[0]) & \
+            (table.len == 0)
+    data = (table.src == table.dst[0]) & (table.sport == table.dport[0]) & \
+            (table.len != 0)
+    return data, ack
+
+def match_records(orig, query):
+    # For every query row, find a row of orig with the same tsval and ack whose
+    # sequence range covers the query's seq (the packet_check_equal rule) in
+    # O(n log n). Returns the matched orig row per query row, or -1.
+    match = np.full(len(query), -1, dtype=np.intp)
+    if not len(orig) or not len(query):
+        return match
+
+    orig_key = (orig.tsval.astype('u8') << 32) | orig.ack
+    query_key = (query.tsval.astype('u8') << 32) | query.ack
+    keys, orig_code = np.unique(orig_key, return_inverse=True)
+    query_code = np.searchsorted(keys, query_key)
+    found = query_code < len(keys)
+    found[found] = keys[query_code[found]] == query_key[found]
+
+    orig_comp = (orig_code.astype('u8') << 32) | orig.seq
+    sorter = np.lexsort((np.arange(len(orig)), orig_comp))
+    orig_comp = orig_comp[sorter]
+    query_comp = (query_code.astype('u8') << 32) | query.seq
+
+    # Within a key, keep the row reaching furthest among those starting at or
+    # before each position; ties go to the earliest row. The key sits above
+    # bit 33 so that the running maximum never crosses into another key.
+    end = orig.seq[sorter].astype('u8') + np.maximum(1, orig.len[sorter])
+    end_comp = (orig_code[sorter].astype('u8') << 33) | end
+    reach = np.maximum.accumulate(end_comp)
+    first = np.ones(len(orig), dtype=bool)
+    first[1:] = end_comp[1:] > reach[:-1]
+    holder = np.maximum.accumulate(np.where(first, np.arange(len(orig)), 0))
+
+    pos = np.searchsorted(orig_comp, query_comp, 'right') - 1
+    found &= pos >= 0
+    pos = holder[np.maximum(pos, 0)]
+    cand = sorter[pos]
+    found &= orig_code[cand] == query_code
+    found &= query.seq.astype('u8') < end[pos]
+    match[found] = cand[found]
+    return match
+
+def estimate_timestamp_align(client, server):
+    with profile_stage('align', len(client) + len(server)):
+        return _estimate_timestamp_align(client, server)
+
+def _estimate_timestamp_align(client, server):
+    client_data, client_ack = _record_masks(client)
+    server_data, server_ack = _record_masks(server)
+
+    # An ACK cannot reach the server before the client sent it.
+    orig = client.select(client_ack)
+    query = server.select(server_ack)
+    match = match_records(orig, query)
+    if profiling():
+        profile_count('align.ack_matched', int((match >= 0).sum()))
+    delta = orig.timestamp[match[match >= 0]] - query.timestamp[match >= 0]
+    delta_min = float(delta.max()) if len(delta) else float('-inf')
+
+    # Data cannot reach the client before the server sent it.
+    orig = server.select(server_data)
+    query = client.select(client_data)
+    match = match_records(orig, query)
+    if profiling():
+        profile_count('align.data_matched', int((match >= 0).sum()))
+    delta = query.timestamp[match >= 0] - orig.timestamp[match[match >= 0]]
+    delta_max = float(delta.min()) if len(delta) else float('+inf')
+
+    return delta_min, delta_max
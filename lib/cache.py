@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from lib.packets import *
+from lib.align import *
+from lib.instrument import *
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', \
+        'trace_analyzer')
+DEFAULT_CACHE_SIZE = 4 << 30
+# Bumped when the tables a capture is parsed into change.
+CACHE_VERSION = 2
+
+class TraceCache:
+    def __init__(self, path=None, max_size=DEFAULT_CACHE_SIZE):
+        self.path = path or os.environ.get('TRACE_ANALYZER_CACHE', \
+                DEFAULT_CACHE_DIR)
+        self.max_size = max_size
+
+    def key(self, filename):
+        # Identify a capture by where it is, its size, its mtime and its
+        # column header, so that a re-export invalidates the entry, and by
+        # the columns and version we parse it into.
+        stat = os.stat(filename)
+        with open(filename, 'rb') as trace_file:
+            header = trace_file.readline(4096)
+        ident = json.dumps([os.path.abspath(filename), stat.st_size, \
+                stat.st_mtime_ns, header.hex(), \
+                [name for name, _ in RECORD_COLUMNS], CACHE_VERSION])
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def load(self, filename, key=None):
+        entry = self.entry_path(key or self.key(filename))
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'r') as meta_file:
+                meta = json.load(meta_file)
+            columns = {name: np.load(os.path.join(entry, f'{name}.npy'), \
+                    mmap_mode='r') for name in meta.pop('columns')}
+            table = PacketTable(columns, **meta)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing, partly written or from an older version
+            return None
+        try:
+            # Recently used, for evict()
+            os.utime(os.path.join(entry, 'meta.json'))
+        except OSError:
+            pass
+        return table
+
+    def store(self, filename, table, key=None):
+        entry = self.entry_path(key or self.key(filename))
+        os.makedirs(self.path, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+        try:
+            for name, col in table.columns.items():
+                np.save(os.path.join(tmp, f'{name}.npy'), \
+                        np.ascontiguousarray(col))
+            np.save(os.path.join(tmp, 'index.npy'), table_index(table))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as meta_file:
+                json.dump(dict(table.meta, columns=list(table.columns), \
+                        source=os.path.abspath(filename)), meta_file)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+
+    def entries(self):
+        if not os.path.isdir(self.path):
+            return []
+        result = []
+        for key in os.listdir(self.path):
+            entry = self.entry_path(key)
+            try:
+                atime = os.stat(os.path.join(entry, 'meta.json')).st_mtime
+                size = sum(os.stat(os.path.join(entry, name)).st_size \
+                        for name in os.listdir(entry))
+            except OSError:
+                continue
+            result.append((atime, size, entry))
+        return result
+
+    def evict(self):
+        # Drop the least recently used entries until the cache fits again.
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def read_index(self, filename, table):
+        # The table_index of a cached table, built for older entries.
+        path = os.path.join(self.entry_path(self.key(filename)), 'index.npy')
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            pass
+        index = table_index(table)
+        try:
+            np.save(path, index)
+        except OSError:
+            pass
+        return index
+
+    def read_alignment(self, client_csv, server_csv, client, server):
+        # The estimate_timestamp_align interval of two cached tables, kept
+        # with the client's entry once computed.
+        path = os.path.join(self.entry_path(self.key(client_csv)), \
+                f'align-{self.key(server_csv)}.json')
+        try:
+            with open(path, 'r') as align_file:
+                return tuple(json.load(align_file))
+        except (OSError, ValueError):
+            pass
+        interval = estimate_timestamp_align(client, server)
+        try:
+            with open(path, 'w') as align_file:
+                json.dump([float(bound) for bound in interval], align_file)
+        except OSError:
+            pass
+        return interval
+
+    def read_table(self, filename, jobs=1):
+        key = self.key(filename)
+        with profile_stage('cache_load') as record:
+            table = self.load(filename, key)
+            record['items'] = len(table) if table is not None else 0
+        profile_count('cache.hit' if table is not None else 'cache.miss')
+        if table is None:
+            table = read_table(filename, jobs)
+            try:
+                self.store(filename, table, key)
+            except OSError as e:
+                print(f'WARNING: Cannot cache {filename}: {e}')
+        return table
@@ -0,0 +1,182 @@
+import json
+import os
+import pickle
+import shutil
+import time
+from lib.packets import *
+from lib.processors import *
+from lib.follow import *
+from lib.export import *
+
+CHUNK_SIZE = 4 << 20
+CHUNK_HORIZON = 10.0
+CHECKPOINT_NAME = 'checkpoint.pickle'
+CHECKPOINT_INTERVAL = 60.0
+
+# Out-of-core processing of captures too large to load at once. The captures
+# are read CHUNK_SIZE bytes at a time and fed through the packet by packet
+# matcher and plotters, whose state carries over from chunk to chunk. The
+# points of each chunk go to disk right away, as the part files
+#   {output}/{metric}-client/part-00000.parquet   (or .arrow, or a directory
+#   {output}/{metric}-server-data/...              of .npy columns)
+#   {output}/{metric}-server-ack/...
+# with the columns of lib.export, and state older than the horizon is dropped
+# after each chunk, so memory stays flat however long the capture is. The
+# whole run is pickled to a checkpoint every so often to resume from.
+
+class ChunkedRun(Follower):
+    def __init__(self, client_file, server_file, output, names=METRICS, \
+            window=0.25, timestamp_align=None, fmt='npy', \
+            chunk_size=CHUNK_SIZE, horizon=CHUNK_HORIZON):
+        group = MultiProcessor()
+        super().__init__(client_file, server_file, group, timestamp_align)
+        self.plotters = {}
+        for name in names:
+            client_plotter, server_plotter = PLOTTERS[name]
+            plotter_args = dict(win=window) if name == 'win-bw' else {}
+            self.plotters[name] = ( \
+                    group.add(client_plotter(state=group.client_state, \
+                    **plotter_args)), \
+                    group.add(server_plotter(state=group.server_state, \
+                    **plotter_args)))
+        self.output = output
+        self.fmt = fmt
+        self.window = window
+        self.chunk_size = chunk_size
+        self.horizon = horizon
+        self.chunk = 0
+        self.time = float('-inf')
+        self.done = False
+
+    def newest(self, side):
+        # Newest timestamp read from a side, on the client clock.
+        table = self.merger.pending[side]
+        if table is not None and len(table):
+            return table.timestamp[-1] + (self.timestamp_align if side else 0)
+        return self.merger.time_max[side]
+
+    def read(self):
+        # Until the alignment is known both captures are read. After that
+        # only the one that is behind, so that the rows waiting for the
+        # other capture stay within about a chunk.
+        sides = range(len(self.tails))
+        if self.timestamp_align is not None:
+            sides = sorted(sides, key=self.newest)
+        for side in sides:
+            if self.read_side(side, self.chunk_size) and \
+                    self.timestamp_align is not None:
+                break
+
+    def tables(self):
+        # The points added since the last call, which are then dropped.
+        tables = {}
+        for name, (client, server) in self.plotters.items():
+            tables[f'{name}-client'] = dict(x=client.curve_x, \
+                    y=client.curve_y, \
+                    packet=[pkt.idx for pkt in client.curve_packets])
+            for curve in ('data', 'ack'):
+                tables[f'{name}-server-{curve}'] = dict( \
+                        x=getattr(server, f'{curve}_curve_x'), \
+                        y=getattr(server, f'{curve}_curve_y'), \
+                        packet=[pkt.idx for pkt in \
+                        getattr(server, f'{curve}_curve_packets')])
+            client.curve_x, client.curve_y, client.curve_packets = [], [], []
+            for curve in ('data', 'ack'):
+                setattr(server, f'{curve}_curve_x', [])
+                setattr(server, f'{curve}_curve_y', [])
+                setattr(server, f'{curve}_curve_packets', [])
+        return {name: dict(x=np.array(columns['x'], dtype='f8'), \
+                y=np.array(columns['y'], dtype='f8'), \
+                packet=np.array(columns['packet'], dtype='i8')) \
+                for name, columns in tables.items()}
+
+    def remove_parts(self):
+        # Parts from an earlier or interrupted run at or after this chunk.
+        for name in self.plotters:
+            for table in (f'{name}-client', f'{name}-server-data', \
+                    f'{name}-server-ack'):
+                path = os.path.join(self.output, table)
+                if not os.path.isdir(path):
+                    continue
+                for entry in os.listdir(path):
+                    if entry.startswith('part-') and \
+                            int(entry[5:].split('.')[0]) >= self.chunk:
+                        entry = os.path.join(path, entry)
+                        if os.path.isdir(entry):
+                            shutil.rmtree(entry)
+                        else:
+                            os.remove(entry)
+
+    def step(self):
+        # Processes one chunk and returns its packets; done is set after
+        # the last one.
+        packets = self.poll()
+        if not self.grown:
+            packets += self.poll(flush=True)
+            self.done = True
+        for name, columns in self.tables().items():
+            if len(columns['x']):
+                write_table(self.output, \
+                        os.path.join(name, f'part-{self.chunk:05d}'), \
+                        columns, self.fmt)
+        # The match links are not part of the output, and without them the
+        # packets kept for matching do not hold on to older ones.
+        for pkt in packets:
+            pkt.pair_pkt = pkt.ack_pkt = pkt.retrans = None
+        if packets:
+            self.time = max(self.time, max(pkt.timestamp for pkt in packets))
+        self.matcher.prune(self.time - self.horizon)
+        self.processor.prune(self.time - self.horizon)
+        self.chunk += 1
+        return packets
+
+    def write_meta(self):
+        tables = [f'{name}-{curve}' for name in self.plotters \
+                for curve in ('client', 'server-data', 'server-ack')]
+        with open(os.path.join(self.output, 'meta.json'), 'w') as meta_file:
+            json.dump(dict(format=self.fmt, tables=tables, \
+                    chunks=self.chunk, packets=self.merger.count, \
+                    complete=self.done, \
+                    client_csv=self.tails[0].filename, \
+                    server_csv=self.tails[1].filename \
+                    if len(self.tails) > 1 else None, \
+                    timestamp_align=self.timestamp_align, \
+                    interval=None if self.interval is None \
+                    else [float(x) for x in self.interval], \
+                    tsbase=self.merger.tsbase, window=self.window, \
+                    horizon=self.horizon, history=self.history_stats()), \
+                    meta_file)
+
+    def save(self, checkpoint):
+        tmp = checkpoint + '.tmp'
+        with open(tmp, 'wb') as checkpoint_file:
+            pickle.dump(self, checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, checkpoint)
+
+    def run(self, checkpoint=None, progress=None, \
+            interval=CHECKPOINT_INTERVAL):
+        # Processes the remaining chunks, saving a checkpoint after the
+        # first chunk that ends interval seconds after the last checkpoint
+        # and after the last chunk, and calling progress(self, packets) after
+        # each chunk if given.
+        os.makedirs(self.output, exist_ok=True)
+        self.remove_parts()
+        saved = time.monotonic()
+        while not self.done:
+            packets = self.step()
+            if checkpoint is not None and (self.done or \
+                    time.monotonic() - saved >= interval):
+                self.write_meta()
+                self.save(checkpoint)
+                saved = time.monotonic()
+            if progress is not None:
+                progress(self, packets)
+        if checkpoint is None:
+            self.write_meta()
+
+def load_checkpoint(checkpoint):
+    with open(checkpoint, 'rb') as checkpoint_file:
+        run = pickle.load(checkpoint_file)
+    if not isinstance(run, ChunkedRun):
+        raise ValueError(f"{checkpoint} is not a chunked run checkpoint.")
+    return run
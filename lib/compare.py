@@ -0,0 +1,90 @@
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from lib.cache import *
+from lib.trace import *
+from lib.export import *
+
+COMPARE_PERCENTILES = (10, 50, 90, )
+COMPARE_STEP = 0.1
+# Metrics whose curves mark a sample that could not be taken with -1.
+SAMPLED_METRICS = ('rtt', 'bw', )
+
+class CompareRun:
+    # One curve of one trace, with the missing samples left out.
+    def __init__(self, trace, x=None, y=None, timestamp_align=None, \
+            error=None):
+        self.trace = trace
+        self.x = x
+        self.y = y
+        self.timestamp_align = timestamp_align
+        self.error = error
+
+def load_run(trace, metric, curve, trace_dir=TRACE_DIR, server_csv=None, \
+        timestamp_align=None, window=0.25, normalize=False, cache_dir=None, \
+        cache_size=DEFAULT_CACHE_SIZE, no_cache=False):
+    client_csv, server_csv = trace_files(trace, trace_dir, server_csv)
+    cache = None if no_cache else TraceCache(cache_dir, cache_size)
+    result = Trace(client_csv, server_csv, timestamp_align, cache)
+    table = metric_tables(result.packets, metric, window)[curve]
+    x = np.asarray(table['x'], dtype='f8')
+    y = np.asarray(table['y'], dtype='f8')
+    keep = np.isfinite(y)
+    if metric in SAMPLED_METRICS:
+        keep &= y >= 0
+    x, y = x[keep], y[keep]
+    if normalize and len(result.packets):
+        # Seconds since the first packet of the flow.
+        x -= result.packets.timestamp[0]
+    elif len(result.packets):
+        # Packet times count from the first client row; put them back on
+        # the client capture clock.
+        x += result.packets.meta['tsbase']
+    return CompareRun(trace, x, y, result.timestamp_align)
+
+def _load_job(trace, metric, curve, options):
+    try:
+        return load_run(trace, metric, curve, **options)
+    except Exception:
+        return CompareRun(trace, error=traceback.format_exc())
+
+def load_runs(traces, metric, curve, jobs=None, **options):
+    # Loads and matches the traces on a process pool; the runs come back in
+    # the order of traces, failed ones with error set.
+    if jobs == 1 or len(traces) < 2:
+        return [_load_job(trace, metric, curve, options) for trace in traces]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_load_job, trace, metric, curve, \
+                options) for trace in traces]
+        return [future.result() for future in futures]
+
+def bin_runs(runs, step=COMPARE_STEP):
+    # The mean of every run over the bins of step seconds of a shared time
+    # axis, as a (runs, bins) array with NaN where a run has no point, and
+    # the bin centers.
+    runs = [run for run in runs if len(run.x)]
+    if not runs:
+        return np.zeros(0), np.zeros((0, 0))
+    start = min(run.x.min() for run in runs)
+    stop = max(run.x.max() for run in runs)
+    bins = int((stop - start) // step) + 1
+    sums = np.zeros((len(runs), bins))
+    counts = np.zeros((len(runs), bins))
+    for i, run in enumerate(runs):
+        index = ((run.x - start) // step).astype('i8')
+        sums[i] = np.bincount(index, run.y, bins)
+        counts[i] = np.bincount(index, minlength=bins)
+    with np.errstate(invalid='ignore'):
+        means = sums / counts
+    return start + (np.arange(bins) + 0.5) * step, means
+
+def percentile_bands(means, percentiles=COMPARE_PERCENTILES):
+    # Percentiles across the runs of each bin, one row per percentile; NaN
+    # for bins no run has a point in.
+    if not means.size:
+        return np.zeros((len(percentiles), means.shape[1]))
+    with warnings.catch_warnings():
+        # All-NaN bins
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(means, percentiles, axis=0)
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from lib.packets import *
+from lib.metrics import *
+
+EXPORT_FORMATS = ('npy', 'arrow', 'parquet', )
+EXPORT_EXTENSIONS = {'arrow': '.arrow', 'parquet': '.parquet', }
+CURVES = ('client', 'server-data', 'server-ack', )
+
+# An export is a directory with meta.json and one table per file (Arrow IPC
+# or Parquet) or per subdirectory of column .npy files, like a cache entry:
+#   packets           PACKET_COLUMNS plus the matcher links, which are row
+#                     indices into packets with -1 for none
+#   {metric}-client   x, y and packet, the row of the packet of each point,
+#   {metric}-server-data
+#   {metric}-server-ack
+# Columns are the arrays the analysis computed, handed over as they are.
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Arrow and Parquet export needs pyarrow.") \
+                from None
+    return pyarrow
+
+def check_export_format(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt}.")
+    if fmt != 'npy':
+        _pyarrow()
+
+def metric_tables(packets, metric, window=0.25):
+    # The curves of one metric by their names in CURVES.
+    client = client_series(packets, metric, win=window)
+    tables = {'client': dict(x=client['curve_x'], y=client['curve_y'], \
+            packet=client['curve_idx'])}
+    server = server_series(packets, metric, win=window)
+    for curve in ('data', 'ack'):
+        tables[f'server-{curve}'] = dict(x=server[f'{curve}_curve_x'], \
+                y=server[f'{curve}_curve_y'], \
+                packet=server[f'{curve}_curve_idx'])
+    return tables
+
+def export_tables(packets, metrics=METRICS, window=0.25):
+    columns = [name for name, _ in PACKET_COLUMNS] + list(PACKET_LINKS)
+    tables = {'packets': {name: packets.columns[name] for name in columns}}
+    for metric in metrics:
+        for curve, table in metric_tables(packets, metric, window).items():
+            tables[f'{metric}-{curve}'] = table
+    return tables
+
+def write_table(path, name, columns, fmt):
+    if fmt == 'npy':
+        os.makedirs(os.path.join(path, name))
+        for column, values in columns.items():
+            np.save(os.path.join(path, name, f'{column}.npy'), values)
+        return
+    pa = _pyarrow()
+    # Numeric arrays without nulls become Arrow arrays without a copy.
+    table = pa.table({column: pa.array(np.ascontiguousarray(values)) \
+            for column, values in columns.items()})
+    filename = os.path.join(path, name + EXPORT_EXTENSIONS[fmt])
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    if fmt == 'parquet':
+        pa.parquet.write_table(table, filename)
+    else:
+        with pa.OSFile(filename, 'wb') as sink, \
+                pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def write_export(path, tables, fmt='npy', **meta):
+    # Written next to path first and moved into place, so an interrupted
+    # run never leaves a partial export behind.
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        for name, columns in tables.items():
+            write_table(tmp, name, columns, fmt)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as meta_file:
+            json.dump(dict(meta, format=fmt, tables=list(tables)), \
+                    meta_file)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
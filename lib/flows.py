@@ -0,0 +1,182 @@
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from lib.packets import *
+from lib.align import *
+from lib.trace import *
+from lib.instrument import *
+
+PROTOCOLS = {IPPROTO_TCP: 'tcp', IPPROTO_UDP: 'udp', }
+
+class Flow:
+    # The rows of one capture that belong to a single 5-tuple, in both
+    # directions. The first row decides which side is the client, as it
+    # does for a single-flow capture.
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+        first = rows[0]
+        addresses = table.meta['addresses']
+        self.proto = int(table.proto[first])
+        self.client = (addresses[table.src[first]], int(table.sport[first]))
+        self.server = (addresses[table.dst[first]], int(table.dport[first]))
+        self.packets = len(rows)
+        self.bytes = int(table.len[rows].sum())
+
+    @property
+    def key(self):
+        return self.proto, self.client, self.server
+
+    def records(self):
+        return self.table.select(self.rows)
+
+    def __str__(self):
+        proto = PROTOCOLS.get(self.proto, str(self.proto))
+        return f'{self.client[0]}:{self.client[1]} -> ' + \
+                f'{self.server[0]}:{self.server[1]} {proto}'
+
+def split_flows(table):
+    # Group the rows of a capture by 5-tuple regardless of direction, in
+    # order of first appearance.
+    if not len(table):
+        return []
+    src = (table.src.astype('u8') << 16) | table.sport
+    dst = (table.dst.astype('u8') << 16) | table.dport
+    low = np.minimum(src, dst)
+    high = np.maximum(src, dst)
+    order = np.lexsort((high, low, table.proto))
+    start = np.zeros(len(order), dtype=bool)
+    start[0] = True
+    for key in (table.proto, low, high):
+        key = key[order]
+        start[1:] |= key[1:] != key[:-1]
+    groups = np.split(order, np.flatnonzero(start)[1:])
+    groups.sort(key=lambda rows: rows[0])
+    return [Flow(table, rows) for rows in groups]
+
+def pair_flows(client_flows, server_flows):
+    # Pair each client side flow with the server side flow of the same
+    # 5-tuple. Captures on both sides of a NAT only agree on the protocol
+    # and the server port, so the rest are paired by those in order of
+    # appearance. Unpaired client flows get None.
+    pairs = {}
+    by_key = {}
+    for flow in server_flows:
+        by_key.setdefault(flow.key, flow)
+    for i, flow in enumerate(client_flows):
+        match = by_key.pop(flow.key, None)
+        if match is not None:
+            pairs[i] = match
+
+    by_port = {}
+    for flow in server_flows:
+        if by_key.get(flow.key) is flow:
+            by_port.setdefault((flow.proto, flow.server[1]), []).append(flow)
+    for i, flow in enumerate(client_flows):
+        candidates = by_port.get((flow.proto, flow.server[1]))
+        if i not in pairs and candidates:
+            pairs[i] = candidates.pop(0)
+
+    return [(flow, pairs.get(i)) for i, flow in enumerate(client_flows)]
+
+def select_flows(pairs, flow=None, top=None):
+    # Flows are numbered from 1 in order of appearance; top picks the ones
+    # that carry the most bytes. Returns (number, pair) tuples.
+    numbered = list(enumerate(pairs, 1))
+    if flow is not None:
+        if not 1 <= flow <= len(numbered):
+            raise ValueError(f"No flow {flow}; the capture has " + \
+                    f"{len(numbered)} flows.")
+        return [numbered[flow - 1]]
+    if top is not None:
+        numbered.sort(key=lambda item: -item[1][0].bytes)
+        return numbered[:top]
+    return numbered
+
+def flow_summary(packets):
+    client_data = packets.type == PACKET_CLIENT_DATA
+    server_data = packets.type == PACKET_SERVER_DATA
+    time = packets.timestamp
+    duration = float(time[-1] - time[0]) if len(time) else 0.0
+    received = int(packets.len[client_data].sum())
+    return dict(packets=len(packets), bytes=received, duration=duration, \
+            throughput=received / duration if duration > 0 else 0.0, \
+            retransmissions=int((packets.retrans[server_data] >= 0).sum()), \
+            unmatched=int((packets.pair_pkt[client_data] < 0).sum()))
+
+def aggregate_summary(results):
+    # Totals over all flows; the duration spans the earliest start to the
+    # latest end of any flow.
+    summaries = [result.summary for result in results \
+            if result.summary is not None]
+    total = {name: sum(summary[name] for summary in summaries) \
+            for name in ('packets', 'bytes', 'retransmissions', 'unmatched')}
+    spans = [(result.packets.meta['tsbase'] + result.packets.timestamp[0], \
+            result.packets.meta['tsbase'] + result.packets.timestamp[-1]) \
+            for result in results \
+            if result.packets is not None and len(result.packets)]
+    duration = float(max(end for _, end in spans) - \
+            min(start for start, _ in spans)) if spans else 0.0
+    total['duration'] = duration
+    total['throughput'] = total['bytes'] / duration if duration > 0 else 0.0
+    total['flows'] = len(results)
+    return total
+
+class FlowResult:
+    def __init__(self, number, name, packets=None, interval=None, \
+            timestamp_align=None, error=None):
+        self.number = number
+        self.name = name
+        self.packets = packets
+        self.interval = interval
+        self.timestamp_align = timestamp_align
+        self.error = error
+        self.summary = flow_summary(packets) if packets is not None else None
+
+def _analyze_job(number, name, client, server, timestamp_align):
+    try:
+        packets, interval, timestamp_align = match_trace(client, server, \
+                timestamp_align)
+    except Exception:
+        return FlowResult(number, name, error=traceback.format_exc())
+    return FlowResult(number, name, packets, interval, timestamp_align)
+
+def analyze_flows(client, server=None, timestamp_align=None, flow=None, \
+        top=None, jobs=None):
+    # Split both captures into flows, pair them, and match the selected
+    # pairs on a process pool. All flows share one clock offset, estimated
+    # from the pair carrying the most bytes unless it is given.
+    server = server if server is not None else []
+    with profile_stage('split_flows', len(client) + len(server)):
+        pairs = select_flows(pair_flows(split_flows(client), \
+                split_flows(server) if len(server) else []), flow, top)
+    interval = None
+    if timestamp_align is None and len(server):
+        paired = [pair for _, pair in pairs if pair[1] is not None]
+        if paired:
+            client_flow, server_flow = max(paired, \
+                    key=lambda pair: pair[0].bytes)
+            interval = estimate_timestamp_align(client_flow.records(), \
+                    server_flow.records())
+            timestamp_align = (interval[0] + interval[1]) / 2
+
+    jobs_args = [(number, str(client_flow), client_flow.records(), \
+            server_flow.records() if server_flow is not None else [], \
+            timestamp_align) for number, (client_flow, server_flow) in pairs]
+    if jobs == 1 or len(jobs_args) < 2:
+        results = [_analyze_job(*args) for args in jobs_args]
+    else:
+        # Stages run in the workers are not profiled.
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_analyze_job, *zip(*jobs_args)))
+    for result, args in zip(results, jobs_args):
+        if len(args[3]):
+            result.interval = interval
+    return results, aggregate_summary(results)
+
+def format_summary(summary):
+    return f"{summary['packets']} packets, {summary['bytes']} bytes in " + \
+            f"{summary['duration']:.3f}s " + \
+            f"({summary['throughput'] * 8 / 1e6:.3f} Mbit/s), " + \
+            f"{summary['retransmissions']} retransmissions, " + \
+            f"{summary['unmatched']} unmatched"
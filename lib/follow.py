@@ -0,0 +1,76 @@
+import numpy as np
+from lib.packets import *
+from lib.align import *
+from lib.processors import *
+
+def capture_tail(filename):
+    if filename.lower().endswith(PCAP_EXTENSIONS):
+        from lib.pcap import PcapTail
+        return PcapTail(filename)
+    return CsvTail(filename)
+
+class Follower:
+    # Follows a client and optionally a server capture while they are being
+    # written. Every poll() reads what the captures gained, merges it, and
+    # feeds the new packets through one ClientServerMatcher and the given
+    # processor, both of which keep their state, so a poll costs time in
+    # proportion to the new packets only.
+    def __init__(self, client_file, server_file=None, processor=None, \
+            timestamp_align=None):
+        self.tails = [capture_tail(client_file)]
+        if server_file:
+            self.tails.append(capture_tail(server_file))
+        elif timestamp_align is None:
+            timestamp_align = 0
+        self.timestamp_align = timestamp_align
+        self.interval = None
+        self.merger = PacketMerger(len(self.tails))
+        self.matcher = ClientServerMatcher()
+        self.processor = processor
+        # Rows read by the last poll.
+        self.grown = 0
+
+    def align(self, force=False):
+        # Estimated once, from what both captures hold when the interval is
+        # first bounded on both ends; force settles for one bound.
+        if self.timestamp_align is not None:
+            return True
+        if any(table is None for table in self.merger.pending):
+            return False
+        interval = estimate_timestamp_align(*self.merger.pending)
+        finite = np.isfinite(interval)
+        if not finite.all() and not (force and finite.any()):
+            return False
+        self.interval = interval
+        self.timestamp_align = (interval[0] + interval[1]) / 2 \
+                if finite.all() else interval[int(finite[1])]
+        return True
+
+    def read_side(self, side, size=None):
+        table = self.tails[side].read(size)
+        self.grown += len(table)
+        self.merger.add(side, table)
+        return len(table)
+
+    def read(self):
+        for side in range(len(self.tails)):
+            self.read_side(side)
+
+    def poll(self, flush=False):
+        # Returns the new packets, matched and processed. flush merges every
+        # row read so far, for when the captures stopped growing.
+        self.grown = 0
+        self.read()
+        if not self.align(flush):
+            return []
+        packets = self.merger.merge(self.timestamp_align, flush)
+        self.matcher.process(packets)
+        if self.processor is not None:
+            self.processor.process(packets)
+        return packets
+
+    def history_stats(self):
+        stats = self.matcher.history_stats()
+        if self.processor is not None:
+            stats.update(self.processor.history_stats())
+        return stats
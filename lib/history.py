@@ -0,0 +1,103 @@
+import collections
+from lib.int32 import *
+
+# Linux never waits longer than TCP_RTO_MAX (120 s) to retransmit, and a
+# peer echoes a tsval until it sees a newer one, so a lookup of an entry
+# replaced longer ago than that finds nothing a trace could still need.
+HISTORY_HORIZON = 120.0
+# Keys are compared modulo 2**32; one further behind than this could be
+# taken for a key after the next wrap.
+HISTORY_MAX_AGE = 1 << 30
+
+class HistoryStore(collections.OrderedDict):
+    # Per tsval (or seq) state of the packet by packet processors, replacing
+    # a plain dict that grows with every key. Lookups are those of a dict;
+    # callers count the ones that found nothing in misses. Entries are kept
+    # in the order they were last put, which as packets come in time order
+    # is the order of their times, so old ones are dropped from the front:
+    # those followed by a newer one more than horizon seconds before the
+    # newest one, and with max_age those whose key is more than max_age
+    # behind the newest key, modulo 2**32. The entry put last is kept
+    # however long the trace stays idle. The front is only looked at once
+    # it can have expired by either; the time of a value is its time_attr.
+    def __init__(self, horizon=HISTORY_HORIZON, max_age=None, \
+            time_attr='time'):
+        super().__init__()
+        self.horizon = horizon
+        self.max_age = max_age
+        self.time_attr = time_attr
+        self.newest_time = float('-inf')
+        self.expires = float('-inf')
+        self.newest_key = None
+        # Newest key at which the front expires by max_age, None if unknown
+        self.key_expires = None
+        self.misses = self.evicted = self.peak = 0
+
+    def put(self, key, value, time):
+        # Also for a value that was changed in place, which makes it new.
+        if key in self:
+            self.move_to_end(key)
+        self[key] = value
+        expired = False
+        if time > self.newest_time:
+            self.newest_time = time
+            expired = time > self.expires
+        if self.max_age is not None and key != self.newest_key and \
+                (self.newest_key is None or after(key, self.newest_key)):
+            self.newest_key = key
+            expired = expired or self.key_expires is None or \
+                    after(key, self.key_expires)
+        if expired:
+            self.prune(self.newest_time - self.horizon)
+
+    def prune(self, before):
+        # Drops the entries followed by a newer one before before, and those
+        # too far behind the newest key.
+        self.peak = max(self.peak, len(self))
+        self.expires = float('-inf')
+        self.key_expires = None
+        while len(self) > 1:
+            keys = iter(self)
+            key = next(keys)
+            time = getattr(self[next(keys)], self.time_attr)
+            if time >= before and (self.max_age is None or \
+                    minus(self.newest_key, key) <= self.max_age):
+                self.expires = time + self.horizon
+                if self.max_age is not None:
+                    self.key_expires = (key + self.max_age) & 0xffffffff
+                break
+            del self[key]
+            self.evicted += 1
+
+    def stats(self):
+        return dict(entries=len(self), peak=max(self.peak, len(self)), \
+                misses=self.misses, evicted=self.evicted)
+
+class ClientHistory:
+    # ClientState when the client acked with a tsval for the first time.
+    __slots__ = ('time', 'snd_nxt', 'rcv_nxt', 'bytes_received')
+
+    def __init__(self, time, snd_nxt, rcv_nxt, bytes_received):
+        self.time = time
+        self.snd_nxt = snd_nxt
+        self.rcv_nxt = rcv_nxt
+        self.bytes_received = bytes_received
+
+class ServerHistory:
+    # ServerState when the server sent a tsval for the first time.
+    __slots__ = ('time', 'snd_nxt', 'snd_una', 'delivered', 'bytes_acked')
+
+    def __init__(self, time, snd_nxt, snd_una, delivered, bytes_acked):
+        self.time = time
+        self.snd_nxt = snd_nxt
+        self.snd_una = snd_una
+        self.delivered = delivered
+        self.bytes_acked = bytes_acked
+
+class AckBucket:
+    # Client acks sharing one tsval, the first one for each ack.
+    __slots__ = ('time', 'by_ack')
+
+    def __init__(self):
+        self.time = float('-inf')
+        self.by_ack = {}
@@ -0,0 +1,149 @@
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+# Stage timings and event counters for --profile. Everything here is a
+# no-op until enable_profiling() is called: profile_stage() hands out a
+# shared null context and profile_count() returns at once. Callers that
+# would have to do work just to produce a count check profiling() first.
+
+_profiler = None
+_null_stage = contextlib.nullcontext({})
+
+def _max_rss():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * \
+            (1 if sys.platform == 'darwin' else 1024)
+
+class Profiler:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        self.counters = {}
+        self.stack = []
+        self.origin = time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def close(self):
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        record = dict(name=name, items=items, depth=len(self.stack), \
+                thread=threading.get_ident())
+        frame = dict(peak=0)
+        if self.memory:
+            frame['base'] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.stack.append(frame)
+        start = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record['start'] = start - self.origin
+            record['wall'] = time.perf_counter() - start
+            record['cpu'] = time.process_time() - cpu
+            record['max_rss'] = _max_rss()
+            self.stack.pop()
+            if self.memory:
+                # Peaks of nested stages are folded into their parent, as
+                # reset_peak() above forgets them.
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = peak - frame['base']
+                if self.stack:
+                    self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+            self.records.append(record)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def totals(self):
+        # Records merged by stage name, in order of first appearance.
+        totals = {}
+        for record in sorted(self.records, key=lambda r: r['start']):
+            total = totals.setdefault(record['name'], dict(calls=0, wall=0.0, \
+                    cpu=0.0, items=None, peak_bytes=None, max_rss=0, \
+                    depth=record['depth']))
+            total['calls'] += 1
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            total['max_rss'] = max(total['max_rss'], record['max_rss'])
+            if record['items'] is not None:
+                total['items'] = (total['items'] or 0) + record['items']
+            if record.get('peak_bytes') is not None:
+                total['peak_bytes'] = max(total['peak_bytes'] or 0, \
+                        record['peak_bytes'])
+        return totals
+
+    def summary(self):
+        lines = [f"{'stage':<28} {'calls':>5} {'wall s':>9} {'cpu s':>9} " + \
+                f"{'items':>10} {'peak MiB':>9} {'RSS MiB':>8}"]
+        for name, total in self.totals().items():
+            items = '-' if total['items'] is None else str(total['items'])
+            peak = '-' if total['peak_bytes'] is None else \
+                    f"{total['peak_bytes'] / (1 << 20):.1f}"
+            lines.append(f"{'  ' * total['depth'] + name:<28} " + \
+                    f"{total['calls']:>5} {total['wall']:>9.3f} " + \
+                    f"{total['cpu']:>9.3f} {items:>10} {peak:>9} " + \
+                    f"{total['max_rss'] / (1 << 20):>8.1f}")
+        width = max([28] + [len(name) for name in self.counters])
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<{width}} {value:>16}')
+        return '\n'.join(lines)
+
+    def write(self, filename, fmt='json'):
+        if fmt == 'chrome':
+            # Complete events for chrome://tracing and Perfetto.
+            events = [dict(name=record['name'], ph='X', pid=os.getpid(), \
+                    tid=record['thread'], ts=record['start'] * 1e6, \
+                    dur=record['wall'] * 1e6, args={key: record[key] \
+                    for key in ('items', 'cpu', 'peak_bytes', 'max_rss') \
+                    if record.get(key) is not None}) \
+                    for record in self.records]
+            events += [dict(name=name, ph='C', pid=os.getpid(), ts=0, \
+                    args=dict(value=value)) \
+                    for name, value in self.counters.items()]
+            data = dict(traceEvents=events, displayTimeUnit='ms')
+        else:
+            data = dict(stages=self.totals(), records=self.records, \
+                    counters=self.counters)
+        with open(filename, 'w') as output:
+            json.dump(data, output, indent=1)
+
+def enable_profiling(memory=False):
+    global _profiler
+    _profiler = Profiler(memory)
+    return _profiler
+
+def disable_profiling():
+    global _profiler
+    if _profiler is not None:
+        _profiler.close()
+    _profiler = None
+
+def profiling():
+    return _profiler is not None
+
+def profile_stage(name, items=None):
+    if _profiler is None:
+        return _null_stage
+    return _profiler.stage(name, items)
+
+def profile_count(name, n=1):
+    if _profiler is not None:
+        _profiler.count(name, n)
+
+def profiling_summary():
+    return _profiler.summary() if _profiler is not None else ''
+
+def write_profile(filename, fmt='json'):
+    if _profiler is not None:
+        _profiler.write(filename, fmt)
@@ -1,11 +1,24 @@
-import ctypes
+import numpy as np
+
+# Sequence number arithmetic modulo 2**32, as the kernel does it: minus() is
+# the difference as a signed 32-bit value. The *_array versions work on
+# whole NumPy arrays.
 
 def minus(a, b):
-    val = ctypes.c_int32(a - b).value
-    return val
+    return ((a - b + 0x80000000) & 0xffffffff) - 0x80000000
 
 def after(a, b):
-    return minus(a, b) > 0
+    return 0 < (a - b) & 0xffffffff < 0x80000000
 
 def before(a, b):
     return after(b, a)
+
+def minus_array(a, b):
+    return ((np.asarray(a, dtype='i8') - b + 0x80000000) & 0xffffffff) \
+            - 0x80000000
+
+def after_array(a, b):
+    return minus_array(a, b) > 0
+
+def before_array(a, b):
+    return minus_array(b, a) > 0
@@ -0,0 +1,231 @@
+import numpy as np
+
+# Curves with more points than this are decimated before they are drawn.
+LOD_MIN_POINTS = 20000
+# Pyramid blocks fetched per pixel column before the final min/max reduction.
+LOD_BLOCKS_PER_PIXEL = 2
+
+class GrowingArray:
+    # An array that is appended to in place, doubling its storage when full.
+    def __init__(self, values=(), dtype='f8'):
+        self.data = np.array(values, dtype=dtype)
+        self.size = len(self.data)
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def truncate(self, size):
+        self.size = min(size, self.size)
+
+    def extend(self, values):
+        size = self.size + len(values)
+        if size > len(self.data):
+            data = np.empty(max(size, 2 * len(self.data)), \
+                    dtype=self.data.dtype)
+            data[:self.size] = self.values
+            self.data = data
+        self.data[self.size:size] = values
+        self.size = size
+
+class LodPyramid:
+    # Level k holds, for every block of 2**k consecutive points, the index of
+    # the point with the smallest and with the largest y. NaN never wins.
+    def __init__(self, y):
+        self.low = GrowingArray()
+        self.high = GrowingArray()
+        self.mins = []
+        self.maxs = []
+        self.extend(y)
+
+    @staticmethod
+    def _reduce(idx, key, better):
+        if len(idx) % 2:
+            idx = np.append(idx, idx[-1])
+        left, right = idx[0::2], idx[1::2]
+        return np.where(better(key[right], key[left]), right, left)
+
+    def extend(self, y):
+        # Appends points and recomputes only the blocks they fall in, which
+        # includes the padded last block of every level.
+        y = np.asarray(y, dtype='f8')
+        start = len(self.low)
+        self.low.extend(np.where(np.isnan(y), np.inf, y))
+        self.high.extend(np.where(np.isnan(y), -np.inf, y))
+        if not self.mins:
+            self.mins.append(GrowingArray(dtype='i8'))
+            self.maxs.append(self.mins[0])
+        self.mins[0].extend(np.arange(start, len(self.low)))
+        level = 0
+        while len(self.mins[level]) > 1:
+            if level + 1 == len(self.mins):
+                self.mins.append(GrowingArray(dtype='i8'))
+                self.maxs.append(GrowingArray(dtype='i8'))
+            first = start >> (level + 1)
+            for levels, key, better in ((self.mins, self.low, np.less), \
+                    (self.maxs, self.high, np.greater)):
+                levels[level + 1].truncate(first)
+                levels[level + 1].extend(self._reduce( \
+                        levels[level].values[2 * first:], key.values, \
+                        better))
+            level += 1
+
+    def blocks(self, start, stop, max_blocks):
+        # Min and max indices of the coarsest blocks that still give at least
+        # max_blocks blocks over [start, stop), or None for full detail.
+        level = 0
+        while (stop - start) >> (level + 1) >= max_blocks:
+            level += 1
+        if not level:
+            return None
+        first, last = start >> level, ((stop - 1) >> level) + 1
+        return self.mins[level].values[first:last], \
+                self.maxs[level].values[first:last]
+
+class LodCurve:
+    # A line and/or scatter drawn from a min/max decimated subset of a curve
+    # that is recomputed whenever the x limits change. contains() and
+    # get_offsets() speak in indices of the full curve, like a scatter of
+    # every point would, so the curve can stand in for one.
+    def __init__(self, ax, x, y, min_points=LOD_MIN_POINTS):
+        self.ax = ax
+        self.min_points = min_points
+        self._x = GrowingArray(x)
+        self._y = GrowingArray(y)
+        # Searching needs sorted x; merged traces are sorted up to jitter.
+        self._x_sorted = GrowingArray(np.maximum.accumulate(self._x.values) \
+                if len(self._x) else ())
+        self.pyramid = None
+        self.line = None
+        self.scatter = None
+        self.offsets = None
+        self.hit_index = None
+        self.hit_view = None
+        self._grown()
+        self.indices = self.decimate()
+
+    @property
+    def x(self):
+        return self._x.values
+
+    @property
+    def y(self):
+        return self._y.values
+
+    @property
+    def x_sorted(self):
+        return self._x_sorted.values
+
+    def _grown(self):
+        if self.pyramid is None and len(self._x) > self.min_points:
+            self.pyramid = LodPyramid(self.y)
+            self.ax.callbacks.connect('xlim_changed', \
+                    lambda ax: self.update())
+
+    def extend(self, x, y):
+        # Appends points, e.g. from a capture that is still growing; the
+        # cost is proportional to the new points. Call update() to redraw.
+        x = np.asarray(x, dtype='f8')
+        if not len(x):
+            return
+        last = self.x_sorted[-1:]
+        self._x.extend(x)
+        self._x_sorted.extend(np.maximum.accumulate( \
+                np.concatenate((last, x)))[len(last):])
+        if self.pyramid is not None:
+            self.pyramid.extend(y)
+        self._y.extend(y)
+        self.offsets = None
+        self._grown()
+
+    def decimate(self, xlim=None):
+        if self.pyramid is None:
+            return np.arange(len(self.x))
+        if xlim is None:
+            x0, x1 = self.x_sorted[0], self.x_sorted[-1]
+        else:
+            x0, x1 = xlim
+        width = max(int(self.ax.get_window_extent().width), 1)
+        # One point beyond each edge keeps the line running off the axes.
+        start = max(np.searchsorted(self.x_sorted, x0, 'left') - 1, 0)
+        stop = min(np.searchsorted(self.x_sorted, x1, 'right') + 1, \
+                len(self.x))
+        if start >= stop:
+            return np.zeros(0, dtype=np.intp)
+        blocks = self.pyramid.blocks(start, stop, \
+                width * LOD_BLOCKS_PER_PIXEL)
+        if blocks is None:
+            return np.arange(start, stop)
+
+        # Reduce the blocks to the lowest and highest point per pixel column.
+        candidates = np.concatenate(blocks)
+        span = x1 - x0 if x1 > x0 else 1.0
+        column = np.clip(((self.x[candidates] - x0) / span * width) \
+                .astype('i8'), -1, width)
+        y = self.y[candidates]
+        keep = [[start, stop - 1]]
+        for key in (np.where(np.isnan(y), np.inf, y), \
+                np.where(np.isnan(y), np.inf, -y)):
+            order = np.lexsort((key, column))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = column[order][1:] != column[order][:-1]
+            keep.append(candidates[order][first])
+        return np.unique(np.concatenate(keep))
+
+    def visible(self):
+        return self.x[self.indices], self.y[self.indices]
+
+    def update(self):
+        self.indices = self.decimate(self.ax.get_xlim())
+        self.hit_index = None
+        x, y = self.visible()
+        if self.line is not None:
+            self.line.set_data(x, y)
+        if self.scatter is not None:
+            self.scatter.set_offsets(np.column_stack((x, y)))
+
+    def _hit_index(self):
+        # Drawn points in display coordinates, sorted by x. Valid until the
+        # subset, the view limits or the axes size change.
+        view = (tuple(self.ax.viewLim.bounds), tuple(self.ax.bbox.bounds))
+        if self.hit_index is None or self.hit_view != view:
+            points = self.ax.transData.transform(np.column_stack( \
+                    self.visible()))
+            finite = np.flatnonzero(np.isfinite(points).all(axis=1))
+            order = finite[np.argsort(points[finite, 0], kind='stable')]
+            self.hit_index = (points[order, 0], points[order, 1], \
+                    self.indices[order])
+            self.hit_view = view
+        return self.hit_index
+
+    def contains(self, event):
+        # The nearest drawn point under the marker, found by bisecting on
+        # display x instead of testing every marker.
+        if self.scatter is None or event.x is None:
+            return False, dict(ind=[])
+        sizes = self.scatter.get_sizes()
+        radius = (np.sqrt(sizes.max()) / 2 if len(sizes) else 0) * \
+                self.ax.figure.dpi / 72 + self.scatter.get_pickradius()
+        x, y, indices = self._hit_index()
+        start, stop = np.searchsorted(x, (event.x - radius, \
+                event.x + radius))
+        dist = (x[start:stop] - event.x) ** 2 + (y[start:stop] - event.y) ** 2
+        if not len(dist) or dist.min() > radius ** 2:
+            return False, dict(ind=[])
+        return True, dict(ind=[indices[start + np.argmin(dist)]])
+
+    def get_offsets(self):
+        if self.offsets is None:
+            self.offsets = np.column_stack((self.x, self.y))
+        return self.offsets
+
+def curves_span(curves):
+    # The x range of all points of the curves, None while they are empty.
+    curves = [curve for curve in curves if len(curve.x)]
+    if not curves:
+        return None
+    return min(curve.x_sorted[0] for curve in curves), \
+            max(curve.x_sorted[-1] for curve in curves)
@@ -0,0 +1,225 @@
+import collections
+import numpy as np
+from lib.packets import *
+from lib.int32 import *
+from lib.instrument import *
+
+METRICS = ('rtt', 'bw', 'bif', 'win-bw', )
+
+# Whole-trace versions of the per-packet plotters in lib.processors. Every
+# running variable of a plotter (snd_nxt, rcv_nxt, delivered, ...) becomes an
+# array holding its value after each event of one packet type, and reading a
+# variable at some other packet is a searchsorted over the positions of those
+# events. The plotters stay the reference; both give identical curves.
+
+def _unwrap(values):
+    values = np.asarray(values, dtype='i8')
+    if not len(values):
+        return values
+    steps = np.empty(len(values), dtype='i8')
+    steps[0] = values[0]
+    steps[1:] = minus_array(values[1:], values[:-1])
+    return np.cumsum(steps)
+
+def _running_seq(values):
+    # Value of x after each "if not x or after(v, x): x = v" update.
+    values = np.asarray(values, dtype='i8')
+    result = np.zeros(len(values), dtype='i8')
+    nonzero = np.flatnonzero(values)
+    if len(nonzero):
+        start = nonzero[0]
+        result[start:] = np.maximum.accumulate(_unwrap(values[start:]))
+    return result & 0xffffffff
+
+def _state_at(event_pos, event_values, query_pos, default=0):
+    # Value of a variable updated at event_pos, as seen at query_pos.
+    k = np.searchsorted(event_pos, query_pos, 'right') - 1
+    if not len(event_values):
+        return np.full(len(query_pos), default, dtype=event_values.dtype)
+    return np.where(k >= 0, event_values[np.maximum(k, 0)], default)
+
+def _history_lookup(key_pos, keys, query_pos, query_keys):
+    # Index of the first event with key == query_key that happened before the
+    # query, i.e. what history.get(query_key) returns at that point, or -1.
+    if not len(keys):
+        return np.full(len(query_keys), -1, dtype=np.intp)
+    uniq, first = np.unique(keys, return_index=True)
+    i = np.minimum(np.searchsorted(uniq, query_keys), len(uniq) - 1)
+    hit = (uniq[i] == query_keys) & (key_pos[first[i]] < query_pos)
+    if profiling():
+        profile_count('history.lookups', len(hit))
+        profile_count('history.misses', int(len(hit) - hit.sum()))
+    return np.where(hit, first[i], -1)
+
+class WindowMeasure:
+    def __init__(self, win_size):
+        if win_size <= 0:
+            raise ValueError("The window size must be positive.")
+        self.window = collections.deque()
+        self.sum = 0
+        self.win_size = win_size
+
+    def append(self, time, data):
+        self.window.append((time, data))
+        self.sum += data
+        while self.window[0][0] <= time - self.win_size:
+            self.sum -= self.window.popleft()[1]
+        return self.sum
+
+def window_sums(time, data, win_size):
+    # WindowMeasure.append over whole arrays. win_size may be a sequence, in
+    # which case one row of sums per window size is returned.
+    data = np.asarray(data, dtype='i8')
+    sizes = np.atleast_1d(np.asarray(win_size, dtype='f8'))
+    if not np.all(sizes > 0):
+        raise ValueError("The window size must be positive.")
+    if len(time) < 2 or np.all(time[1:] >= time[:-1]):
+        total = np.concatenate(([0], np.cumsum(data)))
+        left = np.searchsorted(time, time[None, :] - sizes[:, None], 'right')
+        sums = total[None, 1:] - total[left]
+    else:
+        # WindowMeasure only ever drops from the front, which differs from a
+        # search when the timestamps go backwards, so replay it instead.
+        sums = np.empty((len(sizes), len(data)), dtype='i8')
+        time, data = time.tolist(), data.tolist()
+        for row, size in zip(sums, sizes.tolist()):
+            win = WindowMeasure(size)
+            row[:] = [win.append(t, d) for t, d in zip(time, data)]
+    return sums if np.ndim(win_size) else sums[0]
+
+def _window_rates(time, data, win_size):
+    sizes = np.asarray(win_size, dtype='f8')
+    return window_sums(time, data, win_size) / \
+            (sizes[:, None] if sizes.ndim else sizes)
+
+def client_series(packets, metric, win=0.25):
+    time = packets.timestamp
+    cd = np.flatnonzero(packets.type == PACKET_CLIENT_DATA)
+    x = time[cd]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'bif':
+            sd = np.flatnonzero(packets.type == PACKET_SERVER_DATA)
+            snd_nxt = _state_at(sd, _running_seq(packets.end_seq[sd]), cd)
+            rcv_nxt = _running_seq(packets.end_seq[cd])
+            y = np.where((snd_nxt != 0) & (rcv_nxt != 0), \
+                    minus_array(snd_nxt, rcv_nxt), 0)
+        elif metric in ('rtt', 'bw'):
+            ca = np.flatnonzero(packets.type == PACKET_CLIENT_ACK)
+            old = _history_lookup(ca, packets.tsval[ca], cd, \
+                    packets.tsecr[cd])
+            hit = old >= 0
+            old_pos = ca[np.maximum(old, 0)] if len(ca) else cd
+            elapsed = x - time[old_pos]
+            if metric == 'rtt':
+                y = np.where(hit, elapsed, -1)
+            else:
+                received = np.cumsum(packets.len[cd], dtype='i8')
+                old_received = _state_at(cd, received, old_pos)
+                y = np.where(hit, (received - old_received) / elapsed, -1)
+        elif metric == 'win-bw':
+            y = _window_rates(x, packets.len[cd], win)
+        else:
+            raise ValueError(f"Unknown metric {metric}.")
+
+    return dict(curve_x=x, curve_y=y, curve_idx=cd)
+
+def _server_rtt_estimator(rtt, snd_nxt, snd_una):
+    # The srtt/rttvar recurrence of ServerRttPlotter; inherently sequential,
+    # so it runs over the RTT samples only. Returns srtt and rttvar after
+    # every sample.
+    srtt_after = np.zeros(len(rtt))
+    rttvar_after = np.zeros(len(rtt))
+    srtt = rttvar = mdev = mdev_max = rtt_seq = 0
+    for k, (sample, nxt, una) in enumerate(zip(rtt.tolist(), \
+            snd_nxt.tolist(), snd_una.tolist())):
+        if not srtt:
+            srtt = sample
+            mdev = sample / 2
+            rttvar = max(mdev, 0.2)
+            mdev_max = rttvar
+            rtt_seq = nxt
+        else:
+            m = sample - srtt
+            srtt += m / 8
+            if m < 0:
+                m = -m
+                m -= mdev
+                if m > 0:
+                    m /= 8
+            else:
+                m -= mdev
+            mdev += m / 4
+            if mdev > mdev_max:
+                mdev_max = mdev
+                if mdev_max > rttvar:
+                    rttvar = mdev_max
+            if after(una, rtt_seq):
+                if mdev_max < rttvar:
+                    rttvar -= (rttvar - mdev_max) / 4
+                rtt_seq = nxt
+                mdev_max = 0.2
+        srtt_after[k] = srtt
+        rttvar_after[k] = rttvar
+    return srtt_after, rttvar_after
+
+def server_series(packets, metric, win=0.25):
+    time = packets.timestamp
+    sd = np.flatnonzero(packets.type == PACKET_SERVER_DATA)
+    sa = np.flatnonzero(packets.type == PACKET_SERVER_ACK)
+    data_x = time[sd]
+    ack_x = time[sa]
+
+    # ServerPlotter state after each of its own events
+    snd_nxt = _running_seq(packets.end_seq[sd])
+    delivered = np.cumsum(packets.len[sd], dtype='i8')
+    acks = packets.ack[sa].astype('i8')
+    acked = np.maximum.accumulate(_unwrap(acks))
+    snd_una = acked & 0xffffffff
+    # The first ACK counts its whole value against snd_una == 0.
+    bytes_acked = minus_array(acks[:1], 0).sum() + acked - acked[:1].sum()
+    newly_acked = np.diff(acked, prepend=acked[:1])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == 'bif':
+            una = _state_at(sa, snd_una, sd)
+            data_y = np.where((snd_nxt != 0) & (una != 0), \
+                    minus_array(snd_nxt, una), 0)
+            nxt = _state_at(sd, snd_nxt, sa)
+            ack_y = np.where((nxt != 0) & (snd_una != 0), \
+                    minus_array(nxt, snd_una), 0)
+        elif metric in ('rtt', 'bw'):
+            old = _history_lookup(sd, packets.tsval[sd], sa, \
+                    packets.tsecr[sa])
+            hit = old >= 0
+            old_pos = sd[np.maximum(old, 0)] if len(sd) else sa
+            elapsed = ack_x - time[old_pos]
+            if metric == 'rtt':
+                ack_y = np.where(hit, elapsed, -1)
+                hits = np.flatnonzero(hit)
+                srtt, rttvar = _server_rtt_estimator(elapsed[hits], \
+                        _state_at(sd, snd_nxt, sa[hits]), snd_una[hits])
+                srtt = _state_at(sa[hits], srtt, sd)
+                rttvar = _state_at(sa[hits], rttvar, sd)
+                data_y = np.where(srtt != 0, srtt + rttvar * 4, -1)
+            else:
+                old_acked = _state_at(sa, bytes_acked, old_pos)
+                ack_y = np.where(hit, \
+                        (bytes_acked - old_acked) / elapsed, -1)
+
+                hits = np.flatnonzero(hit)
+                last_tsecr = _state_at(sa[hits], \
+                        _running_seq(packets.tsecr[sa[hits]]), sd)
+                last = _history_lookup(sd, packets.tsval[sd], sd, last_tsecr)
+                valid = (last_tsecr != 0) & (last >= 0)
+                last = np.maximum(last, 0)
+                data_y = np.where(valid, (delivered - delivered[last]) / \
+                        (data_x - data_x[last]), -1)
+        elif metric == 'win-bw':
+            data_y = _window_rates(data_x, packets.len[sd], win)
+            ack_y = _window_rates(ack_x, newly_acked, win)
+        else:
+            raise ValueError(f"Unknown metric {metric}.")
+
+    return dict(data_curve_x=data_x, data_curve_y=data_y, data_curve_idx=sd, \
+            ack_curve_x=ack_x, ack_curve_y=ack_y, ack_curve_idx=sa)
@@ -1,124 +1,629 @@
+import array
 import csv
-import ctypes
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from lib.instrument import *
 
 PACKET_SERVER_DATA = 1
 PACKET_CLIENT_DATA = 2
 PACKET_CLIENT_ACK  = 3
 PACKET_SERVER_ACK  = 4
 
+RECORD_DATA = 0
+RECORD_ACK  = 1
+
+PCAP_EXTENSIONS = ('.pcap', '.pcapng', '.cap', '.ntar', )
+
+# CSV exports at least this large are parsed in parallel when read_table is
+# given more than one job.
+PARALLEL_CSV_SIZE = 16 << 20
+
+# Rows per entry of a table_index.
+INDEX_STRIDE = 1024
+
+RECORD_FLAG_SYN = 1
+RECORD_FLAG_ACK = 2
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# Columns of a single parsed capture, one row per CSV line. proto is 0 and
+# the ports are 0 for exports without port columns.
+RECORD_COLUMNS = (('timestamp', 'f8'), ('no', 'u4'), ('seq', 'u4'),
+                  ('ack', 'u4'), ('len', 'u4'), ('tsval', 'u4'),
+                  ('tsecr', 'u4'), ('flags', 'u1'), ('src', 'u4'),
+                  ('dst', 'u4'), ('sport', 'u2'), ('dport', 'u2'),
+                  ('proto', 'u1'), )
+
+# Columns of the merged client/server packet sequence.
+PACKET_COLUMNS = (('timestamp', 'f8'), ('no', 'u4'), ('seq', 'u4'),
+                  ('ack', 'u4'), ('len', 'u4'), ('tsval', 'u4'),
+                  ('tsecr', 'u4'), ('end_seq', 'u4'), ('type', 'u1'), )
+
+# Per-packet references filled in by the processors, stored as row indices
+# (-1 meaning None) so that a table stays a handful of flat arrays.
+PACKET_LINKS = ('pair_pkt', 'ack_pkt', 'retrans', )
+PACKET_INDICES = ('curve_id', )
+
 class Packet:
-    pass
+    # A single merged packet for the packet by packet processors, with the
+    # fields of PACKET_COLUMNS, its index, and the references and curve
+    # index the processors fill in.
+    __slots__ = tuple(name for name, _ in PACKET_COLUMNS) + ('idx', ) + \
+            PACKET_LINKS + PACKET_INDICES
 
-def get_packets(client_records, server_records, tsdelta):
-    endpoints = ((client_records[0]['_ws.col.Source'], \
-                  client_records[0]['_ws.col.Destination']), \
-                 (server_records[0]['_ws.col.Source'], \
-                  server_records[0]['_ws.col.Destination']) \
-                 if server_records else ('', ''))
-    assert '1' == client_records[0].get('tcp.flags.syn', '1')
-    assert '0' == client_records[0].get('tcp.flags.ack', '0')
-    if server_records:
-        assert '1' == server_records[0].get('tcp.flags.syn', '1')
-        assert '0' == server_records[0].get('tcp.flags.ack', '0')
-
-    tsbase = float(client_records[0]['timestamp'])
-    client_records.append(dict(timestamp='inf'))
-    server_records.append(dict(timestamp='inf'))
-
-    def is_ack_record(record, is_server):
-        if int(record.get('tcp.flags.syn', '0')):
-            return -1
-        client, server = endpoints[bool(is_server)]
-        if record['_ws.col.Source'] == client and \
-                record['_ws.col.Destination'] == server and \
-                not int(record['tcp.len']):
-            return 1
-        if record['_ws.col.Source'] == server and \
-                record['_ws.col.Destination'] == client and \
-                int(record['tcp.len']):
-            return 0
-        return -1
-
-    def fill_packet_info(record, packet, is_server, is_ack):
-        packet.timestamp = float(record['timestamp']) - tsbase
-        if is_server:
-            packet.type = PACKET_SERVER_ACK if is_ack else PACKET_SERVER_DATA
-            packet.timestamp += tsdelta
+    def __init__(self):
+        self.pair_pkt = None
+        self.ack_pkt = None
+        self.retrans = None
+        self.curve_id = None
+
+class PacketTable:
+    def __init__(self, columns, **meta):
+        self.columns = columns
+        self.meta = meta
+        self._rows = {name: memoryview(col) for name, col in columns.items()}
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("The packet index is out of range.")
+        return PacketView(self, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield PacketView(self, idx)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns.values())
+
+    def add_links(self):
+        for name in PACKET_LINKS + PACKET_INDICES:
+            self.columns[name] = np.full(len(self), -1, dtype='i4')
+            self._rows[name] = memoryview(self.columns[name])
+
+    def __getstate__(self):
+        return self.columns, self.meta
+
+    def __setstate__(self, state):
+        self.__init__(state[0], **state[1])
+
+    def select(self, mask):
+        return PacketTable({name: col[mask] \
+                for name, col in self.columns.items()}, **self.meta)
+
+class PacketView:
+    __slots__ = ('table', 'idx')
+
+    def __init__(self, table, idx):
+        self.table = table
+        self.idx = idx
+
+    def __eq__(self, other):
+        return isinstance(other, PacketView) and \
+                self.table is other.table and self.idx == other.idx
+
+    def __hash__(self):
+        return hash((id(self.table), self.idx))
+
+    def __repr__(self):
+        return f'<PacketView {self.idx} of {len(self.table)}>'
+
+class PacketSubset:
+    def __init__(self, table, indices):
+        self.table = table
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return PacketView(self.table, int(self.indices[i]))
+
+    def __iter__(self):
+        for idx in self.indices.tolist():
+            yield PacketView(self.table, idx)
+
+def _column_property(name):
+    def fget(self):
+        return self.table._rows[name][self.idx]
+    return property(fget)
+
+def _index_property(name):
+    def fget(self):
+        return self.table._rows[name][self.idx]
+    def fset(self, value):
+        self.table._rows[name][self.idx] = value
+    return property(fget, fset)
+
+def _link_property(name):
+    def fget(self):
+        idx = self.table._rows[name][self.idx]
+        return None if idx < 0 else PacketView(self.table, idx)
+    def fset(self, pkt):
+        self.table._rows[name][self.idx] = -1 if pkt is None else pkt.idx
+    return property(fget, fset)
+
+for _name, _ in PACKET_COLUMNS:
+    setattr(PacketView, _name, _column_property(_name))
+for _name in PACKET_INDICES:
+    setattr(PacketView, _name, _index_property(_name))
+for _name in PACKET_LINKS:
+    setattr(PacketView, _name, _link_property(_name))
+
+def _rename_titles(titles):
+    if titles.count('timestamp') == 0:
+        titles[titles.index('_ws.col.Time')] = 'timestamp'
+    if titles.count('udp.length') > 0:
+        titles[titles.index('udp.length')] = 'tcp.len'
+    return titles
+
+def _parse_rows(titles, rows, addresses=None):
+    # addresses maps address strings to their codes; passing the same dict
+    # keeps the codes stable over several parts of one capture.
+    def field(name):
+        return titles.index(name) if name in titles else None
+
+    time_i = field('timestamp')
+    int_fields = [field(name) for name in ('_ws.col.No.', 'tcp.seq', \
+            'tcp.ack', 'tcp.len', 'tcp.options.timestamp.tsval', \
+            'tcp.options.timestamp.tsecr')]
+    syn_i = field('tcp.flags.syn')
+    ack_i = field('tcp.flags.ack')
+    src_i = field('_ws.col.Source')
+    dst_i = field('_ws.col.Destination')
+    port_fields = ((field('tcp.srcport'), field('tcp.dstport'), IPPROTO_TCP), \
+            (field('udp.srcport'), field('udp.dstport'), IPPROTO_UDP))
+
+    timestamp = array.array('d')
+    ints = [array.array('I') for _ in int_fields]
+    flags = array.array('B')
+    src = array.array('I')
+    dst = array.array('I')
+    sport = array.array('H')
+    dport = array.array('H')
+    proto = array.array('B')
+    addresses = {} if addresses is None else addresses
+
+    for row in rows:
+        timestamp.append(float(row[time_i]))
+        for col, i in zip(ints, int_fields):
+            val = row[i] if i is not None else ''
+            col.append(int(val) if val else 0)
+        flag = 0
+        if syn_i is not None and row[syn_i] and int(row[syn_i]):
+            flag |= RECORD_FLAG_SYN
+        if ack_i is not None and row[ack_i] and int(row[ack_i]):
+            flag |= RECORD_FLAG_ACK
+        flags.append(flag)
+        src.append(addresses.setdefault(row[src_i], len(addresses)))
+        dst.append(addresses.setdefault(row[dst_i], len(addresses)))
+        for sport_i, dport_i, port_proto in port_fields:
+            if sport_i is not None and row[sport_i]:
+                sport.append(int(row[sport_i]))
+                dport.append(int(row[dport_i]) if dport_i is not None \
+                        and row[dport_i] else 0)
+                proto.append(port_proto)
+                break
         else:
-            packet.type = PACKET_CLIENT_ACK if is_ack else PACKET_CLIENT_DATA
-        packet.no = int(record['_ws.col.No.'])
-        packet.seq = int(record.get('tcp.seq', '0'))
-        packet.ack = int(record.get('tcp.ack', '0'))
-        packet.len = int(record['tcp.len'])
-        packet.tsval = int(record.get('tcp.options.timestamp.tsval', '0'))
-        packet.tsecr = int(record.get('tcp.options.timestamp.tsecr', '0'))
-        packet.end_seq = ctypes.c_uint32(packet.seq + packet.len).value
-        # FIXME: Some fields don't exist in UDP. Maybe a more elegant way
-        #        to deal with them is needed here.
-
-    packets = []
-    i = j = 0
-    while i < len(client_records) - 1 or j < len(server_records) - 1:
-        if float(client_records[i]['timestamp']) <= \
-                float(server_records[j]['timestamp']) + tsdelta:
-            record = client_records[i]
-            is_server = False
-            i += 1
+            sport.append(0)
+            dport.append(0)
+            proto.append(0)
+
+    columns = dict(zip(('timestamp', 'no', 'seq', 'ack', 'len', 'tsval', \
+            'tsecr', 'flags', 'src', 'dst', 'sport', 'dport', 'proto'), \
+            [timestamp] + ints + [flags, src, dst, sport, dport, proto]))
+    columns = {name: np.frombuffer(columns[name], dtype=dtype) \
+            if len(columns[name]) else np.empty(0, dtype=dtype) \
+            for name, dtype in RECORD_COLUMNS}
+    return PacketTable(columns, titles=titles, addresses=list(addresses), \
+            has_syn=syn_i is not None, has_ack=ack_i is not None)
+
+def _csv_ranges(filename, start, parts):
+    # parts byte ranges from start to the end of the file, each ending after
+    # a newline. tshark fields never contain one, quoted or not.
+    with open(filename, 'rb') as csv_file:
+        size = csv_file.seek(0, 2)
+        bounds = [start]
+        for part in range(1, parts):
+            offset = max(start + (size - start) * part // parts, bounds[-1])
+            csv_file.seek(offset)
+            csv_file.readline()
+            bounds.append(min(csv_file.tell(), size))
+        bounds.append(size)
+    return [(begin, end) for begin, end in zip(bounds, bounds[1:]) \
+            if end > begin]
+
+def _parse_csv_range(filename, titles, begin, end):
+    # Runs in a worker. The columns go back through one shared memory block
+    # in RECORD_COLUMNS order, only its name and the row count are pickled.
+    with open(filename, 'rb') as csv_file:
+        csv_file.seek(begin)
+        data = csv_file.read(end - begin)
+    table = _parse_rows(titles, csv.reader(data.decode().splitlines()))
+    block = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+    offset = 0
+    for name, _ in RECORD_COLUMNS:
+        col = table.columns[name]
+        block.buf[offset:offset + col.nbytes] = col.tobytes()
+        offset += col.nbytes
+    block.close()
+    return block.name, len(table), table.meta['addresses']
+
+def _join_csv_ranges(titles, parts):
+    # Concatenates the parts in order. Address codes are given in order of
+    # first appearance over all parts, as _parse_rows does for the file.
+    table = _parse_rows(titles, [])
+    total = sum(rows for _, rows, _ in parts)
+    columns = {name: np.empty(total, dtype=dtype) \
+            for name, dtype in RECORD_COLUMNS}
+    addresses = {}
+    start = 0
+    for name, rows, part_addresses in parts:
+        codes = np.array([addresses.setdefault(address, len(addresses)) \
+                for address in part_addresses], dtype='u4')
+        block = shared_memory.SharedMemory(name)
+        try:
+            offset = 0
+            for column, dtype in RECORD_COLUMNS:
+                values = np.frombuffer(block.buf, dtype=dtype, count=rows, \
+                        offset=offset)
+                if column in ('src', 'dst'):
+                    values = codes[values]
+                columns[column][start:start + rows] = values
+                offset += values.nbytes
+                del values
+        finally:
+            block.close()
+        start += rows
+    return PacketTable(columns, **dict(table.meta, \
+            addresses=list(addresses)))
+
+def read_csv_parallel(filename, jobs=None):
+    # read_table for a CSV export, one byte range per worker process.
+    with open(filename, 'rb') as csv_file:
+        titles = _rename_titles(next(csv.reader( \
+                [csv_file.readline().decode()])))
+        start = csv_file.tell()
+    ranges = _csv_ranges(filename, start, jobs or os.cpu_count() or 1)
+    # Workers share the resource tracker of this process, so the blocks
+    # they create are not unlinked when they exit, but when joined below.
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_parse_csv_range, filename, titles, \
+                begin, end) for begin, end in ranges]
+    try:
+        return _join_csv_ranges(titles, [future.result() \
+                for future in futures])
+    finally:
+        for future in futures:
+            if future.exception() is None:
+                block = shared_memory.SharedMemory(future.result()[0])
+                block.close()
+                block.unlink()
+
+def read_table(filename, jobs=1):
+    # jobs > 1, or None for one per CPU, parses large CSV exports in
+    # parallel.
+    with profile_stage('read_table') as record:
+        if filename.lower().endswith(PCAP_EXTENSIONS):
+            from lib.pcap import read_pcap_table
+            table = read_pcap_table(filename)
+        elif jobs != 1 and os.path.getsize(filename) >= PARALLEL_CSV_SIZE:
+            table = read_csv_parallel(filename, jobs)
         else:
-            record = server_records[j]
-            is_server = True
-            j += 1
+            with open(filename, 'r') as csv_file:
+                csv_reader = csv.reader(csv_file)
+                titles = _rename_titles(next(csv_reader))
+                table = _parse_rows(titles, csv_reader)
+        table.meta['source'] = filename
+        record['items'] = len(table)
+    return table
+
+class CsvTail:
+    # Reads the lines appended to a CSV export that is still being written,
+    # e.g. by `tshark -l -T fields -E header=y -E separator=,`. A line is
+    # only read once its newline is there. size limits a read to the lines
+    # within that many bytes.
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+        self.titles = None
+        self.addresses = {}
+
+    def read(self, size=None):
+        with open(self.filename, 'rb') as csv_file:
+            csv_file.seek(self.offset)
+            data = csv_file.read(size)
+            while size is not None and b'\n' not in data:
+                # A line longer than size
+                more = csv_file.read(size)
+                if not more:
+                    break
+                data += more
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        rows = csv.reader(data[:end].decode().splitlines())
+        if self.titles is None:
+            titles = next(rows, None)
+            if titles is None:
+                return records_to_table([])
+            self.titles = _rename_titles(titles)
+        table = _parse_rows(self.titles, (row for row in rows if row), \
+                self.addresses)
+        table.meta['source'] = self.filename
+        return table
+
+def records_to_table(records):
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return _parse_rows(['timestamp', '_ws.col.Source', \
+                '_ws.col.Destination'], [])
+    titles = list(first.keys())
+    return _parse_rows(titles, ([record.get(title, '') \
+            for title in titles] for record in itertools.chain((first, ), \
+            records)))
+
+def _record_endpoints(table):
+    # (src, sport, dst, dport) of the first row, the client -> server pair.
+    return int(table.src[0]), int(table.sport[0]), int(table.dst[0]), \
+            int(table.dport[0])
+
+def _record_kinds(table, endpoints=None):
+    # 1 for an ACK sent by the client, 0 for data sent by the server and -1
+    # for anything else, using the first row as the client -> server pair
+    # unless endpoints are given.
+    kinds = np.full(len(table), -1, dtype='i1')
+    if not len(table):
+        return kinds
+    src, sport, dst, dport = endpoints or _record_endpoints(table)
+    client = (table.src == src) & (table.sport == sport)
+    server = (table.src == dst) & (table.sport == dport)
+    to_client = (table.dst == src) & (table.dport == sport)
+    to_server = (table.dst == dst) & (table.dport == dport)
+    usable = (table.flags & RECORD_FLAG_SYN) == 0
+    kinds[usable & client & to_server & (table.len == 0)] = 1
+    kinds[usable & server & to_client & (table.len != 0)] = 0
+    return kinds
+
+def _check_handshake(table):
+    # UDP has no handshake to start with.
+    if not len(table) or table.proto[0] == IPPROTO_UDP:
+        return
+    filename = table.meta.get('source', 'capture')
+    if table.meta['has_syn'] and not table.flags[0] & RECORD_FLAG_SYN or \
+            table.meta['has_ack'] and table.flags[0] & RECORD_FLAG_ACK:
+        raise ValueError(f'{filename}: capture does not start with a SYN')
+
+def _merge_order(client_time, server_time):
+    # Same ordering as walking both captures with two pointers and taking the
+    # client row whenever its timestamp is not later. Comparing running maxima
+    # keeps that result exact even if a capture is not strictly sorted.
+    client_max = np.maximum.accumulate(client_time) \
+            if len(client_time) else client_time
+    server_max = np.maximum.accumulate(server_time) \
+            if len(server_time) else server_time
+    order = np.empty(len(client_time) + len(server_time), dtype=np.intp)
+    order[np.arange(len(client_time)) + \
+            np.searchsorted(server_max, client_max, 'left')] = \
+            np.arange(len(client_time))
+    order[np.arange(len(server_time)) + \
+            np.searchsorted(client_max, server_max, 'right')] = \
+            np.arange(len(server_time)) + len(client_time)
+    return order
+
+def _record_source(row):
+    return row['_ws.col.Source'], \
+            row.get('tcp.srcport') or row.get('udp.srcport', '')
 
-        is_ack = is_ack_record(record, is_server)
-        if is_ack < 0:
-            continue
+def _record_destination(row):
+    return row['_ws.col.Destination'], \
+            row.get('tcp.dstport') or row.get('udp.dstport', '')
 
-        packet = Packet()
-        fill_packet_info(record, packet, is_server, is_ack)
-        packet.idx = len(packets)
-        packets.append(packet)
+def get_packets(client_records, server_records, tsdelta):
+    with profile_stage('get_packets') as record:
+        packets = _get_packets(client_records, server_records, tsdelta)
+        record['items'] = len(packets)
+    return packets
+
+def _get_packets(client_records, server_records, tsdelta):
+    client = client_records if isinstance(client_records, PacketTable) \
+            else records_to_table(client_records)
+    server = server_records if isinstance(server_records, PacketTable) \
+            else records_to_table(server_records)
+    _check_handshake(client)
+    _check_handshake(server)
 
+    tsbase = client.timestamp[0]
+    columns = _merge_columns(client, server, tsdelta, tsbase, \
+            _record_kinds(client), _record_kinds(server), \
+            _merge_order(client.timestamp, server.timestamp + tsdelta))
+    packets = PacketTable({name: columns[name] \
+            for name, _ in PACKET_COLUMNS}, tsbase=tsbase, tsdelta=tsdelta)
+    packets.add_links()
     return packets
 
+def _merge_columns(client, server, tsdelta, tsbase, client_kinds, \
+        server_kinds, order):
+    # PACKET_COLUMNS of the client and server rows taken in the given merge
+    # order, leaving out rows of other kinds.
+    kinds = np.concatenate((client_kinds, server_kinds))[order]
+    order = order[kinds >= 0]
+    is_server = order >= len(client)
+    is_ack = kinds[kinds >= 0] == 1
+
+    columns = {}
+    for name in ('no', 'seq', 'ack', 'len', 'tsval', 'tsecr'):
+        columns[name] = np.concatenate((client.columns[name], \
+                server.columns[name]))[order]
+    timestamp = np.concatenate((client.timestamp, server.timestamp))[order]
+    timestamp -= tsbase
+    timestamp[is_server] += tsdelta
+    columns['timestamp'] = timestamp
+    # FIXME: Some fields don't exist in UDP. Maybe a more elegant way
+    #        to deal with them is needed here.
+    columns['end_seq'] = columns['seq'] + columns['len']
+    columns['type'] = np.where(is_server, \
+            np.where(is_ack, PACKET_SERVER_ACK, PACKET_SERVER_DATA), \
+            np.where(is_ack, PACKET_CLIENT_ACK, PACKET_CLIENT_DATA)) \
+            .astype('u1')
+    return columns
+
+def _concat_tables(first, second):
+    if first is None or not len(first):
+        return second
+    return PacketTable({name: np.concatenate((col, second.columns[name])) \
+            for name, col in first.columns.items()}, **second.meta)
+
+def table_index(table, stride=INDEX_STRIDE):
+    # Per block of stride rows, the largest timestamp and packet number up
+    # to the end of the block and the smallest from its start on. Both stay
+    # sorted however disordered the rows are, so index_rows can search them.
+    starts = np.arange(0, len(table), stride)
+    index = np.empty((4, len(starts)))
+    if not len(table):
+        return index
+    for row, name in ((0, 'timestamp'), (2, 'no')):
+        values = np.asarray(table.columns[name], dtype='f8')
+        index[row] = np.maximum.accumulate(np.maximum.reduceat(values, \
+                starts))
+        index[row + 1] = np.minimum.accumulate(np.minimum.reduceat(values, \
+                starts)[::-1])[::-1]
+    return index
+
+def index_rows(index, length, column, low, high, stride=INDEX_STRIDE):
+    # Rows [begin, end) holding every row whose column ('timestamp' or 'no')
+    # is within [low, high], and at most a block of others at either end.
+    row = 0 if column == 'timestamp' else 2
+    begin = min(int(np.searchsorted(index[row], low, 'left')) * stride, \
+            length)
+    end = min(int(np.searchsorted(index[row + 1], high, 'right')) * stride, \
+            length)
+    return begin, max(begin, end)
+
+def _running_max(carry, values):
+    return np.maximum.accumulate(np.concatenate(([carry], values)))[1:]
+
+class PacketMerger:
+    # get_packets for captures that arrive in parts. A client row is merged
+    # once the server capture has caught up with it and the other way round,
+    # so the packets come out in the order get_packets gives for the whole
+    # captures, as Packet objects.
+    def __init__(self, sides=2):
+        self.pending = [None] * sides
+        self.endpoints = [None] * sides
+        # Newest timestamp merged so far from each side.
+        self.time_max = [float('-inf')] * sides
+        self.tsbase = None
+        self.count = 0
+
+    def add(self, side, table):
+        if not len(table):
+            return
+        if self.endpoints[side] is None:
+            _check_handshake(table)
+            self.endpoints[side] = _record_endpoints(table)
+        self.pending[side] = _concat_tables(self.pending[side], table)
+        if self.tsbase is None and self.pending[0] is not None:
+            self.tsbase = self.pending[0].timestamp[0]
+
+    def merge(self, tsdelta, flush=False):
+        # flush merges every row added so far, for when the captures stopped
+        # growing.
+        if self.tsbase is None:
+            return []
+        empty = records_to_table([])
+        client, server = [table if table is not None else empty \
+                for table in (self.pending + [None])[:2]]
+        client_max = _running_max(self.time_max[0], client.timestamp)
+        server_max = _running_max(self.time_max[-1], \
+                server.timestamp + tsdelta)
+        if flush or len(self.pending) == 1:
+            client_take, server_take = len(client), len(server)
+        else:
+            # Client rows go first on equal timestamps, as in _merge_order.
+            client_seen = client_max[-1] if len(client) else self.time_max[0]
+            server_seen = server_max[-1] if len(server) \
+                    else self.time_max[-1]
+            client_take = np.searchsorted(client_max, server_seen, 'right')
+            server_take = np.searchsorted(server_max, client_seen, 'left')
+        if client_take:
+            self.time_max[0] = client_max[client_take - 1]
+        if server_take:
+            self.time_max[-1] = server_max[server_take - 1]
+        taken = client.select(slice(0, client_take)), \
+                server.select(slice(0, server_take))
+        self.pending = [client.select(slice(client_take, None)), \
+                server.select(slice(server_take, None))][:len(self.pending)]
+
+        columns = _merge_columns(*taken, tsdelta, self.tsbase, \
+                _record_kinds(taken[0], self.endpoints[0]), \
+                _record_kinds(taken[1], self.endpoints[-1]), \
+                _merge_order(client_max[:client_take], \
+                server_max[:server_take]))
+        packets = []
+        for idx, (timestamp, no, seq, ack, length, tsval, tsecr, end_seq, \
+                kind) in enumerate(zip(*(columns[name].tolist() \
+                for name, _ in PACKET_COLUMNS)), self.count):
+            packet = Packet()
+            packet.timestamp = timestamp
+            packet.no = no
+            packet.seq = seq
+            packet.ack = ack
+            packet.len = length
+            packet.tsval = tsval
+            packet.tsecr = tsecr
+            packet.end_seq = end_seq
+            packet.type = kind
+            packet.idx = idx
+            packets.append(packet)
+        self.count += len(packets)
+        return packets
+
+def iter_records(filename):
+    with open(filename, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        titles = None
+        for row in csv_reader:
+            if titles is None:
+                titles = _rename_titles(row)
+                continue
+            yield dict(zip(titles, row))
+
+def classify_records(records):
+    client = server = None
+    for row in records:
+        if client is None:
+            client = _record_source(row)
+            server = _record_destination(row)
+
+        kind = None
+        source = _record_source(row)
+        if source == client and not int(row['tcp.len']):
+            kind = RECORD_ACK
+        if source == server and int(row['tcp.len']):
+            kind = RECORD_DATA
+        yield row, kind
+
 def read_records(filename):
-    titles = None
-    client_addr = server_addr = None
-
-    data_records = []
-    ack_records = []
-    records = []
-
-    csv_file = open(filename, 'r')
-    csv_reader = csv.reader(csv_file)
-
-    for row in csv_reader:
-        if titles is None:
-            titles = row
-            if titles.count('timestamp') == 0:
-                titles[titles.index('_ws.col.Time')] = 'timestamp'
-            if titles.count('udp.length') > 0:
-                titles[titles.index('udp.length')] = 'tcp.len'
-            continue
-
-        row = dict(zip(titles, row))
-        if client_addr is None:
-            client_addr = row['_ws.col.Source']
-        if server_addr is None:
-            server_addr = row['_ws.col.Destination']
-
-        records.append(row)
-        if row['_ws.col.Source'] == client_addr and \
-                not int(row['tcp.len']):
-            ack_records.append(row)
-        if row['_ws.col.Source'] == server_addr and \
-                int(row['tcp.len']):
-            data_records.append(row)
-
-        if len(records) >= 100000:
-            break
-
-    csv_file.close()
-    return records, data_records, ack_records
+    # The rows of a capture CSV with their kind, one at a time; only the row
+    # being looked at is kept in memory, however long the capture.
+    return classify_records(iter_records(filename))
 
 def packet_check_equal(pkt1, pkt2):
     if pkt1['tcp.ack'] != pkt2['tcp.ack'] or \
@@ -0,0 +1,407 @@
+import array
+import mmap
+import socket
+import struct
+import numpy as np
+from lib.packets import *
+
+# The fields a tshark export provides, filled in from the headers directly.
+PCAP_TITLES = ['_ws.col.No.', 'timestamp', '_ws.col.Source', \
+        '_ws.col.Destination', 'tcp.seq', 'tcp.ack', 'tcp.len', \
+        'tcp.options.timestamp.tsval', 'tcp.options.timestamp.tsecr', \
+        'tcp.flags.syn', 'tcp.flags.ack', 'tcp.srcport', 'tcp.dstport']
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100, )
+
+IPV6_EXTENSIONS = (0, 43, 60, 51, )
+IPV6_FRAGMENT = 44
+
+LINKTYPES = (LINKTYPE_NULL, LINKTYPE_ETHERNET, LINKTYPE_RAW, 12, 14, \
+        LINKTYPE_LOOP, LINKTYPE_LINUX_SLL, LINKTYPE_IPV4, LINKTYPE_IPV6, \
+        LINKTYPE_LINUX_SLL2, )
+
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_ACK = 0x10
+TCP_OPTION_TIMESTAMP = 8
+
+def _network_offset(linktype, data, offset, end):
+    # Returns (ethertype, offset of the network header) or None.
+    if linktype == LINKTYPE_ETHERNET:
+        if end - offset < 14:
+            return None
+        ethertype, = struct.unpack_from('>H', data, offset + 12)
+        offset += 14
+        while ethertype in ETHERTYPE_VLAN and end - offset >= 4:
+            ethertype, = struct.unpack_from('>H', data, offset + 2)
+            offset += 4
+        return ethertype, offset
+    if linktype == LINKTYPE_LINUX_SLL:
+        if end - offset < 16:
+            return None
+        return struct.unpack_from('>H', data, offset + 14)[0], offset + 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if end - offset < 20:
+            return None
+        return struct.unpack_from('>H', data, offset)[0], offset + 20
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        offset += 4
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP, LINKTYPE_RAW, 12, 14, \
+            LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if end - offset < 1:
+            return None
+        version = data[offset] >> 4
+        ethertype = ETHERTYPE_IPV4 if version == 4 else ETHERTYPE_IPV6
+        return ethertype, offset
+    return None
+
+class _TableBuilder:
+    def __init__(self):
+        self.timestamp = array.array('d')
+        self.ints = {name: array.array('I') for name in \
+                ('no', 'seq', 'ack', 'len', 'tsval', 'tsecr', 'src', 'dst')}
+        self.flags = array.array('B')
+        self.sport = array.array('H')
+        self.dport = array.array('H')
+        self.proto = array.array('B')
+        self.addresses = {}
+        # Per-direction initial sequence numbers, for tshark style relative
+        # sequence and acknowledgement numbers.
+        self.isn = {}
+        self.time_base = None
+        self.skipped_linktypes = set()
+        # Reader state, kept here so that a growing file can be read on
+        # from where the last read stopped.
+        self.no = 0
+        self.endian = '<'
+        self.interfaces = []
+
+    def address(self, raw):
+        code = self.addresses.get(raw)
+        if code is None:
+            code = self.addresses[raw] = len(self.addresses)
+        return code
+
+    def add_frame(self, no, nsec, linktype, data, offset, end):
+        if linktype not in LINKTYPES:
+            if linktype not in self.skipped_linktypes:
+                self.skipped_linktypes.add(linktype)
+                print(f'WARNING: Skipping frames of link type {linktype}')
+            return
+        link = _network_offset(linktype, data, offset, end)
+        if link is None:
+            return
+        ethertype, offset = link
+
+        if ethertype == ETHERTYPE_IPV4:
+            if end - offset < 20:
+                return
+            ihl = (data[offset] & 0x0f) * 4
+            total_len, frag, proto = struct.unpack_from('>H2xHxB', data, \
+                    offset + 2)
+            if frag & 0x1fff:
+                return
+            src = bytes(data[offset + 12:offset + 16])
+            dst = bytes(data[offset + 16:offset + 20])
+            # TSO/GRO captures leave total_len 0; the frame has the length
+            if not total_len:
+                total_len = end - offset
+            payload_len = total_len - ihl
+            offset += ihl
+        elif ethertype == ETHERTYPE_IPV6:
+            if end - offset < 40:
+                return
+            payload_len, proto = struct.unpack_from('>HB', data, offset + 4)
+            if not payload_len:
+                # Jumbograms and BIG TCP
+                payload_len = end - offset - 40
+            src = bytes(data[offset + 8:offset + 24])
+            dst = bytes(data[offset + 24:offset + 40])
+            offset += 40
+            while proto in IPV6_EXTENSIONS + (IPV6_FRAGMENT, ):
+                if end - offset < 8:
+                    return
+                if proto == IPV6_FRAGMENT:
+                    if struct.unpack_from('>H', data, offset + 2)[0] & 0xfff8:
+                        return
+                    size = 8
+                elif proto == 51:
+                    size = (data[offset + 1] + 2) * 4
+                else:
+                    size = (data[offset + 1] + 1) * 8
+                proto = data[offset]
+                offset += size
+                payload_len -= size
+        else:
+            return
+
+        tsval = tsecr = seq = ack = flags = 0
+        if proto == IPPROTO_TCP:
+            if end - offset < 20:
+                return
+            sport, dport, seq, ack, off_flags = struct.unpack_from('>HHIIH', \
+                    data, offset)
+            header_len = (off_flags >> 12) * 4
+            tcp_flags = off_flags & 0x3f
+            length = payload_len - header_len
+            i = offset + 20
+            opt_end = min(offset + header_len, end)
+            while i < opt_end:
+                kind = data[i]
+                if kind == 0:
+                    break
+                if kind == 1:
+                    i += 1
+                    continue
+                if i + 1 >= opt_end or data[i + 1] < 2:
+                    break
+                if kind == TCP_OPTION_TIMESTAMP and i + 10 <= opt_end:
+                    tsval, tsecr = struct.unpack_from('>II', data, i + 2)
+                i += data[i + 1]
+
+            if tcp_flags & TCP_FLAG_SYN:
+                flags |= RECORD_FLAG_SYN
+            if tcp_flags & TCP_FLAG_ACK:
+                flags |= RECORD_FLAG_ACK
+            flow = (src, sport, dst, dport)
+            if tcp_flags & TCP_FLAG_SYN or flow not in self.isn:
+                self.isn[flow] = seq
+            seq = (seq - self.isn[flow]) & 0xffffffff
+            peer = self.isn.get((dst, dport, src, sport))
+            if not tcp_flags & TCP_FLAG_ACK:
+                ack = 0
+            elif peer is not None:
+                ack = (ack - peer) & 0xffffffff
+        elif proto == IPPROTO_UDP:
+            if end - offset < 8:
+                return
+            sport, dport, length = struct.unpack_from('>HHH', data, offset)
+        else:
+            return
+
+        # Seconds since the first frame, like tshark's default time column
+        if self.time_base is None:
+            self.time_base = nsec
+        self.timestamp.append((nsec - self.time_base) / 1e9)
+        ints = self.ints
+        ints['no'].append(no)
+        ints['seq'].append(seq)
+        ints['ack'].append(ack)
+        ints['len'].append(max(length, 0))
+        ints['tsval'].append(tsval)
+        ints['tsecr'].append(tsecr)
+        ints['src'].append(self.address(src))
+        ints['dst'].append(self.address(dst))
+        self.flags.append(flags)
+        self.sport.append(sport)
+        self.dport.append(dport)
+        self.proto.append(proto)
+
+    def table(self):
+        columns = dict(self.ints, timestamp=self.timestamp, flags=self.flags, \
+                sport=self.sport, dport=self.dport, proto=self.proto)
+        columns = {name: np.frombuffer(columns[name], dtype=dtype) \
+                if len(columns[name]) else np.empty(0, dtype=dtype) \
+                for name, dtype in RECORD_COLUMNS}
+        addresses = [socket.inet_ntop(socket.AF_INET if len(raw) == 4 \
+                else socket.AF_INET6, raw) for raw in self.addresses]
+        # Only a capture whose first TCP frame is a SYN has the handshake
+        tcp = np.flatnonzero(columns['proto'] == IPPROTO_TCP)
+        handshake = bool(len(tcp)) and \
+                bool(columns['flags'][tcp[0]] & RECORD_FLAG_SYN)
+        return PacketTable(columns, titles=list(PCAP_TITLES), \
+                addresses=addresses, has_syn=handshake, has_ack=handshake)
+
+    def take(self):
+        # The table of the frames added since the last take().
+        table = self.table()
+        for name in self.ints:
+            self.ints[name] = array.array('I')
+        self.timestamp = array.array('d')
+        self.flags = array.array('B')
+        self.sport = array.array('H')
+        self.dport = array.array('H')
+        self.proto = array.array('B')
+        return table
+
+def _read_pcap(data, builder, offset=24, partial=True, stop=None):
+    # Reads the records from offset on and returns where reading stopped.
+    # Without partial, a record that is not completely written yet stops
+    # the reading instead of being cut short. No record starting at or
+    # after stop is read.
+    magic = data[:4]
+    if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+        endian = '<'
+    elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+        endian = '>'
+    else:
+        raise ValueError("Not a pcap file.")
+    scale = 1 if magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d') \
+            else 1000
+    linktype = struct.unpack_from(endian + 'I', data, 20)[0] & 0xffff
+
+    record = struct.Struct(endian + 'IIII')
+    stop = len(data) if stop is None else min(stop, len(data))
+    while offset + 16 <= len(data) and offset < stop:
+        sec, frac, caplen, _ = record.unpack_from(data, offset)
+        if not partial and offset + 16 + caplen > len(data):
+            break
+        offset += 16
+        end = min(offset + caplen, len(data))
+        builder.no += 1
+        builder.add_frame(builder.no, sec * 1000000000 + frac * scale, \
+                linktype, data, offset, end)
+        offset += caplen
+    return offset
+
+def _ticks_to_ns(ticks, resolution):
+    # if_tsresol: a negative power of 10, or of 2 with the high bit set
+    if resolution & 0x80:
+        return (ticks * 1000000000) >> (resolution & 0x7f)
+    if resolution <= 9:
+        return ticks * 10 ** (9 - resolution)
+    return ticks // 10 ** (resolution - 9)
+
+def _read_pcapng(data, builder, offset=0, partial=True, stop=None):
+    interfaces = builder.interfaces
+    stop = len(data) if stop is None else min(stop, len(data))
+    while offset + 12 <= len(data) and offset < stop:
+        endian = builder.endian
+        block_type, = struct.unpack_from(endian + 'I', data, offset)
+        if block_type == 0x0a0d0d0a:
+            bom = data[offset + 8:offset + 12]
+            if len(bom) < 4:
+                break
+            endian = '<' if bom == b'\x4d\x3c\x2b\x1a' else '>'
+        block_len, = struct.unpack_from(endian + 'I', data, offset + 4)
+        if block_len < 12:
+            raise ValueError("Corrupt pcapng block.")
+        if not partial and offset + block_len > len(data):
+            break
+        if block_type == 0x0a0d0d0a:
+            builder.endian = endian
+            interfaces.clear()
+        body = offset + 8
+        block_end = min(offset + block_len - 4, len(data))
+
+        if block_type == 1:
+            linktype, = struct.unpack_from(endian + 'H', data, body)
+            interfaces.append([linktype, 6, 0])
+            # Options: if_tsresol (9) and if_tsoffset (14)
+            i = body + 8
+            while i + 4 <= block_end:
+                code, length = struct.unpack_from(endian + 'HH', data, i)
+                if code == 0:
+                    break
+                if code == 9 and length >= 1:
+                    interfaces[-1][1] = data[i + 4]
+                elif code == 14 and length >= 8:
+                    interfaces[-1][2] = struct.unpack_from(endian + 'q', \
+                            data, i + 4)[0]
+                i += 4 + (length + 3) // 4 * 4
+        elif block_type in (6, 2):
+            builder.no += 1
+            if block_type == 6:
+                iface, ts_high, ts_low, caplen = struct.unpack_from( \
+                        endian + 'IIII', data, body)
+                start = body + 20
+            else:
+                iface, ts_high, ts_low, caplen = struct.unpack_from( \
+                        endian + 'H2xIII', data, body)
+                start = body + 20
+            if iface < len(interfaces):
+                linktype, resolution, ts_offset = interfaces[iface]
+                nsec = _ticks_to_ns((ts_high << 32) | ts_low, resolution) \
+                        + ts_offset * 1000000000
+                builder.add_frame(builder.no, nsec, linktype, data, start, \
+                        min(start + caplen, block_end))
+        elif block_type == 3:
+            # Simple packet blocks carry no timestamp; count them only.
+            builder.no += 1
+
+        offset += block_len
+    return offset
+
+def read_pcap_table(filename):
+    builder = _TableBuilder()
+    with open(filename, 'rb') as capture:
+        if not capture.seek(0, 2):
+            return builder.table()
+        with mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] == b'\x0a\x0d\x0d\x0a':
+                _read_pcapng(data, builder)
+            else:
+                _read_pcap(data, builder)
+    return builder.table()
+
+class PcapTail:
+    # Reads the frames appended to a capture that is still being written,
+    # e.g. by `tcpdump -U -w`. Each read() returns a table of the frames
+    # completed since the previous one, or of those starting within size
+    # bytes.
+    def __init__(self, filename):
+        self.filename = filename
+        self.builder = _TableBuilder()
+        self.offset = None
+
+    def read(self, size=None):
+        with open(self.filename, 'rb') as capture:
+            end = capture.seek(0, 2)
+            if end >= 24 and end > (self.offset or 0):
+                with mmap.mmap(capture.fileno(), 0, \
+                        access=mmap.ACCESS_READ) as data:
+                    pcapng = data[:4] == b'\x0a\x0d\x0d\x0a'
+                    offset = self.offset or (0 if pcapng else 24)
+                    stop = None if size is None else offset + size
+                    if pcapng:
+                        self.offset = _read_pcapng(data, self.builder, \
+                                offset, partial=False, stop=stop)
+                    else:
+                        self.offset = _read_pcap(data, self.builder, \
+                                offset, partial=False, stop=stop)
+        table = self.builder.take()
+        table.meta['source'] = self.filename
+        return table
+
+def write_pcap(filename, frames, linktype=LINKTYPE_ETHERNET):
+    # frames are (timestamp, link layer bytes); mostly for generated traces.
+    with open(filename, 'wb') as capture:
+        capture.write(struct.pack('<IHHiIII', 0xa1b23c4d, 2, 4, 0, 0, \
+                0xffff, linktype))
+        for timestamp, frame in frames:
+            nsec = round(timestamp * 1e9)
+            capture.write(struct.pack('<IIII', nsec // 1000000000, \
+                    nsec % 1000000000, len(frame), len(frame)))
+            capture.write(frame)
+
+def tcp_frame(src, dst, sport, dport, seq, ack, length, tsval=None, \
+        tsecr=0, syn=False, has_ack=True):
+    # An Ethernet/IPv4 or IPv6/TCP frame with a zero payload of `length`.
+    options = b''
+    if tsval is not None:
+        options = struct.pack('>BBBBII', 1, 1, TCP_OPTION_TIMESTAMP, 10, \
+                tsval, tsecr)
+    flags = (TCP_FLAG_SYN if syn else 0) | (TCP_FLAG_ACK if has_ack else 0)
+    tcp = struct.pack('>HHIIHHHH', sport, dport, seq & 0xffffffff, \
+            ack & 0xffffffff, ((20 + len(options)) // 4) << 12 | flags, \
+            65535, 0, 0) + options + bytes(length)
+    if ':' in src:
+        ip = struct.pack('>IHBB', 6 << 28, len(tcp), IPPROTO_TCP, 64) + \
+                socket.inet_pton(socket.AF_INET6, src) + \
+                socket.inet_pton(socket.AF_INET6, dst)
+        ethertype = ETHERTYPE_IPV6
+    else:
+        ip = struct.pack('>BBHHHBBH', 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, \
+                IPPROTO_TCP, 0) + socket.inet_aton(src) + socket.inet_aton(dst)
+        ethertype = ETHERTYPE_IPV4
+    return bytes(12) + struct.pack('>H', ethertype) + ip + tcp
@@ -1,6 +1,11 @@
-from matplotlib import pyplot as plt
+import bisect
+import heapq
 from lib.packets import *
 from lib.int32 import *
+from lib.history import *
+from lib.metrics import *
+from lib.lod import *
+from lib.instrument import *
 
 class PacketProcessor:
     def on_server_data(self, pkt):
@@ -34,81 +39,327 @@ class PacketProcessor:
             else:
                 raise ValueError("The packet type is invalid.")
 
+    def prune(self, before):
+        # Forgets the state kept for packets older than before, for runs
+        # over captures too large to keep all of it; see lib.chunked.
+        pass
+
+    def history_stats(self):
+        # HistoryStore.stats() of the stores kept, by name.
+        return {}
+
+class SeqBucket:
+    # Server data sharing one tsval. A client segment pairs with the first
+    # one sent that covers its seq. As long as no two of them overlap there
+    # is at most one, found by bisecting their starts relative to the first
+    # one; once some do, the packets are scanned in the order they were
+    # sent.
+    __slots__ = ('base', 'time', 'keys', 'ends', 'by_key', 'packets', \
+            'overlapping')
+
+    def __init__(self, base):
+        self.base = base
+        self.time = float('-inf')
+        self.keys = []
+        self.ends = []
+        self.by_key = []
+        self.packets = []
+        self.overlapping = False
+
+    def __len__(self):
+        return len(self.packets)
+
+    def __iter__(self):
+        return iter(self.packets)
+
+    def add(self, packet):
+        self.packets.append(packet)
+        if self.overlapping:
+            return
+        key = minus(packet.seq, self.base)
+        end = minus(packet.end_seq, self.base)
+        if not self.keys or key >= self.ends[-1]:
+            # In order, past the end of every other one
+            self.keys.append(key)
+            self.ends.append(end)
+            self.by_key.append(packet)
+            return
+        i = bisect.bisect_right(self.keys, key)
+        if i and self.ends[i - 1] > key or \
+                i < len(self.keys) and self.keys[i] < end:
+            self.overlapping = True
+            self.keys = self.ends = self.by_key = None
+            return
+        self.keys.insert(i, key)
+        self.ends.insert(i, end)
+        self.by_key.insert(i, packet)
+
+    def find(self, seq):
+        if self.overlapping:
+            for pkt in self.packets:
+                if not after(pkt.seq, seq) and after(pkt.end_seq, seq):
+                    return pkt
+            return None
+        key = minus(seq, self.base)
+        i = bisect.bisect_right(self.keys, key)
+        if i and self.ends[i - 1] > key:
+            return self.by_key[i - 1]
+        return None
+
 class ClientServerMatcher(PacketProcessor):
-    def __init__(self):
+    def __init__(self, horizon=HISTORY_HORIZON):
         super().__init__()
 
-        self.server_tsval_dict = {}
-        self.client_tsval_dict = {}
-        self.seq_dict = {}
+        self.server_tsval_dict = HistoryStore(horizon, HISTORY_MAX_AGE)
+        self.client_tsval_dict = HistoryStore(horizon, HISTORY_MAX_AGE)
+        # The last packet sent with each seq.
+        self.seq_dict = HistoryStore(horizon, time_attr='timestamp')
+        # Heap of (end_seq, arrival, packet) with end_seq unwrapped to 64 bits
         self.rcv_una_packets = []
+        self.rcv_una_count = 0
+        self.seq_last = None
+        self.seq_unwrapped = 0
+
+    def unwrap_seq(self, seq):
+        if self.seq_last is None:
+            self.seq_unwrapped = seq
+        else:
+            self.seq_unwrapped += minus(seq, self.seq_last)
+        self.seq_last = seq
+        return self.seq_unwrapped
 
     def on_server_data(self, packet):
-        if not self.server_tsval_dict.get(packet.tsval):
-            self.server_tsval_dict[packet.tsval] = []
-        self.server_tsval_dict[packet.tsval].append(packet)
+        time = packet.timestamp
+        bucket = self.server_tsval_dict.get(packet.tsval)
+        if bucket is None:
+            bucket = SeqBucket(packet.seq)
+        bucket.add(packet)
+        bucket.time = time
+        self.server_tsval_dict.put(packet.tsval, bucket, time)
         packet.pair_pkt = None
 
-        if not self.seq_dict.get(packet.seq):
-            self.seq_dict[packet.seq] = []
-            packet.retrans = None
-        else:
-            packet.retrans = self.seq_dict[packet.seq][-1]
-        self.seq_dict[packet.seq].append(packet)
+        packet.retrans = self.seq_dict.get(packet.seq)
+        self.seq_dict.put(packet.seq, packet, time)
 
     def on_client_data(self, packet):
         packet.pair_pkt = None
-        for pkt in self.server_tsval_dict.get(packet.tsval, []):
-            if not after(pkt.seq, packet.seq) and \
-                    after(pkt.end_seq, packet.seq):
-                packet.pair_pkt = pkt
-                pkt.pair_pkt = packet
-                break
+        bucket = self.server_tsval_dict.get(packet.tsval)
+        pkt = bucket.find(packet.seq) if bucket is not None else None
+        if pkt is not None:
+            packet.pair_pkt = pkt
+            pkt.pair_pkt = packet
+        else:
+            self.server_tsval_dict.misses += 1
 
         packet.ack_pkt = None
-        self.rcv_una_packets.append(packet)
+        heapq.heappush(self.rcv_una_packets, \
+                (self.unwrap_seq(packet.end_seq), self.rcv_una_count, packet))
+        self.rcv_una_count += 1
 
     def on_client_ack(self, packet):
-        new_list = []
-        for pkt in self.rcv_una_packets:
-            if not before(packet.ack, pkt.end_seq):
-                pkt.ack_pkt = packet
-            else:
-                new_list.append(pkt)
-        self.rcv_una_packets = new_list
-
-        if not self.client_tsval_dict.get(packet.tsval):
-            self.client_tsval_dict[packet.tsval] = []
-        self.client_tsval_dict[packet.tsval].append(packet)
+        ack = self.unwrap_seq(packet.ack)
+        while self.rcv_una_packets and self.rcv_una_packets[0][0] <= ack:
+            heapq.heappop(self.rcv_una_packets)[2].ack_pkt = packet
+
+        bucket = self.client_tsval_dict.get(packet.tsval)
+        if bucket is None:
+            bucket = AckBucket()
+        if packet.ack not in bucket.by_ack:
+            bucket.by_ack[packet.ack] = packet
+            bucket.time = time = packet.timestamp
+            self.client_tsval_dict.put(packet.tsval, bucket, time)
         packet.pair_pkt = None
 
     def on_server_ack(self, packet):
         packet.pair_pkt = None
-        for pkt in self.client_tsval_dict.get(packet.tsval, []):
-            if packet.ack == pkt.ack:
-                pkt.pair_pkt = packet
-                packet.pair_pkt = pkt
-                break
-
-class ClientPlotter(PacketProcessor):
-    def __init__(self):
+        bucket = self.client_tsval_dict.get(packet.tsval)
+        pkt = bucket.by_ack.get(packet.ack) if bucket is not None else None
+        if pkt is not None:
+            pkt.pair_pkt = packet
+            packet.pair_pkt = pkt
+        else:
+            self.client_tsval_dict.misses += 1
+
+    def prune(self, before):
+        # Packets after this no longer match or count as retransmissions of
+        # the dropped ones, and client data that was not acknowledged by
+        # then keeps ack_pkt None.
+        self.server_tsval_dict.prune(before)
+        self.client_tsval_dict.prune(before)
+        self.seq_dict.prune(before)
+        self.rcv_una_packets = [item for item in self.rcv_una_packets \
+                if item[2].timestamp >= before]
+        heapq.heapify(self.rcv_una_packets)
+
+    def history_stats(self):
+        return {'server_tsval': self.server_tsval_dict.stats(), \
+                'client_tsval': self.client_tsval_dict.stats(), \
+                'seq': self.seq_dict.stats()}
+
+class MultiProcessor(PacketProcessor):
+    # Feeds every packet once to all registered processors. Plotters created
+    # with the shared client_state/server_state leave the bookkeeping of
+    # snd_nxt, rcv_nxt, history, ... to this processor, so it is done once
+    # per packet no matter how many metrics are computed.
+    def __init__(self, *processors, horizon=HISTORY_HORIZON):
         super().__init__()
+        self.client_state = ClientState(horizon)
+        self.server_state = ServerState(horizon)
+        self.processors = list(processors)
 
-        self.curve_x = []
-        self.curve_y = []
-        self.curve_packets = []
+    def add(self, processor):
+        self.processors.append(processor)
+        return processor
 
+    def process(self, packets):
+        client_state = self.client_state
+        server_state = self.server_state
+        handlers = {
+            PACKET_SERVER_DATA: [client_state.on_server_data, \
+                    server_state.on_server_data] + \
+                    [p.handle_server_data for p in self.processors],
+            PACKET_CLIENT_DATA: [client_state.on_client_data] + \
+                    [p.handle_client_data for p in self.processors],
+            PACKET_CLIENT_ACK: [client_state.on_client_ack] + \
+                    [p.handle_client_ack for p in self.processors],
+            PACKET_SERVER_ACK: [server_state.on_server_ack] + \
+                    [p.handle_server_ack for p in self.processors],
+        }
+        for pkt in packets:
+            try:
+                handler_list = handlers[pkt.type]
+            except KeyError:
+                raise ValueError("The packet type is invalid.") from None
+            for handler in handler_list:
+                handler(pkt)
+
+    def prune(self, before):
+        self.client_state.prune(before)
+        self.server_state.prune(before)
+        for processor in self.processors:
+            processor.prune(before)
+
+    def history_stats(self):
+        stats = {'client': self.client_state.history.stats(), \
+                'server': self.server_state.history.stats()}
+        for processor in self.processors:
+            stats.update(processor.history_stats())
+        return stats
+
+def count_history(processor, prefix):
+    # The misses and evictions of the history stores of a processor, for
+    # --profile; what the array engine counts in _history_lookup() instead.
+    if not profiling():
+        return
+    for name, stats in processor.history_stats().items():
+        for key in ('misses', 'evicted'):
+            profile_count(f'history.{prefix}.{name}.{key}', stats[key])
+
+class ClientState:
+    def __init__(self, horizon=HISTORY_HORIZON):
         self.snd_nxt = 0
         self.rcv_nxt = 0
         self.bytes_received = 0
 
-        self.history = dict()
+        self.history = HistoryStore(horizon, HISTORY_MAX_AGE)
 
-    def handle_client_data(self, packet):
+    def on_client_data(self, packet):
         if not self.rcv_nxt or after(packet.end_seq, self.rcv_nxt):
             self.rcv_nxt = packet.end_seq # TODO: disordered packet
         self.bytes_received += packet.len
 
+    def on_client_ack(self, packet):
+        if packet.tsval not in self.history:
+            self.history.put(packet.tsval, ClientHistory(packet.timestamp, \
+                    self.snd_nxt, self.rcv_nxt, self.bytes_received), \
+                    packet.timestamp)
+
+    def on_server_data(self, packet):
+        if not self.snd_nxt or after(packet.end_seq, self.snd_nxt):
+            self.snd_nxt = packet.end_seq
+
+    def prune(self, before):
+        self.history.prune(before)
+
+class ServerState:
+    def __init__(self, horizon=HISTORY_HORIZON):
+        self.snd_nxt = 0
+        self.snd_una = 0
+        self.delivered = 0
+        self.bytes_acked = 0
+        self.newly_acked = 0
+
+        self.history = HistoryStore(horizon, HISTORY_MAX_AGE)
+
+    def on_server_data(self, packet):
+        if not self.snd_nxt or after(packet.end_seq, self.snd_nxt):
+            self.snd_nxt = packet.end_seq
+        self.delivered += packet.len
+
+        if packet.tsval not in self.history:
+            self.history.put(packet.tsval, ServerHistory(packet.timestamp, \
+                    self.snd_nxt, self.snd_una, self.delivered, \
+                    self.bytes_acked), packet.timestamp)
+
+    def on_server_ack(self, packet):
+        newly_acked = 0
+        if not self.snd_una or after(packet.ack, self.snd_una):
+            newly_acked = minus(packet.ack, self.snd_una)
+            self.bytes_acked += newly_acked
+            if not self.snd_una:
+                newly_acked = 0
+            self.snd_una = packet.ack # TODO: SACK
+        self.newly_acked = newly_acked
+
+    def prune(self, before):
+        self.history.prune(before)
+
+def _state_attribute(name):
+    def fget(self):
+        return getattr(self.state, name)
+    def fset(self, value):
+        setattr(self.state, name, value)
+    return property(fget, fset)
+
+class ClientPlotter(PacketProcessor):
+    metric = None
+    side = 'client'
+
+    snd_nxt = _state_attribute('snd_nxt')
+    rcv_nxt = _state_attribute('rcv_nxt')
+    bytes_received = _state_attribute('bytes_received')
+    history = _state_attribute('history')
+
+    def __init__(self, state=None):
+        super().__init__()
+
+        self.curve_x = []
+        self.curve_y = []
+        self.curve_packets = []
+
+        # A shared state is kept up to date by the MultiProcessor owning it.
+        self.owns_state = state is None
+        self.state = ClientState() if state is None else state
+
+    def metric_args(self):
+        return dict()
+
+    def process_table(self, packets):
+        if self.metric is None or not isinstance(packets, PacketTable):
+            return self.process(packets)
+        with profile_stage(f'metric:{self.metric}:client', len(packets)):
+            series = client_series(packets, self.metric, \
+                    **self.metric_args())
+        self.curve_x = series['curve_x']
+        self.curve_y = series['curve_y']
+        self.curve_packets = PacketSubset(packets, series['curve_idx'])
+        packets.curve_id[series['curve_idx']] = \
+                np.arange(len(series['curve_idx']))
+
+    def handle_client_data(self, packet):
+        if self.owns_state:
+            self.state.on_client_data(packet)
+
         val = super().handle_client_data(packet)
 
         packet.curve_id = len(self.curve_packets)
@@ -117,25 +368,51 @@ class ClientPlotter(PacketProcessor):
         self.curve_y.append(val)
 
     def handle_client_ack(self, packet):
-        if self.history.get(packet.tsval) is None:
-            self.history[packet.tsval] = dict(snd_nxt=self.snd_nxt, \
-                    rcv_nxt=self.rcv_nxt, bytes_received=self.bytes_received, \
-                    time=packet.timestamp)
+        if self.owns_state:
+            self.state.on_client_ack(packet)
 
         super().handle_client_ack(packet)
 
     def handle_server_data(self, packet):
-        if not self.snd_nxt or after(packet.end_seq, self.snd_nxt):
-            self.snd_nxt = packet.end_seq
+        if self.owns_state:
+            self.state.on_server_data(packet)
 
         super().handle_server_data(packet)
 
-    def plot(self):
+    def prune(self, before):
+        if self.owns_state:
+            self.state.prune(before)
+
+    def history_stats(self):
+        if self.owns_state:
+            return {self.side: self.history.stats()}
+        return {}
+
+    def plot(self, lod=False, min_points=LOD_MIN_POINTS):
+        # Imported here so that computing curves never loads matplotlib.
+        from matplotlib import pyplot as plt
+        if lod:
+            curve = LodCurve(plt.gca(), self.curve_x, self.curve_y, \
+                    min_points)
+            curve.line, = plt.plot(*curve.visible())
+            curve.scatter = plt.scatter(*curve.visible())
+            self.lod_curves = dict(curve=curve)
+            return (curve, )
         plt.plot(self.curve_x, self.curve_y)
         return (plt.scatter(self.curve_x, self.curve_y), )
 
 class ServerPlotter(PacketProcessor):
-    def __init__(self, merged_plot=False):
+    metric = None
+    side = 'server'
+
+    snd_nxt = _state_attribute('snd_nxt')
+    snd_una = _state_attribute('snd_una')
+    delivered = _state_attribute('delivered')
+    bytes_acked = _state_attribute('bytes_acked')
+    newly_acked = _state_attribute('newly_acked')
+    history = _state_attribute('history')
+
+    def __init__(self, merged_plot=False, state=None):
         super().__init__()
 
         self.data_curve_x = []
@@ -149,22 +426,36 @@ class ServerPlotter(PacketProcessor):
             self.curve_x = []
             self.curve_y = []
 
-        self.snd_nxt = 0
-        self.snd_una = 0
-        self.delivered = 0
-        self.bytes_acked = 0
-
-        self.history = dict()
+        # A shared state is kept up to date by the MultiProcessor owning it.
+        self.owns_state = state is None
+        self.state = ServerState() if state is None else state
+
+    def metric_args(self):
+        return dict()
+
+    def process_table(self, packets):
+        if self.metric is None or not isinstance(packets, PacketTable):
+            return self.process(packets)
+        with profile_stage(f'metric:{self.metric}:server', len(packets)):
+            series = server_series(packets, self.metric, \
+                    **self.metric_args())
+        for curve in ('data_curve', 'ack_curve'):
+            idx = series[f'{curve}_idx']
+            setattr(self, f'{curve}_x', series[f'{curve}_x'])
+            setattr(self, f'{curve}_y', series[f'{curve}_y'])
+            setattr(self, f'{curve}_packets', PacketSubset(packets, idx))
+            packets.curve_id[idx] = np.arange(len(idx))
+        if self.merged_plot:
+            order = np.argsort(np.concatenate((series['data_curve_idx'], \
+                    series['ack_curve_idx'])), kind='stable')
+            self.curve_x = np.concatenate((self.data_curve_x, \
+                    self.ack_curve_x))[order]
+            self.curve_y = np.concatenate((self.data_curve_y, \
+                    self.ack_curve_y))[order]
 
     def handle_server_data(self, packet):
-        if not self.snd_nxt or after(packet.end_seq, self.snd_nxt):
-            self.snd_nxt = packet.end_seq
-        self.delivered += packet.len
-
-        if self.history.get(packet.tsval) is None:
-            self.history[packet.tsval] = dict(snd_nxt=self.snd_nxt, \
-                    snd_una=self.snd_una, delivered=self.delivered, \
-                    bytes_acked=self.bytes_acked, time=packet.timestamp)
+        if self.owns_state:
+            self.state.on_server_data(packet)
 
         val = super().handle_server_data(packet)
 
@@ -177,17 +468,10 @@ class ServerPlotter(PacketProcessor):
             self.curve_y.append(val)
 
     def handle_server_ack(self, packet):
-        newly_acked = 0
-        if not self.snd_una or after(packet.ack, self.snd_una):
-            newly_acked = minus(packet.ack, self.snd_una)
-            self.bytes_acked += newly_acked
-            if not self.snd_una:
-                newly_acked = 0
-            self.snd_una = packet.ack # TODO: SACK
+        if self.owns_state:
+            self.state.on_server_ack(packet)
 
-        self.newly_acked = newly_acked
         val = super().handle_server_ack(packet)
-        del self.newly_acked
 
         packet.curve_id = len(self.ack_curve_packets)
         self.ack_curve_packets.append(packet)
@@ -197,7 +481,36 @@ class ServerPlotter(PacketProcessor):
             self.curve_x.append(packet.timestamp)
             self.curve_y.append(val)
 
-    def plot(self):
+    def prune(self, before):
+        if self.owns_state:
+            self.state.prune(before)
+
+    def history_stats(self):
+        if self.owns_state:
+            return {self.side: self.history.stats()}
+        return {}
+
+    def plot(self, lod=False, min_points=LOD_MIN_POINTS):
+        from matplotlib import pyplot as plt
+        if lod:
+            # Decimated curves; each one redraws its own subset on zoom.
+            ax = plt.gca()
+            data = LodCurve(ax, self.data_curve_x, self.data_curve_y, \
+                    min_points)
+            ack = LodCurve(ax, self.ack_curve_x, self.ack_curve_y, \
+                    min_points)
+            if self.merged_plot:
+                merged = LodCurve(ax, self.curve_x, self.curve_y, min_points)
+                merged.line, = plt.plot(*merged.visible())
+            else:
+                data.line, = plt.plot(*data.visible())
+                ack.line, = plt.plot(*ack.visible())
+            data.scatter = plt.scatter(*data.visible())
+            ack.scatter = plt.scatter(*ack.visible())
+            self.lod_curves = dict(data_curve=data, ack_curve=ack)
+            if self.merged_plot:
+                self.lod_curves['curve'] = merged
+            return (data, ack)
         if self.merged_plot:
             plt.plot(self.curve_x, self.curve_y)
         else:
@@ -208,12 +521,16 @@ class ServerPlotter(PacketProcessor):
         return (sc1, sc2)
 
 class ClientBifPlotter(ClientPlotter):
+    metric = 'bif'
+
     def on_client_data(self, packet):
         if self.snd_nxt and self.rcv_nxt:
             return minus(self.snd_nxt, self.rcv_nxt) # TODO: holes
         return 0
 
 class ServerBifPlotter(ServerPlotter):
+    metric = 'bif'
+
     def on_server_data(self, packet):
         if self.snd_nxt and self.snd_una:
             return minus(self.snd_nxt, self.snd_una)
@@ -225,23 +542,29 @@ class ServerBifPlotter(ServerPlotter):
         return 0
 
 class ClientRttPlotter(ClientPlotter):
+    metric = 'rtt'
+
     def on_client_data(self, packet):
         old = self.history.get(packet.tsecr)
         if old is None:
+            self.history.misses += 1
             return -1
-        return packet.timestamp - old['time']
+        return packet.timestamp - old.time
 
 class ServerRttPlotter(ServerPlotter):
-    def __init__(self):
-        super().__init__()
+    metric = 'rtt'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.srtt = 0
 
     def on_server_ack(self, packet):
         old = self.history.get(packet.tsecr)
         if old is None:
+            self.history.misses += 1
             return -1
 
-        rtt = packet.timestamp - old['time']
+        rtt = packet.timestamp - old.time
         if not self.srtt:
             self.srtt = rtt
             self.mdev = rtt / 2
@@ -277,73 +600,77 @@ class ServerRttPlotter(ServerPlotter):
         return self.srtt + self.rttvar * 4
 
 class ClientBwPlotter(ClientPlotter):
+    metric = 'bw'
+
     def on_client_data(self, packet):
         old = self.history.get(packet.tsecr)
         if old is None:
+            self.history.misses += 1
             return -1
 
-        size = self.bytes_received - old['bytes_received']
-        time = packet.timestamp - old['time']
+        size = self.bytes_received - old.bytes_received
+        time = packet.timestamp - old.time
         return size / time
 
 class ServerBwPlotter(ServerPlotter):
-    def __init__(self):
-        super().__init__()
+    metric = 'bw'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.last_tsecr = 0
+        # The history of last_tsecr, which after an idle period longer than
+        # the horizon may no longer be in self.history.
+        self.last_old = None
 
     def on_server_data(self, packet):
-        if not self.last_tsecr:
+        old = self.last_old
+        if old is None:
             return -1
-        old = self.history[self.last_tsecr]
 
-        size = self.delivered - old['delivered']
-        time = packet.timestamp - old['time']
+        size = self.delivered - old.delivered
+        time = packet.timestamp - old.time
         return size / time
 
     def on_server_ack(self, packet):
         old = self.history.get(packet.tsecr)
         if old is None:
+            self.history.misses += 1
             return -1
         if not self.last_tsecr or after(packet.tsecr, self.last_tsecr):
             self.last_tsecr = packet.tsecr
+            self.last_old = old
 
-        size = self.bytes_acked - old['bytes_acked']
-        time = packet.timestamp - old['time']
+        size = self.bytes_acked - old.bytes_acked
+        time = packet.timestamp - old.time
         return size / time
 
-class WindowMeasure:
-    def __init__(self, win_size):
-        self.window = []
-        self.sum = 0
-        self.win_size = win_size
-
-    def append(self, time, data):
-        self.window.append((time, data))
-        self.sum += data
-        i = 0
-        while self.window[i][0] <= time - self.win_size:
-            self.sum -= self.window[i][1]
-            i += 1
-        self.window = self.window[i:]
-        return self.sum
-
 class ClientWinBwPlotter(ClientPlotter):
-    def __init__(self, win=0.25):
-        super().__init__()
+    metric = 'win-bw'
+
+    def __init__(self, win=0.25, **kwargs):
+        super().__init__(**kwargs)
         self.win = WindowMeasure(win)
         self.win_size = win
 
+    def metric_args(self):
+        return dict(win=self.win_size)
+
     def on_client_data(self, packet):
         sz = self.win.append(packet.timestamp, packet.len)
         return sz / self.win_size
 
 class ServerWinBwPlotter(ServerPlotter):
-    def __init__(self, win=0.25):
-        super().__init__()
+    metric = 'win-bw'
+
+    def __init__(self, win=0.25, **kwargs):
+        super().__init__(**kwargs)
         self.data_win = WindowMeasure(win)
         self.ack_win = WindowMeasure(win)
         self.win_size = win
 
+    def metric_args(self):
+        return dict(win=self.win_size)
+
     def on_server_data(self, packet):
         sz = self.data_win.append(packet.timestamp, packet.len)
         return sz / self.win_size
@@ -351,3 +678,17 @@ class ServerWinBwPlotter(ServerPlotter):
     def on_server_ack(self, packet):
         sz = self.ack_win.append(packet.timestamp, self.newly_acked)
         return sz / self.win_size
+
+def extend_lod_curves(plotter):
+    # Appends the points a packet by packet plotter added since plot() to
+    # the LodCurves it returned; update() the curves to redraw them.
+    for name, curve in plotter.lod_curves.items():
+        x = getattr(plotter, f'{name}_x')
+        y = getattr(plotter, f'{name}_y')
+        curve.extend(x[len(curve.x):], y[len(curve.x):])
+    return list(plotter.lod_curves.values())
+
+PLOTTERS = {'rtt'    : (ClientRttPlotter,   ServerRttPlotter,   ), \
+            'bw'     : (ClientBwPlotter,    ServerBwPlotter,    ), \
+            'bif'    : (ClientBifPlotter,   ServerBifPlotter,   ), \
+            'win-bw' : (ClientWinBwPlotter, ServerWinBwPlotter, ), }
@@ -0,0 +1,157 @@
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib import pyplot as plt
+from lib.cache import *
+from lib.processors import *
+from lib.trace import *
+from lib.flows import *
+from lib.instrument import *
+
+def make_plotters(names, packets, window=(0.25, ), engine='array', \
+        group=None):
+    # One (client, server) plotter pair per name. The reference engine runs
+    # all of them over the packets in a single MultiProcessor pass, which
+    # may be given to feed them more packets later.
+    group = group if group is not None else MultiProcessor()
+    plotters = []
+    for name in names:
+        client_plotter, server_plotter = PLOTTERS[name]
+        plotter_args = dict(win=window[0]) if name == 'win-bw' else {}
+        if engine != 'array':
+            client_plotter = group.add(client_plotter( \
+                    state=group.client_state, **plotter_args))
+            server_plotter = group.add(server_plotter( \
+                    state=group.server_state, **plotter_args))
+        else:
+            client_plotter = client_plotter(**plotter_args)
+            server_plotter = server_plotter(**plotter_args)
+            client_plotter.process_table(packets)
+            server_plotter.process_table(packets)
+        plotters.append((client_plotter, server_plotter))
+    if engine != 'array':
+        with profile_stage('reference', len(packets)):
+            group.process(packets)
+        if len(packets):
+            count_history(group, 'plotters')
+    return plotters
+
+def plot_extra_windows(packets, windows):
+    extra_client = client_series(packets, 'win-bw', win=windows)
+    extra_server = server_series(packets, 'win-bw', win=windows)
+    for i, win in enumerate(windows):
+        plt.plot(extra_client['curve_x'], extra_client['curve_y'][i], \
+                label=f'client {win}s')
+        plt.plot(extra_server['data_curve_x'], \
+                extra_server['data_curve_y'][i], label=f'server data {win}s')
+        plt.plot(extra_server['ack_curve_x'], \
+                extra_server['ack_curve_y'][i], label=f'server ack {win}s')
+    plt.legend()
+
+def render_trace(trace, plotters, output_dir, formats=('png', ), \
+        trace_dir=TRACE_DIR, server_csv=None, timestamp_align=None, \
+        window=(0.25, ), engine='array', cache_dir=None, \
+        cache_size=DEFAULT_CACHE_SIZE, no_cache=False, force=False, \
+        flow=None, top=None, span=None):
+    client_csv, server_csv = trace_files(trace, trace_dir, server_csv)
+    stem = output_stem(trace)
+
+    # Outputs are up to date if the ones listed in the stamp exist and were
+    # rendered from the same inputs with the same options.
+    stamp_path = os.path.join(output_dir, f'{stem}.stamp')
+    stamp = dict(inputs=[file_ident(path) \
+            for path in (client_csv, server_csv) if path], \
+            plotters=list(plotters), formats=list(formats), \
+            timestamp_align=timestamp_align, window=list(window), \
+            engine=engine, flow=flow, top=top, \
+            span=vars(span) if span is not None else None)
+    if not force:
+        try:
+            with open(stamp_path, 'r') as stamp_file:
+                old_stamp = json.load(stamp_file)
+            outputs = old_stamp.pop('outputs')
+            if old_stamp == stamp and \
+                    all(os.path.exists(path) for path in outputs):
+                return 'skipped'
+        except (OSError, ValueError, KeyError):
+            pass
+
+    plt.switch_backend('agg')
+    cache = None if no_cache else TraceCache(cache_dir, cache_size)
+    if flow is None and top is None:
+        with profile_stage('trace'):
+            trace = Trace(client_csv, server_csv, timestamp_align, cache, \
+                    span=span)
+        views = [(stem, trace.packets)]
+        xlim = trace.view
+    else:
+        # Flows are rendered one after another; this already runs in a
+        # worker of render_batch.
+        load_table = cache.read_table if cache is not None else read_table
+        results, _ = analyze_flows(load_table(client_csv), \
+                load_table(server_csv) if server_csv else None, \
+                timestamp_align, flow, top, jobs=1)
+        for result in results:
+            if result.error is not None:
+                raise RuntimeError(f'flow {result.number}: ' + \
+                        result.error.splitlines()[-1])
+        views = [(f'{stem}-flow{result.number}', result.packets) \
+                for result in results]
+        xlim = None, None
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for view, packets in views:
+        for name, (client_plotter, server_plotter) in zip(plotters, \
+                make_plotters(plotters, packets, window, engine)):
+            with profile_stage(f'render:{name}', len(packets)):
+                fig = plt.figure(figsize=(12, 6))
+                client_plotter.plot()
+                server_plotter.plot()
+                if name == 'win-bw' and len(window) > 1:
+                    plot_extra_windows(packets, window[1:])
+                plt.xlim(*xlim)
+                plt.title(f'{view} {name}')
+                for fmt in formats:
+                    outputs.append(os.path.join(output_dir, \
+                            f'{view}-{name}.{fmt}'))
+                    fig.savefig(outputs[-1])
+                plt.close(fig)
+
+    with open(stamp_path, 'w') as stamp_file:
+        json.dump(dict(stamp, outputs=outputs), stamp_file)
+    return 'rendered'
+
+def _render_job(trace, plotters, output_dir, options):
+    try:
+        return trace, render_trace(trace, plotters, output_dir, **options), \
+                None
+    except Exception:
+        return trace, 'failed', traceback.format_exc()
+
+def _report(results):
+    failed = []
+    for trace, status, error in results:
+        if error is not None:
+            failed.append(trace)
+            print(f'ERROR: {trace}: {error.splitlines()[-1]}')
+        else:
+            print(f'INFO: {trace}: {status}')
+    return failed
+
+def render_batch(traces, plotters, output_dir, jobs=None, **options):
+    # Traces whose outputs would overwrite each other, like a/run.csv and
+    # b/run.csv, are refused before anything is rendered.
+    shared = shared_stems(traces)
+    if shared:
+        raise ValueError(f"Several traces would be rendered as " + \
+                f"{', '.join(shared)} in {output_dir}.")
+    if jobs == 1:
+        # In this process, so that --profile sees every stage.
+        return _report(_render_job(trace, plotters, output_dir, options) \
+                for trace in traces)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_render_job, trace, plotters, output_dir, \
+                options) for trace in traces]
+        return _report(future.result() for future in futures)
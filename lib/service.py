@@ -0,0 +1,264 @@
+import collections
+import io
+import json
+import math
+import threading
+import traceback
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from lib.packets import *
+from lib.cache import *
+from lib.trace import *
+from lib.metrics import *
+from lib.stats import *
+from lib.export import *
+
+DEFAULT_SERVICE_MEMORY = 2 << 30
+IMAGE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', \
+        'pdf': 'application/pdf', }
+
+def resident_bytes(table):
+    # Memory a table holds; cached tables are mapped from their files.
+    if not isinstance(table, PacketTable):
+        return 0
+    return sum(col.nbytes for col in table.columns.values() \
+            if not isinstance(col, np.memmap))
+
+class TraceStore:
+    # Fully processed traces, least recently used first, kept while their
+    # tables fit in max_bytes; the newest one is kept whatever its size.
+    # Requests for a trace that is being loaded wait for that load instead
+    # of starting another one.
+    def __init__(self, max_bytes=DEFAULT_SERVICE_MEMORY, cache=None, jobs=1):
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self.jobs = jobs
+        self.traces = collections.OrderedDict()
+        self.sizes = {}
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = 0
+
+    def key(self, client_csv, server_csv=None, timestamp_align=None, \
+            span=None):
+        # Files are identified by size and mtime too, so that a capture
+        # written again is loaded again.
+        return json.dumps([file_ident(client_csv), \
+                file_ident(server_csv) if server_csv else None, \
+                timestamp_align, vars(span) if span is not None else None])
+
+    def get(self, client_csv, server_csv=None, timestamp_align=None, \
+            span=None):
+        key = self.key(client_csv, server_csv, timestamp_align, span)
+        with self.lock:
+            trace = self.traces.get(key)
+            if trace is not None:
+                self.traces.move_to_end(key)
+                self.hits += 1
+                return trace
+            future = self.loading.get(key)
+            owner = future is None
+            if owner:
+                future = self.loading[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            trace = Trace(client_csv, server_csv, timestamp_align, \
+                    self.cache, self.jobs, span)
+        except BaseException as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.loading[key]
+            self.traces[key] = trace
+            self.sizes[key] = sum(resident_bytes(table) for table in \
+                    (trace.packets, trace.client, trace.server))
+            self.evict()
+        future.set_result(trace)
+        return trace
+
+    def evict(self):
+        # Called with the lock held.
+        total = sum(self.sizes.values())
+        while total > self.max_bytes and len(self.traces) > 1:
+            key, _ = self.traces.popitem(last=False)
+            total -= self.sizes.pop(key)
+
+    def summary(self):
+        with self.lock:
+            return dict(traces=[dict(key=json.loads(key), \
+                    bytes=self.sizes[key]) for key in self.traces], \
+                    bytes=sum(self.sizes.values()), \
+                    max_bytes=self.max_bytes, loading=len(self.loading), \
+                    hits=self.hits, misses=self.misses, \
+                    coalesced=self.coalesced)
+
+def _json_values(values):
+    # JSON has no NaN or infinity.
+    return [value if math.isfinite(value) else None \
+            for value in np.asarray(values, dtype='f8').tolist()]
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class TraceService(ThreadingHTTPServer):
+    # GET /series/{metric}  curves as JSON, or as .npz with format=npz
+    #     /plot/{metric}.{png,svg,pdf}
+    #     /stats            the summary of stats.py
+    #     /traces           what is loaded
+    # with the trace given by trace= (an ID or a capture), and optionally
+    # server=, align=, window=, start=, end=, start_no=, end_no= and
+    # lead_in= as for plot.py.
+    daemon_threads = True
+
+    def __init__(self, address, store, trace_dir=TRACE_DIR, quiet=False):
+        super().__init__(address, TraceRequestHandler)
+        self.store = store
+        self.trace_dir = trace_dir
+        self.quiet = quiet
+        # pyplot keeps global state, so images are drawn one at a time.
+        self.plot_lock = threading.Lock()
+
+class TraceRequestHandler(BaseHTTPRequestHandler):
+    def param(self, name, convert=str, default=None):
+        values = self.query.get(name)
+        if not values:
+            return default
+        try:
+            return convert(values[-1])
+        except ValueError:
+            raise ServiceError(400, f"Invalid {name} {values[-1]}.") \
+                    from None
+
+    def trace(self):
+        spec = self.param('trace')
+        if spec is None:
+            raise ServiceError(400, "No trace given.")
+        client_csv, server_csv = trace_files(spec, self.server.trace_dir, \
+                self.param('server'))
+        span = TraceSpan(self.param('start', float), \
+                self.param('end', float), self.param('start_no', int), \
+                self.param('end_no', int), \
+                self.param('lead_in', float, SPAN_LEAD_IN))
+        if vars(span) == vars(TraceSpan()):
+            span = None
+        try:
+            return self.server.store.get(client_csv, server_csv, \
+                    self.param('align', float), span)
+        except FileNotFoundError as e:
+            raise ServiceError(404, str(e)) from None
+        except ValueError as e:
+            raise ServiceError(400, str(e)) from None
+
+    def window(self):
+        window = self.param('window', float, 0.25)
+        if not window > 0:
+            raise ServiceError(400, f"Invalid window {window}.")
+        return window
+
+    def metric(self, name):
+        if name not in METRICS:
+            raise ServiceError(404, f"Unknown metric {name}.")
+        return name
+
+    def send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, value, status=200):
+        self.send(json.dumps(value).encode(), 'application/json', status)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.query = parse_qs(url.query)
+        path = url.path.strip('/').split('/')
+        try:
+            if path == ['traces']:
+                self.send_json(self.server.store.summary())
+            elif path == ['stats']:
+                window = self.window()
+                trace = self.trace()
+                stats = trace_stats(trace.packets, window)
+                stats['timestamp_align'] = trace.timestamp_align
+                self.send_json(stats)
+            elif len(path) == 2 and path[0] == 'series':
+                self.series(self.metric(path[1]))
+            elif len(path) == 2 and path[0] == 'plot':
+                name, _, fmt = path[1].rpartition('.')
+                if fmt not in IMAGE_TYPES:
+                    raise ServiceError(404, f"Unknown image format {fmt}.")
+                self.plot(self.metric(name), fmt)
+            else:
+                raise ServiceError(404, f"Nothing at {url.path}.")
+        except ServiceError as e:
+            self.send_json(dict(error=str(e)), e.status)
+        except Exception as e:
+            traceback.print_exc()
+            self.send_json(dict(error=f'{type(e).__name__}: {e}'), 500)
+
+    def series(self, metric):
+        window = self.window()
+        trace = self.trace()
+        series = metric_tables(trace.packets, metric, window)
+        curve = self.param('curve')
+        if curve is not None:
+            if curve not in series:
+                raise ServiceError(404, f"Unknown curve {curve}.")
+            series = {curve: series[curve]}
+        fmt = self.param('format', default='json')
+        if fmt == 'npz':
+            body = io.BytesIO()
+            np.savez(body, **{f'{name}-{column}': values \
+                    for name, columns in series.items() \
+                    for column, values in columns.items()})
+            self.send(body.getvalue(), 'application/octet-stream')
+        elif fmt == 'json':
+            self.send_json(dict(metric=metric, \
+                    timestamp_align=trace.timestamp_align, \
+                    tsbase=trace.packets.meta['tsbase'], \
+                    **{name: dict(x=columns['x'].tolist(), \
+                    y=_json_values(columns['y']), \
+                    packet=columns['packet'].tolist()) \
+                    for name, columns in series.items()}))
+        else:
+            raise ServiceError(400, f"Unknown format {fmt}.")
+
+    def plot(self, metric, fmt):
+        # Imported here so that a service only asked for series never
+        # loads matplotlib.
+        from lib.render import make_plotters, plt
+        window = self.window()
+        trace = self.trace()
+        (client_plotter, server_plotter), = make_plotters([metric], \
+                trace.packets, (window, ))
+        body = io.BytesIO()
+        with self.server.plot_lock:
+            plt.switch_backend('agg')
+            fig = plt.figure(figsize=(self.param('width', float, 12), \
+                    self.param('height', float, 6)))
+            try:
+                client_plotter.plot()
+                server_plotter.plot()
+                plt.xlim(*trace.view)
+                plt.title(f'{self.param("trace")} {metric}')
+                fig.savefig(body, format=fmt)
+            finally:
+                plt.close(fig)
+        self.send(body.getvalue(), IMAGE_TYPES[fmt])
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
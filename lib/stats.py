@@ -0,0 +1,53 @@
+import numpy as np
+from lib.packets import *
+from lib.metrics import *
+from lib.flows import *
+
+STATS_PERCENTILES = (50, 95, 99, )
+
+def trace_stats(packets, window=0.25):
+    # Summary numbers of one matched trace. RTT samples and bytes in flight
+    # come from the server side if the trace has a server capture and from
+    # the client side otherwise; bandwidth is what the client received.
+    stats = flow_summary(packets)
+    client_data = int((packets.type == PACKET_CLIENT_DATA).sum())
+    has_server = bool(((packets.type == PACKET_SERVER_DATA) | \
+            (packets.type == PACKET_SERVER_ACK)).any())
+
+    if has_server:
+        rtt = server_series(packets, 'rtt')['ack_curve_y']
+        bif = server_series(packets, 'bif')['data_curve_y']
+    else:
+        rtt = client_series(packets, 'rtt')['curve_y']
+        bif = np.zeros(0)
+    rtt = rtt[rtt >= 0]
+    for p, value in zip(STATS_PERCENTILES, np.percentile(rtt, \
+            STATS_PERCENTILES) if len(rtt) else [None] * 3):
+        stats[f'rtt_p{p}'] = float(value) if value is not None else None
+    stats['rtt_samples'] = len(rtt)
+
+    rates = client_series(packets, 'win-bw', win=window)['curve_y']
+    stats['bw_mean'] = stats['throughput']
+    stats['bw_peak'] = float(rates.max()) if len(rates) else 0.0
+    stats['bw_window'] = window
+    stats['bif_max'] = int(bif.max()) if len(bif) else None
+    # Without a server capture there is nothing to match against.
+    stats['unmatched_ratio'] = stats['unmatched'] / client_data \
+            if client_data and has_server else None
+    stats['server'] = has_server
+    return stats
+
+def format_stats(stats):
+    def ms(value):
+        return '-' if value is None else f'{value * 1e3:.2f}'
+
+    rtt = '/'.join(ms(stats[f'rtt_p{p}']) for p in STATS_PERCENTILES)
+    bif = '-' if stats['bif_max'] is None else stats['bif_max']
+    unmatched = '-' if stats['unmatched_ratio'] is None else \
+            f"{stats['unmatched_ratio'] * 100:.2f}%"
+    return f"rtt p50/p95/p99 {rtt} ms, " + \
+            f"bw mean/peak {stats['bw_mean'] * 8 / 1e6:.3f}/" + \
+            f"{stats['bw_peak'] * 8 / 1e6:.3f} Mbit/s, " + \
+            f"bif max {bif} bytes, " + \
+            f"{stats['retransmissions']} retransmissions, " + \
+            f"{unmatched} unmatched"
@@ -0,0 +1,148 @@
+import csv
+import heapq
+import random
+
+# Column layout of `tshark -T fields -E header=y -E separator=,` with the
+# fields read_table understands.
+SYNTH_TITLES = ['_ws.col.No.', '_ws.col.Time', '_ws.col.Source', \
+        '_ws.col.Destination', 'tcp.srcport', 'tcp.dstport', 'tcp.seq', \
+        'tcp.ack', 'tcp.len', 'tcp.options.timestamp.tsval', \
+        'tcp.options.timestamp.tsecr', 'tcp.flags.syn', 'tcp.flags.ack']
+
+CLIENT_ADDRESS = ('10.0.0.1', 40000)
+SERVER_ADDRESS = ('10.0.0.2', 443)
+
+class SyntheticTrace:
+    # A bulk download seen from both ends: the server sends `packets` data
+    # segments, the client delays every other ACK, and lost segments are
+    # sent again after 1.5 RTT. Sequence numbers start at `isn` and wrap,
+    # timestamps tick every `tsval_granularity` seconds, and the client
+    # capture clock runs `clock_offset` seconds ahead, which is the
+    # timestamp alignment estimate_timestamp_align should find. With
+    # idle_after, the server pauses for `idle` seconds after sending that
+    # many segments.
+    def __init__(self, packets=10000, rtt=0.04, loss=0.01, reorder=0.0, \
+            tsval_granularity=0.001, isn=0, clock_offset=3.5, \
+            interval=0.0005, mss=1448, seed=1, idle=0.0, idle_after=None):
+        self.packets = packets
+        self.rtt = rtt
+        self.loss = loss
+        self.reorder = reorder
+        self.tsval_granularity = tsval_granularity
+        self.isn = isn & 0xffffffff
+        self.clock_offset = clock_offset
+        self.interval = interval
+        self.mss = mss
+        self.seed = seed
+        self.idle = idle
+        self.idle_after = idle_after
+
+    def tsval(self, time, base):
+        return (int(time / self.tsval_granularity) + base) & 0xffffffff
+
+    def events(self):
+        # Yields (side, time, fields) in time order, side being 'c' or 's'
+        # for the client or server capture. Future events wait in a heap,
+        # which only ever holds about one RTT worth of packets.
+        rnd = random.Random(self.seed)
+        rtt = self.rtt
+        mask = 0xffffffff
+        pending = []
+        order = 0
+
+        def push(time, kind, *data):
+            nonlocal order
+            order += 1
+            heapq.heappush(pending, (time, order, kind, data))
+
+        client, server = CLIENT_ADDRESS, SERVER_ADDRESS
+        c_base, s_base = 5000, 1000
+        isn = self.isn
+        syn = (client, server, 0, 0, 0, self.tsval(0, c_base), 0, 1, 0)
+        yield 'c', 0.0, syn
+        yield 's', rtt / 2, syn
+        syn_ack = (server, client, isn, 1, 0, self.tsval(rtt / 2, s_base), \
+                self.tsval(0, c_base), 1, 1)
+        yield 's', rtt / 2, syn_ack
+        yield 'c', rtt, syn_ack
+
+        rcv_nxt = (isn + 1) & mask
+        received = set()
+        unacked = 0
+        # The newest tsval each side has received, echoed as its tsecr.
+        echo_c_tsval = self.tsval(0, c_base)
+        echo_s_tsval = self.tsval(rtt / 2, s_base)
+        seq = rcv_nxt
+        time = rtt + 0.01
+        sent = 0
+
+        while sent < self.packets or pending:
+            if sent < self.packets:
+                time += rnd.expovariate(1 / self.interval)
+                if sent == self.idle_after:
+                    time += self.idle
+                push(time, 'send', seq)
+                seq = (seq + self.mss) & mask
+                sent += 1
+                limit = time
+            else:
+                limit = float('inf')
+            while pending and pending[0][0] <= limit:
+                now, _, kind, data = heapq.heappop(pending)
+                if kind == 'send':
+                    seg, = data
+                    tsval = self.tsval(now, s_base)
+                    segment = (server, client, seg, 1, self.mss, tsval, \
+                            echo_c_tsval, 0, 1)
+                    yield 's', now, segment
+                    if rnd.random() < self.loss:
+                        push(now + rtt * 1.5, 'send', seg)
+                        continue
+                    arrive = now + rtt / 2 + rnd.random() * rtt / 20
+                    if rnd.random() < self.reorder:
+                        arrive += rnd.random() * rtt / 4
+                    push(arrive, 'arrive', segment)
+                elif kind == 'arrive':
+                    segment, = data
+                    yield 'c', now, segment
+                    seg = segment[2]
+                    echo_s_tsval = segment[5]
+                    received.add(seg)
+                    in_order = seg == rcv_nxt
+                    while rcv_nxt in received:
+                        received.discard(rcv_nxt)
+                        rcv_nxt = (rcv_nxt + self.mss) & mask
+                    unacked += 1
+                    if unacked >= 2 or not in_order or rnd.random() < 0.2:
+                        unacked = 0
+                        ack_time = now + 0.0001
+                        ack = (client, server, 1, rcv_nxt, 0, \
+                                self.tsval(ack_time, c_base), echo_s_tsval, \
+                                0, 1)
+                        push(ack_time, 'ack', 'c', ack)
+                        push(ack_time + rtt / 2, 'ack', 's', ack)
+                else:
+                    side, ack = data
+                    if side == 's':
+                        echo_c_tsval = ack[5]
+                    yield side, now, ack
+
+    def write(self, client_csv, server_csv):
+        # Streams both captures to CSV; returns the number of rows written
+        # to each.
+        counts = {'c': 0, 's': 0}
+        with open(client_csv, 'w', newline='') as client_file, \
+                open(server_csv, 'w', newline='') as server_file:
+            writers = {'c': csv.writer(client_file), \
+                    's': csv.writer(server_file)}
+            for writer in writers.values():
+                writer.writerow(SYNTH_TITLES)
+            for side, time, (src, dst, seq, ack, length, tsval, tsecr, \
+                    syn, has_ack) in self.events():
+                if side == 'c':
+                    time += self.clock_offset
+                counts[side] += 1
+                writers[side].writerow([counts[side], f'{time:.6f}', \
+                        src[0], dst[0], src[1], dst[1], seq, ack, length, \
+                        tsval, tsecr, syn, has_ack])
+        return counts['c'], counts['s']
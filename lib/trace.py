@@ -0,0 +1,162 @@
+import collections
+import os
+import numpy as np
+from lib.packets import *
+from lib.align import *
+from lib.processors import *
+from lib.instrument import *
+
+TRACE_DIR = '../result_bbr'
+
+SPAN_LEAD_IN = 1.0
+
+def trace_files(trace, trace_dir=TRACE_DIR, server_csv=None):
+    try:
+        trace_id = int(trace)
+    except ValueError:
+        return trace, server_csv
+    return os.path.join(trace_dir, f'{trace_id}c.csv'), \
+            os.path.join(trace_dir, f'{trace_id}s.csv')
+
+def file_ident(filename):
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+def parse_traces(specs):
+    # Trace IDs, inclusive ID ranges like 100-120, or capture paths.
+    traces = []
+    for spec in specs:
+        first, sep, last = spec.partition('-')
+        if sep and first.isdigit() and last.isdigit():
+            traces += [str(i) for i in range(int(first), int(last) + 1)]
+        else:
+            traces.append(spec)
+    return traces
+
+def output_stem(trace):
+    # Outputs and the stamp of a trace are named after it.
+    return os.path.splitext(os.path.basename(trace))[0]
+
+def shared_stems(traces):
+    # The stems of traces whose outputs would overwrite each other, like
+    # those of a/run.csv and b/run.csv.
+    stems = collections.Counter(output_stem(trace) for trace in traces)
+    return sorted(stem for stem, count in stems.items() if count > 1)
+
+def match_trace(client, server, timestamp_align=None):
+    # Merge and match one client/server pair of record tables. Returns the
+    # packets, the alignment interval if it was estimated, and the alignment.
+    interval = None
+    if len(server) and timestamp_align is None:
+        interval = estimate_timestamp_align(client, server)
+        timestamp_align = (interval[0] + interval[1]) / 2
+    timestamp_align = timestamp_align or 0
+
+    packets = get_packets(client, server, timestamp_align)
+    matcher = ClientServerMatcher()
+    with profile_stage('matcher', len(packets)):
+        matcher.process(packets)
+    if profiling():
+        _count_matches(packets)
+    count_history(matcher, 'matcher')
+    return packets, interval, timestamp_align
+
+def _count_matches(packets):
+    for name, kind in (('client_data', PACKET_CLIENT_DATA), \
+            ('server_ack', PACKET_SERVER_ACK)):
+        paired = packets.pair_pkt[packets.type == kind] >= 0
+        profile_count(f'matcher.{name}.paired', int(paired.sum()))
+        profile_count(f'matcher.{name}.unpaired', int(len(paired) - \
+                paired.sum()))
+    retrans = packets.retrans[packets.type == PACKET_SERVER_DATA] >= 0
+    profile_count('matcher.retransmissions', int(retrans.sum()))
+
+class TraceSpan:
+    # A part of a trace: seconds from the first client packet, as plotted,
+    # and/or client packet numbers (_ws.col.No.), both inclusive and open
+    # where None. The lead_in seconds before it are processed as well, only
+    # so that RTT, bandwidth and the like are right from the start.
+    def __init__(self, start=None, end=None, start_no=None, end_no=None, \
+            lead_in=SPAN_LEAD_IN):
+        self.start = start
+        self.end = end
+        self.start_no = start_no
+        self.end_no = end_no
+        self.lead_in = lead_in
+
+def _span_table(table, begin, end):
+    # Rows [begin, end) after the first row, which get_packets takes the
+    # endpoints and tsbase from. A handshake SYN never becomes a packet.
+    if begin == 0:
+        return table.select(slice(0, end))
+    return PacketTable({name: np.concatenate((col[:1], col[begin:end])) \
+            for name, col in table.columns.items()}, **table.meta)
+
+def select_span(client, server, span, timestamp_align=0, \
+        client_index=None, server_index=None):
+    # Cuts the span and its lead-in out of both record tables, reading only
+    # those rows and the table_index of each, which for cached, memory
+    # mapped tables makes this cost time in proportion to the span. Returns
+    # both parts and the (start, end) to show.
+    if client_index is None:
+        client_index = table_index(client)
+    tsbase = float(client.timestamp[0])
+    start, end = span.start, span.end
+    if span.start_no is not None or span.end_no is not None:
+        begin, stop = index_rows(client_index, len(client), 'no', \
+                -np.inf if span.start_no is None else span.start_no, \
+                np.inf if span.end_no is None else span.end_no)
+        no = client.no[begin:stop]
+        times = client.timestamp[begin:stop][ \
+                (span.start_no is None or no >= span.start_no) & \
+                (span.end_no is None or no <= span.end_no)]
+        if not len(times):
+            raise ValueError("No client packet has a number in the span.")
+        start = max(start if start is not None else -np.inf, \
+                float(times.min()) - tsbase)
+        end = min(end if end is not None else np.inf, \
+                float(times.max()) - tsbase)
+    low = -np.inf if start is None else tsbase + start - span.lead_in
+    high = np.inf if end is None else tsbase + end
+    client_part = _span_table(client, *index_rows(client_index, \
+            len(client), 'timestamp', low, high))
+    if not len(server):
+        return client_part, server, (start, end)
+    if server_index is None:
+        server_index = table_index(server)
+    server_part = _span_table(server, *index_rows(server_index, \
+            len(server), 'timestamp', low - timestamp_align, \
+            high - timestamp_align))
+    return client_part, server_part, (start, end)
+
+class Trace:
+    def __init__(self, client_csv, server_csv=None, timestamp_align=None, \
+            cache=None, jobs=1, span=None):
+        load_table = cache.read_table if cache is not None else read_table
+        self.client_csv = client_csv
+        self.server_csv = server_csv
+        self.client = load_table(client_csv, jobs)
+        self.server = load_table(server_csv, jobs) if server_csv else []
+        self.view = None, None
+
+        interval = None
+        if span is not None:
+            # Aligned as the whole trace would be; an estimate from the
+            # span alone could differ.
+            if len(self.server) and timestamp_align is None:
+                interval = cache.read_alignment(client_csv, server_csv, \
+                        self.client, self.server) if cache is not None \
+                        else estimate_timestamp_align(self.client, self.server)
+                timestamp_align = (interval[0] + interval[1]) / 2
+            read_index = cache.read_index if cache is not None \
+                    else lambda filename, table: table_index(table)
+            with profile_stage('span'):
+                self.client, self.server, self.view = select_span( \
+                        self.client, self.server, span, timestamp_align or 0, \
+                        read_index(client_csv, self.client), \
+                        read_index(server_csv, self.server) \
+                        if server_csv else None)
+        self.packets, self.interval, self.timestamp_align = match_trace( \
+                self.client, self.server, timestamp_align)
+        if interval is not None:
+            self.interval = interval
@@ -1,117 +1,245 @@
 import argparse
+import sys
+import numpy as np
 from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
 from lib.packets import *
+from lib.cache import *
 from lib.processors import *
+from lib.trace import *
+from lib.flows import *
+from lib.render import *
+from lib.follow import *
+from lib.instrument import *
 
 parser = argparse.ArgumentParser()
-parser.add_argument('client_csv')
-parser.add_argument('--plotter', '-p', choices=['rtt', 'bw', 'bif', 'win-bw'], required=True)
+parser.add_argument('client_csv', nargs='+',
+        help='capture or trace ID; several IDs, ID ranges (100-120) or '
+             'captures with --output-dir')
+parser.add_argument('--plotter', '-p', choices=list(PLOTTERS), nargs='+')
 parser.add_argument('--server-csv', '-s')
-parser.add_argument('--timestamp-align', '-t')
+parser.add_argument('--timestamp-align', '-t', type=float)
 parser.add_argument('--no-detail-box', action='store_true')
 parser.add_argument('--highlight-retransmission', action='store_true')
+parser.add_argument('--trace-dir', default=TRACE_DIR)
+parser.add_argument('--cache-dir')
+parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE >> 20,
+        help='cache size limit in MiB')
+parser.add_argument('--no-cache', action='store_true')
+parser.add_argument('--window', '-w', type=float, nargs='+', default=[0.25],
+        help='window sizes in seconds for win-bw; extra sizes are drawn as lines')
+parser.add_argument('--engine', choices=['array', 'reference'], default='array',
+        help='compute curves on whole arrays or packet by packet')
+parser.add_argument('--output-dir', '-o',
+        help='render to files in this directory instead of showing a window')
+parser.add_argument('--format', '-f', nargs='+', default=['png'],
+        choices=['png', 'svg', 'pdf'])
+parser.add_argument('--jobs', '-j', type=int,
+        help='number of worker processes for --output-dir, flows and '
+             'parsing large CSV exports; one per CPU by default')
+parser.add_argument('--force', action='store_true',
+        help='render even if the outputs are up to date')
+parser.add_argument('--flow', type=int,
+        help='analyze only this flow, numbered as in --list-flows')
+parser.add_argument('--top', type=int,
+        help='analyze the N flows carrying the most bytes')
+parser.add_argument('--list-flows', action='store_true',
+        help='print a summary of every flow and exit')
+parser.add_argument('--start', type=float,
+        help='only load the trace from this many seconds on')
+parser.add_argument('--end', type=float,
+        help='only load the trace up to this many seconds')
+parser.add_argument('--start-no', type=int,
+        help='only load the trace from this client packet number on')
+parser.add_argument('--end-no', type=int,
+        help='only load the trace up to this client packet number')
+parser.add_argument('--lead-in', type=float, default=SPAN_LEAD_IN,
+        help='seconds before --start/--start-no processed to warm up RTT, '
+             'bandwidth, ... (default %(default)s)')
+parser.add_argument('--no-lod', action='store_true',
+        help='draw every point instead of a per-pixel min/max subset')
+parser.add_argument('--follow', type=float, nargs='?', const=1.0,
+        metavar='SECONDS', help='keep reading the captures as they grow and '
+        'redraw at most every SECONDS (default 1)')
+parser.add_argument('--profile', action='store_true',
+        help='print wall and CPU time, memory and counters per stage')
+parser.add_argument('--profile-output',
+        help='also write the profile to this file; implies --profile')
+parser.add_argument('--profile-format', choices=['json', 'chrome'],
+        default='json', help='chrome writes a chrome://tracing trace')
+parser.add_argument('--profile-memory', action='store_true',
+        help='track peak Python allocations per stage with tracemalloc')
 args = parser.parse_args()
 
-try:
-    trace_id = int(args.client_csv)
-    args.client_csv = f'../result_bbr/{trace_id}c.csv'
-    args.server_csv = f'../result_bbr/{trace_id}s.csv'
-except ValueError:
-    pass
-
-plotter_dict = {'rtt'    : (ClientRttPlotter,   ServerRttPlotter,   ), \
-                'bw'     : (ClientBwPlotter,    ServerBwPlotter,    ), \
-                'bif'    : (ClientBifPlotter,   ServerBifPlotter,   ), \
-                'win-bw' : (ClientWinBwPlotter, ServerWinBwPlotter, ), }
-
-client_records, client_data_records, client_ack_records = read_records(args.client_csv)
-
-server_records = []
-if args.server_csv:
-    server_records, server_data_records, server_ack_records = read_records(args.server_csv)
-
-if args.server_csv and not args.timestamp_align:
-    timestamp_delta_min = float('-inf')
-    timestamp_delta_max = float('+inf')
-
-    j = 0
-    for pkt in server_ack_records:
-        while j > 0 and not packet_check_equal(client_ack_records[j], pkt) and \
-                int(pkt['tcp.options.timestamp.tsval']) <= int(client_ack_records[j]['tcp.options.timestamp.tsval']):
-            j -= 1
-        while j < len(client_ack_records) - 1 and not packet_check_equal(client_ack_records[j], pkt) and \
-                int(pkt['tcp.options.timestamp.tsval']) >= int(client_ack_records[j]['tcp.options.timestamp.tsval']):
-            j += 1
-        orig_pkt = client_ack_records[j]
-        if not packet_check_equal(orig_pkt, pkt):
-            continue
-
-        timestamp_delta_min = max(timestamp_delta_min, float(orig_pkt['timestamp']) - float(pkt['timestamp']))
-
-    j = 0
-    for pkt in client_data_records:
-        while j > 0 and not packet_check_equal(server_data_records[j], pkt) and \
-                int(pkt['tcp.options.timestamp.tsval']) <= int(server_data_records[j]['tcp.options.timestamp.tsval']):
-            j -= 1
-        while j < len(server_data_records) - 1 and not packet_check_equal(server_data_records[j], pkt) and \
-                int(pkt['tcp.options.timestamp.tsval']) >= int(server_data_records[j]['tcp.options.timestamp.tsval']):
-            j += 1
-        orig_pkt = server_data_records[j]
-        if not packet_check_equal(orig_pkt, pkt):
-            continue
-
-        timestamp_delta_max = min(timestamp_delta_max, float(pkt['timestamp']) - float(orig_pkt['timestamp']))
-
-    args.timestamp_align = (timestamp_delta_min + timestamp_delta_max) / 2
-    print(f'INFO: Select {args.timestamp_align} as timestamp_align ' +
-            f'from the interval [{timestamp_delta_min}, {timestamp_delta_max}]')
-elif args.timestamp_align:
-    args.timestamp_align = float(args.timestamp_align)
+if not args.plotter and not args.list_flows:
+    parser.error('the following arguments are required: --plotter/-p')
+if args.flow is not None and args.top is not None:
+    parser.error('--flow and --top cannot be used together')
+if min(args.window) <= 0:
+    parser.error('--window must be positive')
+if args.follow is not None and (args.output_dir or args.list_flows or
+        args.flow is not None or args.top is not None or
+        args.highlight_retransmission or len(args.window) > 1):
+    parser.error('--follow only works with a single window size, without '
+            '--output-dir, flows or --highlight-retransmission')
+span = None
+if (args.start, args.end, args.start_no, args.end_no) != (None, ) * 4:
+    if args.follow is not None or args.list_flows or args.flow is not None \
+            or args.top is not None:
+        parser.error('--start, --end, --start-no and --end-no cannot be '
+                'used with --follow or flows')
+    span = TraceSpan(args.start, args.end, args.start_no, args.end_no,
+            args.lead_in)
+
+if args.profile or args.profile_output or args.profile_memory:
+    enable_profiling(args.profile_memory)
+    # Stages in worker processes would be lost.
+    args.jobs = 1
+
+def report_profile():
+    if not profiling():
+        return
+    print(profiling_summary())
+    if args.profile_output:
+        write_profile(args.profile_output, args.profile_format)
+        print(f'INFO: Wrote the profile to {args.profile_output}')
+
+if args.output_dir and not args.list_flows:
+    try:
+        failed = render_batch(parse_traces(args.client_csv), args.plotter,
+                args.output_dir, jobs=args.jobs, formats=args.format,
+                trace_dir=args.trace_dir, server_csv=args.server_csv,
+                timestamp_align=args.timestamp_align, window=args.window,
+                engine=args.engine, cache_dir=args.cache_dir,
+                cache_size=args.cache_size << 20, no_cache=args.no_cache,
+                force=args.force, flow=args.flow, top=args.top, span=span)
+    except ValueError as e:
+        parser.error(str(e))
+    if failed:
+        print(f'ERROR: {len(failed)} trace(s) failed: {" ".join(failed)}')
+    report_profile()
+    sys.exit(1 if failed else 0)
+
+if len(args.client_csv) > 1:
+    parser.error('only one trace can be shown interactively')
+args.client_csv, = args.client_csv
+
+args.client_csv, args.server_csv = trace_files(args.client_csv,
+        args.trace_dir, args.server_csv)
+
+cache = None if args.no_cache else \
+        TraceCache(args.cache_dir, args.cache_size << 20)
+if args.follow is not None:
+    # Packet by packet plotters, which the follower feeds as the captures
+    # grow; the array engine would have to start over every time.
+    group = MultiProcessor()
+    follow_plotters = make_plotters(args.plotter, [], args.window,
+            'reference', group)
+    follower = Follower(args.client_csv, args.server_csv, group,
+            args.timestamp_align)
+    follower.poll()
+    count_history(follower, 'follow')
+    results = [FlowResult(None, None)]
+elif args.flow is None and args.top is None and not args.list_flows:
+    with profile_stage('trace'):
+        trace = Trace(args.client_csv, args.server_csv, args.timestamp_align,
+                cache, args.jobs, span)
+    results = [FlowResult(None, None, trace.packets, trace.interval,
+            trace.timestamp_align)]
 else:
-    args.timestamp_align = 0
-
-packets = get_packets(client_records, server_records, args.timestamp_align)
-ClientServerMatcher().process(packets)
-
-client_plotter, server_plotter = plotter_dict[args.plotter]
-client_plotter = client_plotter()
-server_plotter = server_plotter()
-client_plotter.process(packets)
-server_plotter.process(packets)
-
-fig, ax = plt.subplots()
-annot = ax.annotate("", xy=(0, 0),
-        bbox=dict(boxstyle="round", fc="w"), arrowprops=dict(arrowstyle="->"),
-        textcoords="offset points", xytext=(20, 20))
-annot.set_visible(False)
-
-sc_client, = client_plotter.plot()
-sc_server_data, sc_server_ack = server_plotter.plot()
-
-new_lines = []
-
-def draw_new_line(point1, point2, fmt='-.k', **kwargs):
-    global new_lines
-    x = [point1[0], point2[0]]
-    y = [point1[1], point2[1]]
-    new_lines += plt.plot(x, y, fmt, **kwargs)
+    load_table = cache.read_table if cache is not None else read_table
+    results, total = analyze_flows(load_table(args.client_csv, args.jobs),
+            load_table(args.server_csv, args.jobs) if args.server_csv
+            else None,
+            args.timestamp_align, args.flow, args.top, args.jobs)
+    for result in results:
+        if result.error is not None:
+            print(f'ERROR: flow {result.number} {result.name}: ' +
+                    result.error.splitlines()[-1])
+        else:
+            print(f'INFO: flow {result.number} {result.name}: ' +
+                    format_summary(result.summary))
+    print(f"INFO: {total['flows']} flows: {format_summary(total)}")
+    if args.list_flows:
+        report_profile()
+        sys.exit(0)
+    results = [result for result in results if result.error is None]
+    if not results:
+        sys.exit(1)
+
+if results[0].interval is not None:
+    timestamp_delta_min, timestamp_delta_max = results[0].interval
+    print(f'INFO: Select {results[0].timestamp_align} as timestamp_align ' +
+            f'from the interval [{timestamp_delta_min}, {timestamp_delta_max}]')
 
-def clean_new_lines():
-    global new_lines
-    for line in new_lines:
-        line.remove()
-    new_lines = []
+fig, axes = plt.subplots(len(args.plotter), len(results), sharex='col',
+        squeeze=False)
+
+class Panel:
+    def __init__(self, ax, name, result, client_plotter, server_plotter):
+        self.ax = ax
+        self.name = name
+        self.packets = result.packets
+        self.client_plotter = client_plotter
+        self.server_plotter = server_plotter
+        self.new_lines = []
+        # All click-path lines of the panel live in one collection.
+        self.lines = ax.add_collection(LineCollection([], colors='k',
+                linestyles='-.'), autolim=False)
+
+        self.annot = ax.annotate("", xy=(0, 0),
+                bbox=dict(boxstyle="round", fc="w"), arrowprops=dict(arrowstyle="->"),
+                textcoords="offset points", xytext=(20, 20))
+        self.annot.set_visible(False)
+
+        plt.sca(ax)
+        min_points = float('inf') if args.no_lod else LOD_MIN_POINTS
+        self.sc_client, = client_plotter.plot(True, min_points)
+        self.sc_server_data, self.sc_server_ack = \
+                server_plotter.plot(True, min_points)
+        if name == 'win-bw' and len(args.window) > 1:
+            plot_extra_windows(self.packets, args.window[1:])
+        if len(args.plotter) > 1:
+            ax.set_ylabel(name)
+        if result.number is not None and ax.get_subplotspec().is_first_row():
+            ax.set_title(f'flow {result.number} {result.name}')
+
+    def draw_new_line(self, point1, point2):
+        self.new_lines.append((point1, point2))
+        self.lines.set_segments(self.new_lines)
+
+    def clean_new_lines(self):
+        self.new_lines = []
+        self.lines.set_segments(self.new_lines)
+
+    def highlight_retransmission(self):
+        packets = self.packets
+        rows = np.flatnonzero((packets.type == PACKET_SERVER_DATA) &
+                (packets.retrans >= 0))
+        offsets = self.sc_server_data.get_offsets()
+        segments = np.stack((offsets[packets.curve_id[rows]],
+                offsets[packets.curve_id[packets.retrans[rows]]]), axis=1)
+        self.ax.add_collection(LineCollection(segments, colors='#808080',
+                alpha=0.3), autolim=False)
+
+panels = []
+for column, result in zip(axes.T, results):
+    if args.follow is not None:
+        plotters = follow_plotters
+    else:
+        plotters = make_plotters(args.plotter, result.packets, args.window,
+                args.engine)
+    with profile_stage('panels', len(result.packets or ())):
+        panels += [Panel(ax, name, result, *pair) for ax, name, pair in \
+                zip(column, args.plotter, plotters)]
+
+if span is not None:
+    # The lead-in stays out of view.
+    axes[0, 0].set_xlim(*trace.view)
 
 if args.highlight_retransmission and args.server_csv:
-    for pkt in packets:
-        if pkt.type != PACKET_SERVER_DATA:
-            continue
-        if pkt.retrans is None:
-            continue
-        offsets = sc_server_data.get_offsets()
-        draw_new_line(offsets[pkt.curve_id], \
-                offsets[pkt.retrans.curve_id], '#808080', alpha=0.3)
-    new_lines = []
+    for panel in panels:
+        panel.highlight_retransmission()
 
 class MouseEventHandler:
     def onpress(self, event):
@@ -121,36 +249,42 @@ class MouseEventHandler:
         self.moved = True
 
     def onrelease(self, event):
-        if self.moved or event.inaxes != ax:
+        panel = next((panel for panel in panels \
+                if event.inaxes == panel.ax), None)
+        if self.moved or panel is None:
             return
-        clean_new_lines()
+        for other in panels:
+            other.clean_new_lines()
+            if other is not panel:
+                other.annot.set_visible(False)
+        annot = panel.annot
 
-        ok, ind = sc_client.contains(event)
+        ok, ind = panel.sc_client.contains(event)
         if ok:
             ind = ind['ind'][0]
-            client_data_pkt = client_plotter.curve_packets[ind]
+            client_data_pkt = panel.client_plotter.curve_packets[ind]
             server_data_pkt = getattr(client_data_pkt, 'pair_pkt', None)
-            self.draw_information(client_data_pkt, server_data_pkt)
+            self.draw_information(panel, client_data_pkt, server_data_pkt)
 
-            annot.xy = sc_client.get_offsets()[ind]
+            annot.xy = panel.sc_client.get_offsets()[ind]
             annot.set_visible(not args.no_detail_box)
             return
 
-        ok, ind = sc_server_data.contains(event)
+        ok, ind = panel.sc_server_data.contains(event)
         if ok:
             ind = ind['ind'][0]
-            server_data_pkt = server_plotter.data_curve_packets[ind]
+            server_data_pkt = panel.server_plotter.data_curve_packets[ind]
             client_data_pkt = getattr(server_data_pkt, 'pair_pkt', None)
-            self.draw_information(client_data_pkt, server_data_pkt)
+            self.draw_information(panel, client_data_pkt, server_data_pkt)
 
-            annot.xy = sc_server_data.get_offsets()[ind]
+            annot.xy = panel.sc_server_data.get_offsets()[ind]
             annot.set_visible(not args.no_detail_box)
             return
 
         annot.set_visible(False)
         return
 
-    def draw_information(self, client_data_pkt, server_data_pkt):
+    def draw_information(self, panel, client_data_pkt, server_data_pkt):
         client_ack_pkt = getattr(client_data_pkt, 'ack_pkt', None)
         server_ack_pkt = getattr(client_ack_pkt, 'pair_pkt', None)
 
@@ -172,17 +306,70 @@ class MouseEventHandler:
             result_str += f"ACK: {client_ack_pkt.ack}\n"
 
         if client_data_pkt is not None and server_data_pkt is not None:
-            draw_new_line(sc_client.get_offsets()[client_data_pkt.curve_id], \
-                    sc_server_data.get_offsets()[server_data_pkt.curve_id])
+            panel.draw_new_line(panel.sc_client.get_offsets()[client_data_pkt.curve_id], \
+                    panel.sc_server_data.get_offsets()[server_data_pkt.curve_id])
         if client_data_pkt is not None and server_ack_pkt is not None:
-            draw_new_line(sc_client.get_offsets()[client_data_pkt.curve_id], \
-                    sc_server_ack.get_offsets()[server_ack_pkt.curve_id])
+            panel.draw_new_line(panel.sc_client.get_offsets()[client_data_pkt.curve_id], \
+                    panel.sc_server_ack.get_offsets()[server_ack_pkt.curve_id])
 
-        annot.set_text(result_str[:-1])
+        panel.annot.set_text(result_str[:-1])
 
 handler = MouseEventHandler()
 fig.canvas.mpl_connect("button_press_event", handler.onpress)
 fig.canvas.mpl_connect("motion_notify_event", handler.onmove)
 fig.canvas.mpl_connect("button_release_event", handler.onrelease)
 
+if args.follow is not None:
+    follow_state = dict(x_max=None, interval=None)
+
+    def follow_refresh():
+        packets = follower.poll()
+        if not follower.grown:
+            # Both captures are quiet; take the rows that still wait for
+            # the other side.
+            packets += follower.poll(flush=True)
+        if follower.interval is not follow_state['interval']:
+            follow_state['interval'] = follower.interval
+            print(f'INFO: Select {follower.timestamp_align} as ' +
+                    f'timestamp_align from the interval {follower.interval}')
+        if not packets:
+            return
+        curves = []
+        for panel in panels:
+            curves += extend_lod_curves(panel.client_plotter) + \
+                    extend_lod_curves(panel.server_plotter)
+        span = curves_span(curves)
+        if span is None:
+            # Only the handshake so far
+            return
+        x_min, x_max = span
+        # Keep following the newest packets unless the view was moved away
+        # from them; a zoomed view scrolls along at its width.
+        ax = panels[0].ax
+        left, right = ax.get_xlim()
+        if ax.get_autoscalex_on():
+            if x_max > x_min:
+                ax.set_xlim(x_min, x_max, auto=None)
+        elif follow_state['x_max'] is not None and \
+                right >= follow_state['x_max']:
+            ax.set_xlim(left + x_max - follow_state['x_max'],
+                    right + x_max - follow_state['x_max'], auto=None)
+        follow_state['x_max'] = x_max
+        for curve in curves:
+            curve.update()
+        # Only axes the user has not zoomed are autoscaled.
+        for panel in panels:
+            panel.ax.relim()
+            panel.ax.autoscale_view()
+        fig.canvas.draw_idle()
+
+    follow_timer = fig.canvas.new_timer(interval=int(args.follow * 1000))
+    follow_timer.add_callback(follow_refresh)
+    follow_timer.start()
+
+if profiling():
+    with profile_stage('draw'):
+        fig.canvas.draw()
+    report_profile()
+
 plt.show()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import sys
+from lib.trace import *
+from lib.chunked import *
+
+parser = argparse.ArgumentParser(
+        description='compute the metric series of captures too large to '
+                    'load, chunk by chunk, writing them to a directory')
+parser.add_argument('client_csv', help='capture or trace ID')
+parser.add_argument('--server-csv', '-s')
+parser.add_argument('--timestamp-align', '-t', type=float,
+        help='otherwise estimated from the first chunk')
+parser.add_argument('--trace-dir', default=TRACE_DIR)
+parser.add_argument('--output', '-o', required=True,
+        help='directory for the part files, meta.json and the checkpoint')
+parser.add_argument('--format', choices=EXPORT_FORMATS, default='npy',
+        help='arrow and parquet need pyarrow')
+parser.add_argument('--plotter', '-p', nargs='+', choices=METRICS,
+        default=list(METRICS))
+parser.add_argument('--window', '-w', type=float, default=0.25)
+parser.add_argument('--chunk-size', type=float, default=CHUNK_SIZE >> 20,
+        help='MiB read from a capture at a time')
+parser.add_argument('--horizon', type=float, default=CHUNK_HORIZON,
+        help='seconds of matcher and plotter state kept across chunks; '
+             'packets this much apart are never matched')
+parser.add_argument('--checkpoint',
+        help='default: checkpoint.pickle in the output directory')
+parser.add_argument('--checkpoint-interval', type=float,
+        default=CHECKPOINT_INTERVAL,
+        help='seconds between checkpoints; a resumed run redoes the chunks '
+             'since the last one')
+parser.add_argument('--resume', action='store_true',
+        help='continue from the checkpoint of an interrupted run')
+parser.add_argument('--quiet', '-q', action='store_true')
+args = parser.parse_args()
+
+if args.window <= 0:
+    parser.error('--window must be positive')
+try:
+    check_export_format(args.format)
+except RuntimeError as e:
+    parser.error(str(e))
+checkpoint = args.checkpoint or os.path.join(args.output, CHECKPOINT_NAME)
+
+if args.resume and os.path.exists(checkpoint):
+    run = load_checkpoint(checkpoint)
+    if run.done:
+        print(f'INFO: {args.output} is complete already')
+        sys.exit(0)
+    print(f'INFO: Resume at chunk {run.chunk} after {run.merger.count} '
+            'packets')
+else:
+    client_csv, server_csv = trace_files(args.client_csv, args.trace_dir,
+            args.server_csv)
+    run = ChunkedRun(client_csv, server_csv, args.output, args.plotter,
+            args.window, args.timestamp_align, args.format,
+            int(args.chunk_size * (1 << 20)), args.horizon)
+
+def progress(run, packets):
+    if args.quiet:
+        return
+    print(f'INFO: Chunk {run.chunk - 1}: {len(packets)} packets, '
+            f'{run.merger.count} in total, up to {run.time:.3f} s')
+
+run.run(checkpoint, progress, args.checkpoint_interval)
+if run.interval is not None:
+    print(f'INFO: Selected {run.timestamp_align} as timestamp_align from '
+            f'the interval {run.interval}')
+if not args.quiet:
+    for name, stats in run.history_stats().items():
+        print(f'INFO: History {name}: ' +
+                ', '.join(f'{key} {value}' for key, value in stats.items()))
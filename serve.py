@@ -0,0 +1,36 @@
+import argparse
+from lib.cache import *
+from lib.trace import *
+from lib.service import *
+
+parser = argparse.ArgumentParser(
+        description='serve metric series, images and statistics of traces '
+                    'over HTTP, keeping recently used traces processed')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8000)
+parser.add_argument('--trace-dir', default=TRACE_DIR)
+parser.add_argument('--memory', type=int,
+        default=DEFAULT_SERVICE_MEMORY >> 20,
+        help='MiB of processed traces to keep')
+parser.add_argument('--cache-dir')
+parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE >> 20,
+        help='cache size limit in MiB')
+parser.add_argument('--no-cache', action='store_true')
+parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='worker processes for parsing large CSV exports')
+parser.add_argument('--quiet', '-q', action='store_true',
+        help='do not log every request')
+args = parser.parse_args()
+
+cache = None if args.no_cache else \
+        TraceCache(args.cache_dir, args.cache_size << 20)
+store = TraceStore(args.memory << 20, cache, args.jobs)
+service = TraceService((args.host, args.port), store, args.trace_dir,
+        args.quiet)
+print(f'INFO: Serving on http://{args.host}:{service.server_port}/')
+try:
+    service.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    service.server_close()
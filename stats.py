@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import sys
+from lib.packets import *
+from lib.cache import *
+from lib.trace import *
+from lib.flows import *
+from lib.stats import *
+from lib.export import *
+
+parser = argparse.ArgumentParser(
+        description='print summary statistics of traces without plotting')
+parser.add_argument('client_csv', nargs='+',
+        help='capture or trace ID; several IDs, ID ranges (100-120) or '
+             'captures')
+parser.add_argument('--server-csv', '-s')
+parser.add_argument('--timestamp-align', '-t', type=float)
+parser.add_argument('--trace-dir', default=TRACE_DIR)
+parser.add_argument('--cache-dir')
+parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE >> 20,
+        help='cache size limit in MiB')
+parser.add_argument('--no-cache', action='store_true')
+parser.add_argument('--jobs', '-j', type=int,
+        help='worker processes for parsing large CSV exports; one per CPU '
+             'by default')
+parser.add_argument('--window', '-w', type=float, default=0.25,
+        help='window in seconds for the peak bandwidth')
+parser.add_argument('--flow', type=int,
+        help='only this flow, numbered as in plot.py --list-flows')
+parser.add_argument('--top', type=int,
+        help='the N flows carrying the most bytes, one line each')
+parser.add_argument('--json', action='store_true',
+        help='print one JSON object per trace or flow')
+parser.add_argument('--export',
+        help='also write the packets, match links and metric series of '
+             'each trace or flow to a directory in this one')
+parser.add_argument('--export-format', choices=EXPORT_FORMATS, default='npy',
+        help='arrow and parquet need pyarrow')
+parser.add_argument('--export-metrics', nargs='+', choices=METRICS,
+        default=list(METRICS))
+args = parser.parse_args()
+
+if args.flow is not None and args.top is not None:
+    parser.error('--flow and --top cannot be used together')
+if args.window <= 0:
+    parser.error('--window must be positive')
+if args.export:
+    try:
+        check_export_format(args.export_format)
+    except RuntimeError as e:
+        parser.error(str(e))
+    shared = shared_stems(parse_traces(args.client_csv))
+    if shared:
+        parser.error(f"several traces would be exported as "
+                f"{', '.join(shared)} in {args.export}")
+
+cache = None if args.no_cache else \
+        TraceCache(args.cache_dir, args.cache_size << 20)
+load_table = cache.read_table if cache is not None else read_table
+
+def trace_results(client_csv, server_csv):
+    if args.flow is None and args.top is None:
+        trace = Trace(client_csv, server_csv, args.timestamp_align, cache,
+                args.jobs)
+        return [FlowResult(None, None, trace.packets, trace.interval,
+                trace.timestamp_align)]
+    results, _ = analyze_flows(load_table(client_csv, args.jobs),
+            load_table(server_csv, args.jobs) if server_csv else None,
+            args.timestamp_align, args.flow, args.top)
+    return results
+
+failed = []
+for trace in parse_traces(args.client_csv):
+    client_csv, server_csv = trace_files(trace, args.trace_dir,
+            args.server_csv)
+    try:
+        results = trace_results(client_csv, server_csv)
+    except Exception as e:
+        print(f'ERROR: {trace}: {e}', file=sys.stderr)
+        failed.append(trace)
+        continue
+    for result in results:
+        name = trace if result.number is None else \
+                f'{trace} flow {result.number}'
+        if result.error is not None:
+            print(f'ERROR: {name}: {result.error.splitlines()[-1]}',
+                    file=sys.stderr)
+            failed.append(name)
+            continue
+        stats = trace_stats(result.packets, args.window)
+        stats['timestamp_align'] = result.timestamp_align
+        if args.export:
+            stem = output_stem(trace)
+            if result.number is not None:
+                stem += f'-flow{result.number}'
+            write_export(os.path.join(args.export, stem),
+                    export_tables(result.packets, args.export_metrics,
+                    args.window), args.export_format, trace=trace,
+                    client_csv=client_csv, server_csv=server_csv,
+                    flow=result.number, name=result.name,
+                    tsbase=result.packets.meta['tsbase'],
+                    interval=result.interval, window=args.window,
+                    stats=stats)
+        if args.json:
+            print(json.dumps(dict(trace=trace, flow=result.number,
+                    name=result.name, **stats)))
+        else:
+            print(f'{name}: {format_stats(stats)}')
+sys.exit(1 if failed else 0)
@@ -0,0 +1,46 @@
+import pytest
+from lib.align import *
+from lib.synth import SyntheticTrace
+from test_metrics import TRACES
+
+def scan_align(client_csv, server_csv):
+    # The record by record search plot.py used to do.
+    def split(filename):
+        records = list(read_records(filename))
+        return [(float(row['timestamp']), row) for row, kind in records \
+                if kind == RECORD_DATA], \
+                [(float(row['timestamp']), row) for row, kind in records \
+                if kind == RECORD_ACK]
+
+    def deltas(orig, query):
+        for query_time, query_row in query:
+            for orig_time, orig_row in orig:
+                if packet_check_equal(orig_row, query_row):
+                    yield orig_time, query_time
+                    break
+
+    client_data, client_ack = split(client_csv)
+    server_data, server_ack = split(server_csv)
+    delta_min = max(client - server for client, server \
+            in deltas(client_ack, server_ack))
+    delta_max = min(client - server for server, client \
+            in deltas(server_data, client_data))
+    return delta_min, delta_max
+
+@pytest.mark.parametrize('trace', ['lossy', 'coarse'])
+def test_align_matches_scan(tmp_path, trace):
+    client_csv, server_csv = str(tmp_path / 'c.csv'), str(tmp_path / 's.csv')
+    SyntheticTrace(packets=400, **TRACES[trace]).write(client_csv, server_csv)
+    interval = estimate_timestamp_align(read_table(client_csv), \
+            read_table(server_csv))
+    assert interval == pytest.approx(scan_align(client_csv, server_csv), \
+            abs=1e-9)
+    assert interval[0] <= 3.5 <= interval[1]
+
+def test_align_without_matches(tmp_path):
+    client_csv = str(tmp_path / 'c.csv')
+    SyntheticTrace(packets=50).write(client_csv, str(tmp_path / 's.csv'))
+    client = read_table(client_csv)
+    empty = client.select(slice(0, 0))
+    assert estimate_timestamp_align(client, empty) == \
+            (float('-inf'), float('inf'))
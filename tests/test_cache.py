@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pytest
+from lib.cache import *
+from lib.synth import SyntheticTrace
+
+@pytest.fixture
+def cached(tmp_path):
+    filename = str(tmp_path / 'c.csv')
+    SyntheticTrace(packets=200).write(filename, str(tmp_path / 's.csv'))
+    cache = TraceCache(str(tmp_path / 'cache'))
+    table = cache.read_table(filename)
+    meta = os.path.join(cache.entry_path(cache.key(filename)), 'meta.json')
+    return cache, filename, table, meta
+
+def test_load(cached):
+    cache, filename, table, _ = cached
+    loaded = cache.load(filename)
+    for name, col in table.columns.items():
+        np.testing.assert_array_equal(loaded.columns[name], col)
+
+@pytest.mark.parametrize('meta', ['{"colu', '{}', '[]', '{"columns": 1}', \
+        '{"columns": ["nothing"]}'])
+def test_broken_entry_is_a_miss(cached, meta):
+    cache, filename, table, meta_path = cached
+    with open(meta_path, 'w') as meta_file:
+        meta_file.write(meta)
+    assert cache.load(filename) is None
+    assert len(cache.read_table(filename)) == len(table)
+    assert cache.load(filename) is not None
+
+def test_read_only_entry(cached, monkeypatch):
+    cache, filename, _, _ = cached
+    def utime(*args):
+        raise PermissionError('read-only')
+    monkeypatch.setattr(os, 'utime', utime)
+    assert cache.load(filename) is not None
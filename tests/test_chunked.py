@@ -0,0 +1,61 @@
+import glob
+import os
+import numpy as np
+import pytest
+from lib.chunked import *
+from lib.synth import SyntheticTrace
+
+@pytest.fixture(scope='module')
+def trace(tmp_path_factory):
+    path = tmp_path_factory.mktemp('chunked')
+    client_csv, server_csv = str(path / 'c.csv'), str(path / 's.csv')
+    SyntheticTrace(packets=3000, loss=0.02, reorder=0.05).write(client_csv, \
+            server_csv)
+    return client_csv, server_csv
+
+def read_parts(output, name):
+    parts = sorted(glob.glob(os.path.join(output, name, 'part-*')))
+    return {column: np.concatenate([np.load(os.path.join(part, \
+            f'{column}.npy')) for part in parts]) \
+            for column in ('x', 'y', 'packet')}
+
+def assert_same_series(output, client_csv, server_csv):
+    with open(os.path.join(output, 'meta.json')) as meta_file:
+        meta = json.load(meta_file)
+    assert meta['complete']
+    packets = get_packets(read_table(client_csv), read_table(server_csv), \
+            meta['timestamp_align'])
+    ClientServerMatcher().process(packets)
+    for metric in METRICS:
+        for curve, expected in metric_tables(packets, metric).items():
+            parts = read_parts(output, f'{metric}-{curve}')
+            np.testing.assert_array_equal(parts['x'], expected['x'])
+            np.testing.assert_allclose(parts['y'], expected['y'], \
+                    rtol=1e-12, err_msg=f'{metric}-{curve}')
+            np.testing.assert_array_equal(parts['packet'], \
+                    expected['packet'])
+
+@pytest.mark.parametrize('chunk_size, horizon', [(16 << 10, CHUNK_HORIZON), \
+        (16 << 10, 0.5), (1 << 20, CHUNK_HORIZON)])
+def test_chunks_match_series(trace, tmp_path, chunk_size, horizon):
+    output = str(tmp_path / 'out')
+    run = ChunkedRun(*trace, output, chunk_size=chunk_size, horizon=horizon)
+    run.run()
+    if chunk_size < os.path.getsize(trace[0]):
+        assert run.chunk > 2
+    assert_same_series(output, *trace)
+
+def test_resume(trace, tmp_path):
+    output = str(tmp_path / 'out')
+    checkpoint = os.path.join(output, CHECKPOINT_NAME)
+    run = ChunkedRun(*trace, output, chunk_size=16 << 10)
+    os.makedirs(output)
+    for _ in range(3):
+        run.step()
+    run.save(checkpoint)
+    # Parts written after the checkpoint are written again on resume
+    run.step()
+    run = load_checkpoint(checkpoint)
+    assert run.chunk == 3
+    run.run(checkpoint)
+    assert_same_series(output, *trace)
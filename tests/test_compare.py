@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from lib.compare import *
+from lib.synth import SyntheticTrace
+
+@pytest.fixture(scope='module')
+def trace_dir(tmp_path_factory):
+    # The same flow captured with client clocks 3.5 s and 1000 s ahead.
+    path = tmp_path_factory.mktemp('traces')
+    for trace, offset in ((1, 3.5), (2, 1000.0)):
+        SyntheticTrace(packets=1000, clock_offset=offset).write( \
+                str(path / f'{trace}c.csv'), str(path / f'{trace}s.csv'))
+    return str(path)
+
+def test_capture_clock(trace_dir):
+    runs = load_runs(['1', '2'], 'rtt', 'client', jobs=1, \
+            trace_dir=trace_dir, no_cache=True)
+    assert [run.error for run in runs] == [None, None]
+    first, second = runs
+    assert 3.5 < first.x[0] < 4
+    assert 1000 < second.x[0] < 1000.5
+    np.testing.assert_allclose(second.x - first.x, 996.5)
+    np.testing.assert_allclose(first.y, second.y, atol=1e-9)
+
+def test_normalize(trace_dir):
+    first, second = load_runs(['1', '2'], 'rtt', 'client', jobs=1, \
+            trace_dir=trace_dir, normalize=True, no_cache=True)
+    assert 0 < first.x[0] < 0.5
+    np.testing.assert_allclose(first.x, second.x, atol=1e-6)
+    x, means = bin_runs([first, second])
+    assert x[0] < 0.5 and means.shape[0] == 2
@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+import pytest
+from lib.export import *
+from lib.trace import *
+from lib.synth import SyntheticTrace
+
+@pytest.fixture(scope='module')
+def packets(tmp_path_factory):
+    path = tmp_path_factory.mktemp('export')
+    client_csv, server_csv = str(path / 'c.csv'), str(path / 's.csv')
+    SyntheticTrace(packets=1000, loss=0.02).write(client_csv, server_csv)
+    packets, _, _ = match_trace(read_table(client_csv), \
+            read_table(server_csv))
+    return packets
+
+def read_export_table(path, name, fmt):
+    if fmt == 'npy':
+        return {column[:-4]: np.load(os.path.join(path, name, column)) \
+                for column in os.listdir(os.path.join(path, name))}
+    pa = pytest.importorskip('pyarrow')
+    filename = os.path.join(path, name + EXPORT_EXTENSIONS[fmt])
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        table = pa.parquet.read_table(filename)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(filename)).read_all()
+    return {column: table[column].to_numpy() for column in table.column_names}
+
+@pytest.mark.parametrize('fmt', EXPORT_FORMATS)
+def test_round_trip(packets, tmp_path, fmt):
+    if fmt != 'npy':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'run')
+    tables = export_tables(packets, ['rtt', 'bw'])
+    write_export(path, tables, fmt, trace='run', tsbase=1.5)
+    with open(os.path.join(path, 'meta.json')) as meta_file:
+        meta = json.load(meta_file)
+    assert meta['format'] == fmt and meta['tsbase'] == 1.5
+    assert meta['tables'] == list(tables) == ['packets'] + \
+            [f'{metric}-{curve}' for metric in ('rtt', 'bw') \
+            for curve in CURVES]
+    for name, columns in tables.items():
+        read = read_export_table(path, name, fmt)
+        assert sorted(read) == sorted(columns)
+        for column, values in columns.items():
+            assert read[column].dtype == np.asarray(values).dtype
+            np.testing.assert_array_equal(read[column], values, \
+                    err_msg=f'{name} {column}')
+
+def test_links_point_into_packets(packets, tmp_path):
+    path = str(tmp_path / 'run')
+    write_export(path, export_tables(packets, ['rtt']))
+    read = read_export_table(path, 'packets', 'npy')
+    for link in PACKET_LINKS:
+        np.testing.assert_array_equal(read[link], packets.columns[link])
+        assert read[link].min() >= -1 and read[link].max() < len(packets)
+    curve = read_export_table(path, 'rtt-client', 'npy')
+    np.testing.assert_array_equal(read['timestamp'][curve['packet']], \
+            curve['x'])
+
+def test_replaces_earlier_export(packets, tmp_path):
+    path = str(tmp_path / 'run')
+    write_export(path, export_tables(packets, ['rtt', 'bw']))
+    write_export(path, export_tables(packets, ['rtt']))
+    assert sorted(os.listdir(path)) == sorted(['meta.json', 'packets'] + \
+            [f'rtt-{curve}' for curve in CURVES])
+    assert os.listdir(tmp_path) == ['run']
+
+def test_shared_stems():
+    assert shared_stems(['a/run.csv', 'b/run.csv', 'x.pcap', '1']) == ['run']
+    assert shared_stems(['a/run.csv', 'a/run2.csv']) == []
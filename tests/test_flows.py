@@ -0,0 +1,39 @@
+import socket
+import struct
+from lib.flows import *
+from lib.pcap import *
+from test_pcap import CLIENT, SERVER, flow, frames
+
+def udp_frame(src, dst, sport, dport, length):
+    udp = struct.pack('>HHHH', sport, dport, 8 + length, 0) + bytes(length)
+    ip = struct.pack('>BBHHHBBH', 0x45, 0, 20 + len(udp), 0, 0x4000, 64, \
+            IPPROTO_UDP, 0) + socket.inet_aton(src) + socket.inet_aton(dst)
+    return bytes(12) + struct.pack('>H', ETHERTYPE_IPV4) + ip + udp
+
+def udp_flow(start, offset=0.0):
+    # A QUIC-like exchange next to the TCP flow of test_pcap.
+    client, server = ('10.0.0.1', 50000), ('10.0.0.3', 443)
+    result = []
+    for i in range(4):
+        time = start + i * 0.001 + offset
+        result.append((time, udp_frame(client[0], server[0], client[1], \
+                server[1], 1200)))
+        result.append((time + 0.0005, udp_frame(server[0], client[0], \
+                server[1], client[1], 100)))
+    return result
+
+def test_udp_flow(tmp_path):
+    rows = flow(CLIENT, SERVER)
+    captures = []
+    for side, offset in (('c', 0.0), ('s', 0.0005)):
+        tcp = [(time + offset, frame) for time, frame in frames(rows, CLIENT)]
+        capture = sorted(tcp + udp_flow(0.0025, offset), key=lambda f: f[0])
+        filename = str(tmp_path / f'{side}.pcap')
+        write_pcap(filename, capture)
+        captures.append(read_table(filename))
+    results, summary = analyze_flows(*captures, jobs=1)
+    assert [result.error for result in results] == [None, None]
+    assert [str(result.name).endswith(proto) for result, proto in \
+            zip(results, ('tcp', 'udp'))] == [True, True]
+    assert results[1].summary['packets'] > 0
+    assert summary['flows'] == 2
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from matplotlib import pyplot as plt
+from lib.follow import *
+from lib.render import *
+from lib.synth import SyntheticTrace
+
+def lines(filename):
+    with open(filename, 'r') as csv_file:
+        return csv_file.readlines()
+
+def append(filename, rows):
+    with open(filename, 'a') as csv_file:
+        csv_file.writelines(rows)
+
+def test_follow_from_header(tmp_path):
+    full = [str(tmp_path / 'full-c.csv'), str(tmp_path / 'full-s.csv')]
+    SyntheticTrace(packets=500).write(*full)
+    full = [lines(filename) for filename in full]
+    followed = [str(tmp_path / 'c.csv'), str(tmp_path / 's.csv')]
+    for filename, rows in zip(followed, full):
+        append(filename, rows[:1])
+
+    plt.switch_backend('agg')
+    group = MultiProcessor()
+    plotters = make_plotters(['rtt', 'bw'], [], engine='reference', \
+            group=group)
+    follower = Follower(*followed, group, timestamp_align=3.5)
+    curves = []
+    for client_plotter, server_plotter in plotters:
+        client_plotter.plot(True)
+        server_plotter.plot(True)
+    assert follower.poll(flush=True) == []
+
+    # The handshake and the client's ACK of it make packets, but no points
+    for filename, rows in zip(followed, full):
+        append(filename, rows[1:3])
+    append(followed[0], ['0,3.540100,10.0.0.1,10.0.0.2,40000,443,1,1,0,' \
+            '5040,1020,0,1\n'])
+    assert follower.poll(flush=True)
+    for client_plotter, server_plotter in plotters:
+        curves += extend_lod_curves(client_plotter) + \
+                extend_lod_curves(server_plotter)
+    assert [len(curve.x) for curve in curves] == [0] * 6
+    assert curves_span(curves) is None
+
+    for filename, rows in zip(followed, full):
+        append(filename, rows[3:])
+    assert follower.poll(flush=True)
+    for client_plotter, server_plotter in plotters:
+        extend_lod_curves(client_plotter)
+        extend_lod_curves(server_plotter)
+    x_min, x_max = curves_span(curves)
+    assert 0 <= x_min < x_max
+
+    packets = get_packets(read_table(followed[0]), read_table(followed[1]), \
+            3.5)
+    ClientServerMatcher().process(packets)
+    for name, (client_plotter, _) in zip(['rtt', 'bw'], plotters):
+        series = client_series(packets, name)
+        np.testing.assert_array_equal(client_plotter.curve_x, \
+                series['curve_x'])
+        np.testing.assert_array_equal(client_plotter.curve_y, \
+                series['curve_y'])
+
+@pytest.mark.parametrize('sides, parts', [(2, 1), (2, 7), (2, 40), (1, 7)])
+def test_merger_matches_get_packets(tmp_path, sides, parts):
+    filenames = [str(tmp_path / 'c.csv'), str(tmp_path / 's.csv')]
+    SyntheticTrace(packets=1000, loss=0.02, reorder=0.1).write(*filenames)
+    tables = [read_table(filename) for filename in filenames[:sides]]
+    expected = get_packets(tables[0], tables[1] if sides > 1 else [], 3.5)
+
+    # Both sides in uneven parts, merged after every part
+    rng = np.random.default_rng(parts)
+    bounds = [np.sort(rng.integers(0, len(table), parts - 1)) \
+            for table in tables]
+    merger = PacketMerger(sides)
+    packets = []
+    for part in range(parts):
+        for side, table in enumerate(tables):
+            begin = bounds[side][part - 1] if part else 0
+            end = bounds[side][part] if part < parts - 1 else len(table)
+            merger.add(side, table.select(slice(begin, end)))
+        packets += merger.merge(3.5, flush=part == parts - 1)
+    assert len(packets) == len(expected)
+    assert [pkt.idx for pkt in packets] == list(range(len(expected)))
+    for name, _ in PACKET_COLUMNS:
+        np.testing.assert_array_equal([getattr(pkt, name) \
+                for pkt in packets], expected.columns[name], err_msg=name)
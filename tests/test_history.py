@@ -0,0 +1,59 @@
+from lib.history import *
+
+class Value:
+    def __init__(self, time):
+        self.time = time
+
+def test_horizon():
+    store = HistoryStore(horizon=1.0)
+    for i in range(10):
+        store.put(i, Value(i * 0.25), i * 0.25)
+    # 4 was replaced 1.0 s before the newest one
+    assert list(store) == [4, 5, 6, 7, 8, 9]
+    assert store.stats()['evicted'] == 4
+
+def test_idle():
+    # The last entry before an idle period is what the peer still echoes.
+    store = HistoryStore(horizon=1.0)
+    store.put(1, Value(0.0), 0.0)
+    store.put(2, Value(0.5), 0.5)
+    store.put(3, Value(100.0), 100.0)
+    assert list(store) == [2, 3]
+    store.put(4, Value(100.5), 100.5)
+    store.put(5, Value(101.6), 101.6)
+    assert list(store) == [4, 5]
+
+def test_max_age_across_wrap():
+    # 1 ms tsvals from just before 2**32: all within the horizon, but the
+    # first ones are too far behind once the newest key has wrapped.
+    store = HistoryStore(HISTORY_HORIZON, max_age=1000)
+    start = (1 << 32) - 500
+    for i in range(0, 2000, 10):
+        key = (start + i) & 0xffffffff
+        store.put(key, Value(i / 1000), i / 1000)
+    newest = (start + 1990) & 0xffffffff
+    assert newest < start
+    assert start not in store and store.stats()['evicted'] > 0
+    assert all(minus(newest, key) <= 1000 for key in store)
+    assert (newest - 1000) & 0xffffffff in store
+
+def test_max_age_without_time():
+    # Keys far ahead evict at once, even if no time passed.
+    store = HistoryStore(HISTORY_HORIZON, HISTORY_MAX_AGE)
+    for i in range(6):
+        store.put((0xf0000000 + (i << 28)) & 0xffffffff, Value(0.0), 0.0)
+    assert len(store) == 5
+    assert 0xf0000000 not in store
+
+def test_max_age_ignores_older_keys():
+    # A key behind the newest one does not move it back, and goes once it
+    # is at the front.
+    store = HistoryStore(HISTORY_HORIZON, max_age=100)
+    store.put(1000, Value(0.0), 0.0)
+    store.put(1050, Value(0.1), 0.1)
+    store.put(900, Value(0.2), 0.2)
+    assert store.newest_key == 1050
+    store.put(1120, Value(0.3), 0.3)
+    assert list(store) == [1050, 900, 1120]
+    store.put(1200, Value(0.4), 0.4)
+    assert list(store) == [1120, 1200]
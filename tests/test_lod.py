@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from matplotlib import pyplot as plt
+from matplotlib.backend_bases import MouseEvent
+from lib.lod import *
+
+def points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Jittered, not quite sorted x as merged traces have it, and some NaN
+    x = np.cumsum(rng.exponential(1.0, n)) + rng.normal(0, 0.3, n)
+    y = rng.normal(0, 1, n).round(1)
+    y[rng.random(n) < 0.01] = np.nan
+    return x, y
+
+@pytest.fixture
+def ax():
+    plt.switch_backend('agg')
+    fig, ax = plt.subplots()
+    yield ax
+    plt.close(fig)
+
+def test_pyramid_blocks():
+    _, y = points(1000)
+    pyramid = LodPyramid(y)
+    low, high = np.where(np.isnan(y), np.inf, y), \
+            np.where(np.isnan(y), -np.inf, y)
+    for level in range(len(pyramid.mins)):
+        size = 1 << level
+        for block, (i, j) in enumerate(zip(pyramid.mins[level].values, \
+                pyramid.maxs[level].values)):
+            begin = block * size
+            assert i == begin + np.argmin(low[begin:begin + size])
+            assert j == begin + np.argmax(high[begin:begin + size])
+
+@pytest.mark.parametrize('parts', [2, 9, 100])
+def test_pyramid_extend(parts):
+    _, y = points(3001)
+    pyramid = LodPyramid(y[:0])
+    for part in np.array_split(y, parts):
+        pyramid.extend(part)
+    fresh = LodPyramid(y)
+    assert len(pyramid.mins) == len(fresh.mins)
+    for levels, fresh_levels in ((pyramid.mins, fresh.mins), \
+            (pyramid.maxs, fresh.maxs)):
+        for level, fresh_level in zip(levels, fresh_levels):
+            np.testing.assert_array_equal(level.values, fresh_level.values)
+
+def assert_envelope_kept(curve, xlim):
+    # The kept points reach the lowest and highest point of every pixel
+    # column; a pyramid block can straddle two columns, so the point that
+    # does may be in the next one.
+    x0, x1 = xlim
+    width = max(int(curve.ax.get_window_extent().width), 1)
+    shown = (curve.x >= x0) & (curve.x <= x1) & ~np.isnan(curve.y)
+    column = np.floor((curve.x - x0) / (x1 - x0) * width).astype('i8')
+    kept = np.zeros(len(curve.x), dtype=bool)
+    kept[curve.decimate(xlim)] = True
+    assert kept.sum() < shown.sum()
+    kept &= ~np.isnan(curve.y)
+    for c in np.unique(column[shown]):
+        in_column = shown & (column == c)
+        near = kept & (np.abs(column - c) <= 1)
+        assert curve.y[near].min() <= curve.y[in_column].min()
+        assert curve.y[near].max() >= curve.y[in_column].max()
+    assert curve.y[kept].min() == curve.y[shown].min()
+    assert curve.y[kept].max() == curve.y[shown].max()
+
+def test_decimate(ax):
+    x, y = points(50000)
+    curve = LodCurve(ax, x, y)
+    assert curve.pyramid is not None
+    for xlim in ((x.min(), x.max()), (1000.0, 30000.0)):
+        assert_envelope_kept(curve, xlim)
+    # Zoomed in far enough, every point is back
+    indices = curve.decimate((20000.0, 20500.0))
+    np.testing.assert_array_equal(indices, np.arange(indices[0], \
+            indices[-1] + 1))
+    assert indices[0] < np.argmax(curve.x_sorted >= 20000.0)
+
+def test_extend_matches_fresh(ax):
+    x, y = points(50000)
+    curve = LodCurve(ax, [], [])
+    for part_x, part_y in zip(np.array_split(x, 7), np.array_split(y, 7)):
+        curve.extend(part_x, part_y)
+    fresh = LodCurve(ax, x, y)
+    np.testing.assert_array_equal(curve.x_sorted, fresh.x_sorted)
+    for xlim in (None, (1000.0, 30000.0), (20000.0, 20500.0)):
+        np.testing.assert_array_equal(curve.decimate(xlim), \
+                fresh.decimate(xlim))
+
+def test_small_curve_not_decimated(ax):
+    x, y = points(100)
+    curve = LodCurve(ax, x, y)
+    assert curve.pyramid is None
+    np.testing.assert_array_equal(curve.decimate((x[10], x[20])), \
+            np.arange(100))
+
+def test_contains_nearest(ax):
+    x, y = points(50000)
+    curve = LodCurve(ax, x, y)
+    curve.scatter = ax.scatter(*curve.visible())
+    ax.set_xlim(20000.0, 21000.0)
+    ax.figure.canvas.draw()
+    drawn = ax.transData.transform(np.column_stack(curve.visible()))
+    rng = np.random.default_rng(1)
+    for point in drawn[rng.choice(len(drawn), 50)]:
+        if not np.isfinite(point).all():
+            continue
+        event = MouseEvent('button_release_event', ax.figure.canvas, \
+                *(point + rng.normal(0, 2, 2)))
+        dist = ((drawn - (event.x, event.y)) ** 2).sum(axis=1)
+        hit, info = curve.contains(event)
+        assert hit
+        # The nearest drawn point, by its index into the whole curve
+        assert info['ind'] == [curve.indices[np.nanargmin(dist)]]
+    event = MouseEvent('button_release_event', ax.figure.canvas, -100, -100)
+    assert curve.contains(event) == (False, dict(ind=[]))
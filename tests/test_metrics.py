@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from lib.packets import *
+from lib.processors import *
+from lib.synth import SyntheticTrace
+from lib.trace import *
+
+TRACES = {
+    'lossy': dict(loss=0.02, reorder=0.1, isn=(1 << 32) - (1 << 20)),
+    'clean': dict(loss=0.0, reorder=0.0, isn=(1 << 32) - 3000),
+    'coarse': dict(loss=0.05, reorder=0.2, isn=(1 << 32) - (1 << 21), \
+            tsval_granularity=0.01, seed=7),
+    # Longer than HISTORY_HORIZON
+    'idle': dict(loss=0.01, idle=200.0, idle_after=1500, \
+            isn=(1 << 32) - (1 << 21)),
+}
+
+@pytest.fixture(scope='module', params=list(TRACES))
+def packets(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp(request.param)
+    client_csv, server_csv = str(path / 'c.csv'), str(path / 's.csv')
+    SyntheticTrace(packets=3000, **TRACES[request.param]).write(client_csv, \
+            server_csv)
+    packets, _, _ = match_trace(read_table(client_csv), \
+            read_table(server_csv))
+    return packets
+
+def assert_same_curve(reference, array, curve):
+    np.testing.assert_array_equal(np.asarray(getattr(array, f'{curve}_x')), \
+            np.asarray(getattr(reference, f'{curve}_x')))
+    np.testing.assert_array_equal(np.asarray(getattr(array, f'{curve}_y')), \
+            np.asarray(getattr(reference, f'{curve}_y')))
+    assert [packet.idx for packet in getattr(array, f'{curve}_packets')] == \
+            [packet.idx for packet in getattr(reference, f'{curve}_packets')]
+
+@pytest.mark.parametrize('name', list(PLOTTERS))
+def test_process_table_matches_process(packets, name):
+    client_plotter, server_plotter = PLOTTERS[name]
+    args = dict(win=0.1) if name == 'win-bw' else {}
+
+    reference, array = client_plotter(**args), client_plotter(**args)
+    reference.process(packets)
+    array.process_table(packets)
+    assert len(reference.curve_x)
+    assert_same_curve(reference, array, 'curve')
+
+    reference = server_plotter(merged_plot=True, **args)
+    array = server_plotter(merged_plot=True, **args)
+    reference.process(packets)
+    array.process_table(packets)
+    assert len(reference.data_curve_x) and len(reference.ack_curve_x)
+    assert_same_curve(reference, array, 'data_curve')
+    assert_same_curve(reference, array, 'ack_curve')
+    np.testing.assert_array_equal(array.curve_x, reference.curve_x)
+    np.testing.assert_array_equal(array.curve_y, reference.curve_y)
+
+def test_packets_wrap(packets):
+    # The traces cross 2**32 in sequence space.
+    data = packets.seq[packets.type == PACKET_SERVER_DATA]
+    assert data.min() < 1 << 20 and data.max() > (1 << 32) - (1 << 20)
+
+@pytest.mark.parametrize('win', [0, -0.25, [0.25, 0]])
+def test_window_must_be_positive(win):
+    time = np.array([0.0, 0.1, 0.2])
+    with pytest.raises(ValueError):
+        window_sums(time, [1, 2, 3], win)
+    if np.ndim(win) == 0:
+        with pytest.raises(ValueError):
+            WindowMeasure(win)
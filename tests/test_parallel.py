@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import lib.packets
+from lib.packets import *
+from lib.synth import SyntheticTrace
+from test_pcap import CLIENT, SERVER, flow, write_csv
+
+def assert_same_table(table, expected):
+    assert len(table) == len(expected)
+    for name, _ in RECORD_COLUMNS:
+        np.testing.assert_array_equal(table.columns[name], \
+                expected.columns[name], err_msg=name)
+    for key in ('titles', 'addresses', 'has_syn', 'has_ack'):
+        assert table.meta[key] == expected.meta[key]
+
+@pytest.fixture(scope='module')
+def trace(tmp_path_factory):
+    path = tmp_path_factory.mktemp('parallel')
+    client_csv = str(path / 'c.csv')
+    SyntheticTrace(packets=2000, loss=0.02).write(client_csv, \
+            str(path / 's.csv'))
+    return client_csv
+
+@pytest.mark.parametrize('jobs', [1, 2, 3, 7])
+def test_parallel_matches_sequential(trace, jobs):
+    assert_same_table(read_csv_parallel(trace, jobs), read_table(trace))
+
+def test_more_jobs_than_rows(tmp_path):
+    filename = str(tmp_path / 'c.csv')
+    write_csv(filename, flow(CLIENT, SERVER))
+    assert_same_table(read_csv_parallel(filename, 50), read_table(filename))
+
+def test_header_only(tmp_path):
+    filename = str(tmp_path / 'c.csv')
+    write_csv(filename, [])
+    assert len(read_csv_parallel(filename, 2)) == 0
+
+def test_read_table_jobs(trace, monkeypatch):
+    monkeypatch.setattr(lib.packets, 'PARALLEL_CSV_SIZE', 0)
+    table = read_table(trace, 2)
+    assert_same_table(table, read_table(trace))
+    assert table.meta['source'] == trace
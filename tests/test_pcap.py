@@ -0,0 +1,169 @@
+import csv
+import struct
+import numpy as np
+import pytest
+from lib.packets import *
+from lib.pcap import *
+from lib.synth import SYNTH_TITLES
+
+CLIENT = ('10.0.0.1', 40000)
+SERVER = ('10.0.0.2', 443)
+CLIENT6 = ('2001:db8::1', 40000)
+SERVER6 = ('2001:db8::2', 443)
+ISN = (0xfffff000, 0x7ffffff0)
+
+def flow(client, server, handshake=True):
+    # (time, src, dst, seq, ack, len, tsval, tsecr, syn, ack) with relative
+    # sequence numbers, like a tshark export.
+    rows = []
+    if handshake:
+        rows.append((0.0, client, server, 0, 0, 0, 100, 0, 1, 0))
+        rows.append((0.001, server, client, 0, 1, 0, 500, 100, 1, 1))
+    rows.append((0.002, client, server, 1, 1, 0, 101, 500, 0, 1))
+    for i in range(6):
+        time = 0.003 + i * 0.001
+        rows.append((time, server, client, 1 + i * 1000, 1, 1000, 501 + i, \
+                101, 0, 1))
+        rows.append((time + 0.0005, client, server, 1, 1001 + i * 1000, 0, \
+                102 + i, 501 + i, 0, 1))
+    return rows
+
+def write_csv(filename, rows):
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(SYNTH_TITLES)
+        for no, (time, src, dst, seq, ack, length, tsval, tsecr, syn, \
+                has_ack) in enumerate(rows, 1):
+            writer.writerow([no, f'{time:.6f}', src[0], dst[0], src[1], \
+                    dst[1], seq, ack, length, tsval, tsecr, syn, has_ack])
+
+def frames(rows, client, timestamps=True):
+    # The rows as frames with absolute sequence numbers.
+    result = []
+    for time, src, dst, seq, ack, length, tsval, tsecr, syn, has_ack in rows:
+        isn, peer = ISN if src == client else ISN[::-1]
+        result.append((time, tcp_frame(src[0], dst[0], src[1], dst[1], \
+                seq + isn, ack + peer, length, \
+                tsval if timestamps else None, tsecr, bool(syn), \
+                bool(has_ack))))
+    return result
+
+def vlan(frame):
+    return frame[:12] + struct.pack('>HH', ETHERTYPE_VLAN[0], 5) + frame[12:]
+
+def write_pcapng(filename, frames, linktypes=(LINKTYPE_ETHERNET, )):
+    # frames are (interface, timestamp, link layer bytes); nanosecond
+    # timestamps on every interface.
+    def block(kind, body):
+        body += bytes(-len(body) % 4)
+        return struct.pack('<II', kind, len(body) + 12) + body + \
+                struct.pack('<I', len(body) + 12)
+
+    with open(filename, 'wb') as capture:
+        capture.write(block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, \
+                1, 0, -1)))
+        for linktype in linktypes:
+            capture.write(block(1, struct.pack('<HHI', linktype, 0, \
+                    0xffff) + struct.pack('<HHB', 9, 1, 9) + bytes(3) + \
+                    bytes(4)))
+        for interface, timestamp, frame in frames:
+            nsec = round(timestamp * 1e9)
+            capture.write(block(6, struct.pack('<IIIII', interface, \
+                    nsec >> 32, nsec & 0xffffffff, len(frame), \
+                    len(frame)) + frame))
+
+def assert_same_table(pcap, csv_table, skip=()):
+    assert len(pcap) == len(csv_table)
+    for name, _ in RECORD_COLUMNS:
+        if name in skip:
+            continue
+        np.testing.assert_array_equal(pcap.columns[name], \
+                csv_table.columns[name], err_msg=name)
+    assert pcap.meta['addresses'] == csv_table.meta['addresses']
+    assert pcap.meta['has_syn'] == pcap.meta['has_ack']
+
+@pytest.mark.parametrize('client, server', [(CLIENT, SERVER), \
+        (CLIENT6, SERVER6)])
+def test_pcap_matches_csv(tmp_path, client, server):
+    rows = flow(client, server)
+    write_csv(tmp_path / 'c.csv', rows)
+    write_pcap(tmp_path / 'c.pcap', frames(rows, client))
+    pcap = read_table(str(tmp_path / 'c.pcap'))
+    assert_same_table(pcap, read_table(str(tmp_path / 'c.csv')))
+    assert pcap.meta['has_syn']
+    assert pcap.tsval[-1] == rows[-1][6]
+
+def test_pcapng_matches_csv(tmp_path):
+    rows = flow(CLIENT, SERVER)
+    write_csv(tmp_path / 'c.csv', rows)
+    write_pcapng(tmp_path / 'c.pcapng', [(0, time, frame) \
+            for time, frame in frames(rows, CLIENT)])
+    assert_same_table(read_table(str(tmp_path / 'c.pcapng')), \
+            read_table(str(tmp_path / 'c.csv')))
+
+def test_vlan(tmp_path):
+    rows = flow(CLIENT, SERVER)
+    write_csv(tmp_path / 'c.csv', rows)
+    write_pcap(tmp_path / 'c.pcap', [(time, vlan(frame)) \
+            for time, frame in frames(rows, CLIENT)])
+    assert_same_table(read_table(str(tmp_path / 'c.pcap')), \
+            read_table(str(tmp_path / 'c.csv')))
+
+def test_no_timestamp_option(tmp_path):
+    rows = flow(CLIENT, SERVER)
+    write_pcap(tmp_path / 'c.pcap', frames(rows, CLIENT, timestamps=False))
+    table = read_table(str(tmp_path / 'c.pcap'))
+    assert not table.tsval.any() and not table.tsecr.any()
+    np.testing.assert_array_equal(table.len, [row[5] for row in rows])
+
+def test_zero_total_length(tmp_path):
+    # As TSO/GRO captures have it
+    rows = flow(CLIENT, SERVER)
+    zeroed = [(time, frame[:16] + bytes(2) + frame[18:]) \
+            for time, frame in frames(rows, CLIENT)]
+    write_pcap(tmp_path / 'c.pcap', zeroed)
+    table = read_table(str(tmp_path / 'c.pcap'))
+    np.testing.assert_array_equal(table.len, [row[5] for row in rows])
+
+def test_unknown_linktype_skipped(tmp_path, capsys):
+    rows = flow(CLIENT, SERVER)
+    write_pcap(tmp_path / 'u.pcap', frames(rows, CLIENT), linktype=147)
+    assert len(read_table(str(tmp_path / 'u.pcap'))) == 0
+    assert 'link type 147' in capsys.readouterr().out
+
+    write_csv(tmp_path / 'c.csv', rows)
+    mixed = []
+    for time, frame in frames(rows, CLIENT):
+        mixed.append((1, time, frame))
+        mixed.append((0, time, frame))
+    write_pcapng(tmp_path / 'm.pcapng', mixed, (147, LINKTYPE_ETHERNET))
+    table = read_table(str(tmp_path / 'm.pcapng'))
+    # Frame numbers count the skipped frames too
+    assert_same_table(table, read_table(str(tmp_path / 'c.csv')), ('no', ))
+    np.testing.assert_array_equal(table.no, np.arange(len(table)) * 2 + 1)
+
+def test_mid_connection(tmp_path):
+    rows = flow(CLIENT, SERVER, handshake=False)
+    write_pcap(tmp_path / 'c.pcap', frames(rows, CLIENT))
+    write_pcap(tmp_path / 's.pcap', frames(rows, CLIENT))
+    client = read_table(str(tmp_path / 'c.pcap'))
+    assert not client.meta['has_syn'] and not client.meta['has_ack']
+    packets = get_packets(client, read_table(str(tmp_path / 's.pcap')), 0.0)
+    assert len(packets)
+
+def test_csv_without_syn(tmp_path):
+    filename = str(tmp_path / 'c.csv')
+    write_csv(filename, flow(CLIENT, SERVER, handshake=False))
+    table = read_table(filename)
+    with pytest.raises(ValueError, match='does not start with a SYN'):
+        get_packets(table, table, 0.0)
+
+def test_read_records(tmp_path):
+    filename = str(tmp_path / 'c.csv')
+    write_csv(filename, flow(CLIENT, SERVER))
+    records = read_records(filename)
+    # Rows are read as they are asked for
+    assert iter(records) is records
+    kinds = [kind for _, kind in records]
+    assert [kinds.count(kind) for kind in (RECORD_ACK, RECORD_DATA, None)] \
+            == [8, 6, 1]
@@ -0,0 +1,52 @@
+import random
+import pytest
+from lib.int32 import *
+from lib.packets import *
+from lib.processors import *
+
+def segment(seq, length):
+    packet = Packet()
+    packet.seq = seq & 0xffffffff
+    packet.len = length
+    packet.end_seq = (seq + length) & 0xffffffff
+    return packet
+
+def first_covering(packets, seq):
+    # The lookup of the matcher before the buckets were indexed.
+    for pkt in packets:
+        if not after(pkt.seq, seq) and after(pkt.end_seq, seq):
+            return pkt
+    return None
+
+def test_first_sent_wins():
+    a, b = segment(0, 2000), segment(1000, 500)
+    bucket = SeqBucket(a.seq)
+    bucket.add(a)
+    bucket.add(b)
+    assert bucket.find(1200) is a
+    assert bucket.find(1000) is a
+    assert bucket.find(2000) is None
+
+@pytest.mark.parametrize('base', [0, (1 << 32) - 5000])
+@pytest.mark.parametrize('overlap', [0.0, 0.1])
+def test_find_matches_scan(base, overlap):
+    rnd = random.Random(1)
+    for _ in range(200):
+        packets = []
+        seq = base
+        for _ in range(rnd.randint(1, 20)):
+            if rnd.random() < overlap:
+                start = seq - rnd.randint(1, 3000)
+            else:
+                start = seq + rnd.choice((0, 0, 0, 1448))
+            packets.append(segment(start, rnd.choice((1, 500, 1448))))
+            seq = max(seq, start + packets[-1].len)
+        if rnd.random() < 0.2:
+            rnd.shuffle(packets)
+        bucket = SeqBucket(packets[0].seq)
+        for packet in packets:
+            bucket.add(packet)
+        assert overlap or not bucket.overlapping
+        for offset in range(-100, seq - base + 100, 37):
+            query = (base + offset) & 0xffffffff
+            assert bucket.find(query) is first_covering(packets, query)
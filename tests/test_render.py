@@ -0,0 +1,30 @@
+import os
+import pytest
+from lib.render import *
+from lib.synth import SyntheticTrace
+
+def test_shared_stems_rejected(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    for traces in (['a/run.csv', 'b/run.csv'], ['x.pcap', 'x.csv'], \
+            ['1', '1']):
+        with pytest.raises(ValueError, match='rendered as'):
+            render_batch(traces, ['rtt'], output_dir, jobs=1)
+    assert not os.path.exists(output_dir)
+
+@pytest.mark.parametrize('engine', ['array', 'reference'])
+def test_history_counters(tmp_path, engine):
+    client_csv, server_csv = str(tmp_path / 'c.csv'), str(tmp_path / 's.csv')
+    SyntheticTrace(packets=500, loss=0.02).write(client_csv, server_csv)
+    profiler = enable_profiling()
+    try:
+        packets, _, _ = match_trace(read_table(client_csv), \
+                read_table(server_csv))
+        make_plotters(['rtt', 'bw'], packets, engine=engine)
+    finally:
+        disable_profiling()
+    assert 'history.matcher.seq.misses' in profiler.counters
+    if engine == 'array':
+        assert profiler.counters['history.lookups']
+    else:
+        assert 'history.plotters.client.misses' in profiler.counters
+        assert 'history.plotters.server.evicted' in profiler.counters
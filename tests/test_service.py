@@ -0,0 +1,75 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+from lib.service import *
+from lib.synth import SyntheticTrace
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    path = tmp_path_factory.mktemp('traces')
+    SyntheticTrace(packets=3000).write(str(path / '1c.csv'), \
+            str(path / '1s.csv'))
+    server = TraceService(('127.0.0.1', 0), TraceStore(), str(path), \
+            quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def service(server):
+    # Every test starts with nothing loaded.
+    server.store = TraceStore()
+    return server
+
+def get(service, path):
+    url = f'http://127.0.0.1:{service.server_port}{path}'
+    try:
+        with urlopen(url) as response:
+            return response.status, json.load(response)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+def test_series_and_stats(service):
+    status, series = get(service, '/series/rtt?trace=1')
+    assert status == 200
+    assert series['metric'] == 'rtt'
+    assert len(series['client']['x']) == len(series['client']['y']) > 0
+    status, stats = get(service, '/stats?trace=1&window=0.5')
+    assert status == 200
+    assert stats['timestamp_align'] == series['timestamp_align']
+    assert get(service, '/traces')[1]['hits'] == 1
+
+@pytest.mark.parametrize('path, status', [
+    ('/nothing', 404),
+    ('/series/nothing?trace=1', 404),
+    ('/series/rtt?trace=2', 404),
+    ('/series/rtt?trace=1&curve=nothing', 404),
+    ('/plot/rtt.gif?trace=1', 404),
+    ('/series/rtt', 400),
+    ('/series/rtt?trace=1&format=xml', 400),
+    ('/series/win-bw?trace=1&window=0', 400),
+    ('/series/win-bw?trace=1&window=-1', 400),
+    ('/stats?trace=1&window=0', 400),
+    ('/stats?trace=1&window=x', 400),
+    ('/plot/win-bw.png?trace=1&window=0', 400),
+])
+def test_errors(service, path, status):
+    code, body = get(service, path)
+    assert code == status
+    assert body['error']
+
+def test_coalescing(service):
+    # Requests for a trace that is being loaded wait for that load.
+    requests = 8
+    with ThreadPoolExecutor(requests) as executor:
+        results = list(executor.map(lambda _: get(service, \
+                '/series/bw?trace=1'), range(requests)))
+    assert all(status == 200 for status, _ in results)
+    summary = service.store.summary()
+    assert summary['misses'] == 1
+    assert summary['hits'] + summary['coalesced'] == requests - 1
+    assert len(summary['traces']) == 1
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from lib.cache import *
+from lib.trace import *
+from lib.synth import SyntheticTrace
+
+@pytest.fixture(scope='module')
+def trace(tmp_path_factory):
+    path = tmp_path_factory.mktemp('span')
+    client_csv, server_csv = str(path / 'c.csv'), str(path / 's.csv')
+    SyntheticTrace(packets=6000, loss=0.02, reorder=0.05).write(client_csv, \
+            server_csv)
+    return client_csv, server_csv, Trace(client_csv, server_csv)
+
+def assert_same_in_view(full, part, view):
+    start, end = view
+    for name in PLOTTERS:
+        for side, series in (('client', client_series), \
+                ('server', server_series)):
+            expected, actual = series(full.packets, name), \
+                    series(part.packets, name)
+            for curve in ('curve', 'data_curve', 'ack_curve'):
+                if f'{curve}_x' not in expected:
+                    continue
+                x, y = expected[f'{curve}_x'], expected[f'{curve}_y']
+                shown = (x >= start) & (x <= end)
+                part_x, part_y = actual[f'{curve}_x'], actual[f'{curve}_y']
+                part_shown = (part_x >= start) & (part_x <= end)
+                assert shown.any(), (name, side, curve)
+                np.testing.assert_array_equal(part_x[part_shown], x[shown])
+                np.testing.assert_allclose(part_y[part_shown], y[shown], \
+                        atol=1e-9, err_msg=f'{name} {side} {curve}')
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_time_span(trace, tmp_path, cached):
+    client_csv, server_csv, full = trace
+    cache = TraceCache(str(tmp_path / 'cache')) if cached else None
+    part = Trace(client_csv, server_csv, cache=cache, \
+            span=TraceSpan(2.0, 2.5))
+    assert part.view == (2.0, 2.5)
+    assert part.timestamp_align == full.timestamp_align
+    assert len(part.packets) < len(full.packets)
+    assert_same_in_view(full, part, part.view)
+
+def test_number_span(trace):
+    client_csv, server_csv, full = trace
+    part = Trace(client_csv, server_csv, span=TraceSpan(start_no=4000, \
+            end_no=6000))
+    start, end = part.view
+    times = full.client.timestamp[(full.client.no >= 4000) & \
+            (full.client.no <= 6000)] - full.client.timestamp[0]
+    assert (start, end) == (times.min(), times.max())
+    assert_same_in_view(full, part, part.view)
+
+def test_empty_number_span(trace):
+    client_csv, server_csv, _ = trace
+    with pytest.raises(ValueError, match='No client packet'):
+        Trace(client_csv, server_csv, span=TraceSpan(start_no=10 ** 6))